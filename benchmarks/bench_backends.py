@@ -0,0 +1,225 @@
+"""
+Сравнение CPU-бэкендов инференса (torch fp32, int8, onnx) для локальной
+языковой модели и модели эмбеддингов: время загрузки, прирост памяти,
+задержка, пропускная способность и качество относительно fp32.
+
+Каждый бэкенд загружается в отдельном процессе, чтобы память одного
+не влияла на замер другого. Качество:
+  * LLM - доля ответов, совпадающих с fp32 (жадная генерация), и средняя
+    посимвольная похожесть ответов;
+  * эмбеддинги - средний косинус с векторами fp32 и совпадение top-5
+    соседей при поиске по корпусу.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_backends --llm-size small --prompts 16
+    python -m benchmarks.bench_backends --only embeddings --sentences 2000
+"""
+import argparse
+import difflib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+BACKENDS = ('torch', 'int8', 'onnx')
+
+TOPICS = [
+    "Фотосинтез превращает энергию света в химическую энергию глюкозы.",
+    "Python был создан Гвидо ван Россумом и впервые выпущен в 1991 году.",
+    "Столица Франции - Париж, город на реке Сена.",
+    "Вода кипит при температуре 100 градусов Цельсия на уровне моря.",
+    "Векторный поиск находит ближайшие эмбеддинги по косинусной близости.",
+    "Луна обращается вокруг Земли примерно за 27 дней.",
+    "SQLite хранит всю базу данных в одном файле на диске.",
+    "Трансформеры используют механизм внимания для обработки последовательностей.",
+]
+QUESTIONS = [
+    "Что превращает фотосинтез?", "Кто создал Python?", "Какая столица Франции?",
+    "При какой температуре кипит вода?", "Как работает векторный поиск?",
+    "За сколько дней Луна обращается вокруг Земли?", "Где SQLite хранит базу?",
+    "Что используют трансформеры?",
+]
+
+
+def make_prompts(count: int):
+    return [
+        (QUESTIONS[i % len(QUESTIONS)], TOPICS[i % len(TOPICS)] + " " + TOPICS[(i + 3) % len(TOPICS)])
+        for i in range(count)
+    ]
+
+
+def make_sentences(count: int):
+    rng = np.random.default_rng(0)
+    words = " ".join(TOPICS).split()
+    return [" ".join(rng.choice(words, size=rng.integers(8, 40))) for _ in range(count)]
+
+
+def worker_llm(size: str, backend: str, count: int, max_new_tokens: int) -> dict:
+    from bot.model_registry import resident_memory
+    from llm import LLM
+
+    memory_before = resident_memory()
+    start = time.perf_counter()
+    llm = LLM(model_size=size, backend=backend)
+    load_seconds = time.perf_counter() - start
+    memory = resident_memory() - memory_before if memory_before is not None else None
+
+    outputs, latencies, new_tokens = [], [], 0
+    for prompt, context in make_prompts(count):
+        # Жадная генерация детерминирована, поэтому ответы бэкендов можно сравнивать
+        kwargs = llm._local_generate_kwargs([prompt], [context], 'greedy')
+        kwargs['max_new_tokens'] = max_new_tokens
+        start = time.perf_counter()
+        generated = llm.model.generate(**kwargs)
+        latencies.append(time.perf_counter() - start)
+        new_tokens += generated.shape[1] - 1  # без стартового токена декодера
+        outputs.append(llm.tokenizer.decode(generated[0], skip_special_tokens=True))
+
+    return {
+        'load_seconds': load_seconds,
+        'memory': memory,
+        'latencies': latencies,
+        'tokens_per_second': new_tokens / sum(latencies),
+        'outputs': outputs,
+    }
+
+
+def worker_embeddings(backend: str, count: int, output: str) -> dict:
+    from bot.model_registry import resident_memory
+    from config import EMBEDDING_CONFIG
+    from inference_backends import load_sentence_encoder
+
+    sentences = make_sentences(count)
+    memory_before = resident_memory()
+    start = time.perf_counter()
+    model = load_sentence_encoder(EMBEDDING_CONFIG['model_name'], backend)
+    load_seconds = time.perf_counter() - start
+    memory = resident_memory() - memory_before if memory_before is not None else None
+
+    latencies = []
+    for sentence in sentences[:50]:
+        start = time.perf_counter()
+        model.encode([sentence])
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    embeddings = np.asarray(model.encode(sentences, batch_size=32), dtype='float32')
+    batch_seconds = time.perf_counter() - start
+    np.save(output, embeddings)
+
+    return {
+        'load_seconds': load_seconds,
+        'memory': memory,
+        'latencies': latencies,
+        'sentences_per_second': len(sentences) / batch_seconds,
+    }
+
+
+def run_worker(*args: str) -> dict:
+    # Пустой ключ OpenAI заставляет LLM использовать локальную модель
+    result = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_backends', '--worker', *args],
+        capture_output=True, text=True, env=dict(os.environ, OPENAI_API_KEY='')
+    )
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        return {'error': (result.stderr.strip().splitlines() or ['неизвестная ошибка'])[-1]}
+    return json.loads(lines[-1])
+
+
+def format_memory(memory) -> str:
+    return f"{memory / 2 ** 20:.0f}" if memory is not None else "н/д"
+
+
+def bench_llm(args):
+    print(f"LLM ({args.llm_size}), {args.prompts} запросов, до {args.max_new_tokens} токенов")
+    print(f"{'backend':>8} {'load s':>7} {'mem MB':>7} {'p50 ms':>8} {'p99 ms':>8} {'tok/s':>7} {'exact':>6} {'sim':>6}")
+    reference = None
+    for backend in args.backends:
+        result = run_worker('llm', args.llm_size, backend, str(args.prompts), str(args.max_new_tokens))
+        if 'error' in result:
+            print(f"{backend:>8}  {result['error']}")
+            continue
+        if backend == 'torch':
+            reference = result['outputs']
+
+        exact = similarity = float('nan')
+        if reference is not None:
+            pairs = list(zip(result['outputs'], reference))
+            exact = sum(a == b for a, b in pairs) / len(pairs)
+            similarity = float(np.mean([difflib.SequenceMatcher(None, a, b).ratio() for a, b in pairs]))
+        latencies = np.array(result['latencies']) * 1000
+        print(
+            f"{backend:>8} {result['load_seconds']:>7.1f} {format_memory(result['memory']):>7} "
+            f"{np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 99):>8.1f} "
+            f"{result['tokens_per_second']:>7.1f} {exact:>6.2f} {similarity:>6.2f}"
+        )
+
+
+def bench_embeddings(args, workdir: str):
+    print(f"\nЭмбеддинги, {args.sentences} предложений")
+    print(f"{'backend':>8} {'load s':>7} {'mem MB':>7} {'p50 ms':>8} {'sent/s':>8} {'cosine':>7} {'top5':>6}")
+    reference = None
+    for backend in args.backends:
+        output = os.path.join(workdir, f"{backend}.npy")
+        result = run_worker('embeddings', backend, str(args.sentences), output)
+        if 'error' in result:
+            print(f"{backend:>8}  {result['error']}")
+            continue
+
+        embeddings = np.load(output)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        if backend == 'torch':
+            reference = embeddings
+
+        cosine = overlap = float('nan')
+        if reference is not None:
+            cosine = float(np.mean(np.sum(embeddings * reference, axis=1)))
+            # Соседи первых 100 предложений по корпусу в сравнении с fp32
+            queries = slice(0, min(100, len(embeddings)))
+            found = np.argsort(-(embeddings[queries] @ embeddings.T), axis=1)[:, 1:6]
+            truth = np.argsort(-(reference[queries] @ reference.T), axis=1)[:, 1:6]
+            overlap = float(np.mean([len(set(f) & set(t)) / 5 for f, t in zip(found, truth)]))
+        latencies = np.array(result['latencies']) * 1000
+        print(
+            f"{backend:>8} {result['load_seconds']:>7.1f} {format_memory(result['memory']):>7} "
+            f"{np.percentile(latencies, 50):>8.1f} {result['sentences_per_second']:>8.0f} "
+            f"{cosine:>7.4f} {overlap:>6.2f}"
+        )
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--worker':
+        kind, *rest = sys.argv[2:]
+        if kind == 'llm':
+            size, backend, count, max_new_tokens = rest
+            result = worker_llm(size, backend, int(count), int(max_new_tokens))
+        else:
+            backend, count, output = rest
+            result = worker_embeddings(backend, int(count), output)
+        print(json.dumps(result))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--only', choices=['llm', 'embeddings'])
+    parser.add_argument('--llm-size', default='small')
+    parser.add_argument('--prompts', type=int, default=16)
+    parser.add_argument('--max-new-tokens', type=int, default=32)
+    parser.add_argument('--sentences', type=int, default=1000)
+    args = parser.parse_args()
+    # fp32 всегда замеряется первым: он служит эталоном качества
+    args.backends = ['torch'] + [backend for backend in args.backends if backend != 'torch']
+
+    if args.only != 'embeddings':
+        bench_llm(args)
+    if args.only != 'llm':
+        with tempfile.TemporaryDirectory() as workdir:
+            bench_embeddings(args, workdir)
+
+
+if __name__ == "__main__":
+    main()
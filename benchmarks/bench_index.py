@@ -0,0 +1,98 @@
+"""
+Сравнение типов векторного индекса: recall@k относительно точного поиска
+и задержка одиночного запроса (p50/p99) на корпусах разного размера.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_index --sizes 10000 100000 --k 3
+    python -m benchmarks.bench_index --embeddings vectors.npy
+"""
+import argparse
+import time
+import numpy as np
+from bot.vector_store import INDEX_MODES, VectorStore
+
+
+def make_corpus(size: int, dimension: int, rng: np.random.Generator) -> np.ndarray:
+    """Синтетические эмбеддинги с кластерной структурой, как у реальных текстов"""
+    n_clusters = max(1, size // 100)
+    centers = rng.standard_normal((n_clusters, dimension)).astype('float32')
+    labels = rng.integers(0, n_clusters, size)
+    vectors = centers[labels] + 0.3 * rng.standard_normal((size, dimension)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build(mode: str, vectors: np.ndarray, params: dict) -> VectorStore:
+    store = VectorStore(vectors.shape[1], mode, params)
+    store.add(np.arange(len(vectors)), vectors)
+    return store
+
+
+def measure(store: VectorStore, queries: np.ndarray, k: int):
+    """Возвращает найденные ID и задержки одиночных запросов в миллисекундах"""
+    found = np.empty((len(queries), k), dtype='int64')
+    latencies = np.empty(len(queries))
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = store.search(query, k)
+        latencies[i] = (time.perf_counter() - start) * 1000
+        found[i] = ids[0]
+    return found, latencies
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 200000])
+    parser.add_argument('--dimension', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--modes', nargs='+', default=list(INDEX_MODES), choices=INDEX_MODES)
+    parser.add_argument('--nlist', type=int, default=256)
+    parser.add_argument('--nprobe', type=int, default=16)
+    parser.add_argument('--ef-search', type=int, default=64)
+    parser.add_argument('--pq-m', type=int, default=16)
+    parser.add_argument('--embeddings', help="файл .npy с реальными эмбеддингами вместо синтетических")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    params = {'nlist': args.nlist, 'nprobe': args.nprobe, 'ef_search': args.ef_search, 'pq_m': args.pq_m}
+
+    if args.embeddings:
+        corpus = np.load(args.embeddings).astype('float32')
+        sizes = [size for size in args.sizes if size <= len(corpus)] or [len(corpus)]
+    else:
+        corpus = make_corpus(max(args.sizes), args.dimension, rng)
+        sizes = args.sizes
+
+    print(f"{'size':>8} {'mode':>9} {'build s':>8} {'recall@' + str(args.k):>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in sizes:
+        vectors = corpus[:size]
+        # Запросы - зашумленные векторы корпуса, чтобы у них были близкие соседи
+        queries = vectors[rng.integers(0, size, args.queries)]
+        queries = queries + 0.05 * rng.standard_normal(queries.shape).astype('float32')
+
+        truth = None
+        for mode in ['flat'] + [mode for mode in args.modes if mode != 'flat']:
+            start = time.perf_counter()
+            store = build(mode, vectors, params)
+            build_time = time.perf_counter() - start
+
+            found, latencies = measure(store, queries, args.k)
+            if truth is None:
+                truth = found
+            if mode not in args.modes:
+                continue
+
+            trained = "" if store.is_trained else " (flat: мало данных для обучения)"
+            print(
+                f"{size:>8} {mode:>9} {build_time:>8.2f} {recall_at_k(found, truth):>9.3f} "
+                f"{np.percentile(latencies, 50):>8.3f} {np.percentile(latencies, 99):>8.3f}{trained}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Замеры гибридного поиска на синтетическом корпусе: построение индекса BM25
+(bot.lexical_index.LexicalIndex), размер списков вхождений, задержка
+запроса BM25 и векторного поиска по всему индексу и с лексическим
+предварительным отбором (IDSelectorBatch).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_lexical --chunks 100000 --prefilter 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from bot.lexical_index import LexicalIndex
+from bot.vector_store import VectorStore
+
+
+def make_corpus(count: int, vocabulary: int, words: int, seed: int = 0):
+    """Чанки из слов с частотами по закону Ципфа, как в естественном тексте"""
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, vocabulary + 1)
+    probabilities = 1 / ranks / np.sum(1 / ranks)
+    terms = [f"слово{i}" for i in range(vocabulary)]
+    samples = rng.choice(vocabulary, size=(count, words), p=probabilities)
+    return [" ".join(terms[i] for i in row) for row in samples], terms
+
+
+def percentiles(latencies) -> str:
+    latencies = np.array(latencies) * 1000
+    return f"p50 {np.percentile(latencies, 50):7.2f}  p99 {np.percentile(latencies, 99):7.2f} мс"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=100000)
+    parser.add_argument('--vocabulary', type=int, default=50000)
+    parser.add_argument('--words', type=int, default=120, help="слов в чанке")
+    parser.add_argument('--dimension', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--prefilter', type=int, default=5000, help="кандидатов BM25 для векторного поиска")
+    parser.add_argument('--mode', default='flat', help="тип векторного индекса")
+    args = parser.parse_args()
+
+    chunks, terms = make_corpus(args.chunks, args.vocabulary, args.words)
+    rng = np.random.default_rng(1)
+    queries = [" ".join(rng.choice(terms[100:5000], size=3)) for _ in range(args.queries)]
+
+    index = LexicalIndex()
+    start = time.perf_counter()
+    for i in range(0, len(chunks), 256):
+        index.add(range(i, min(i + 256, len(chunks))), chunks[i:i + 256])
+    build = time.perf_counter() - start
+    postings = index.size_bytes // 6
+    print(f"чанков: {len(index)}, термов: {len(index._terms)}, анализатор: {index.analyzer.name}")
+    print(f"построение BM25: {build:.1f} с ({len(chunks) / build:.0f} чанков/с)")
+    print(f"списки вхождений: {index.size_bytes / 2 ** 20:.1f} МБ, {postings} вхождений, 6 байт на вхождение")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'bench.bm25')
+        start = time.perf_counter()
+        index.save(path)
+        saved = time.perf_counter() - start
+        start = time.perf_counter()
+        LexicalIndex.load(path)
+        print(f"сохранение {saved:.2f} с, загрузка {time.perf_counter() - start:.2f} с, "
+              f"файл {os.path.getsize(path) / 2 ** 20:.1f} МБ")
+
+    latencies, candidates = [], []
+    for query in queries:
+        start = time.perf_counter()
+        candidates.append([chunk_id for chunk_id, _ in index.search(query, args.prefilter)])
+        latencies.append(time.perf_counter() - start)
+    print(f"запрос BM25 (top-{args.prefilter}):      {percentiles(latencies)}")
+
+    vectors = np.random.default_rng(2).standard_normal((args.chunks, args.dimension)).astype('float32')
+    store = VectorStore(args.dimension, args.mode)
+    store.add(range(args.chunks), vectors)
+    query_vectors = np.random.default_rng(3).standard_normal((args.queries, args.dimension)).astype('float32')
+
+    for title, restrict in (("векторный поиск по всему индексу", False), ("векторный поиск с отбором BM25", True)):
+        latencies = []
+        for vector, ids in zip(query_vectors, candidates):
+            start = time.perf_counter()
+            store.search(vector, 20, ids=ids if restrict else None)
+            latencies.append(time.perf_counter() - start)
+        print(f"{title + ':':<37}{percentiles(latencies)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Проверка асинхронного клиента OpenAI (openai_client.AsyncOpenAIClient)
+на локальном mock-сервере, совместимом с /v1/chat/completions:
+время до первого токена (TTFT) и до полного ответа при N одновременных
+запросах, число TCP-соединений (переиспользование пула) и повторы
+после искусственных ошибок 503.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_openai_stream --requests 64 --concurrency 8
+    python -m benchmarks.bench_openai_stream --fail-every 4
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from openai_client import AsyncOpenAIClient
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, tokens: int, token_delay: float, fail_every: int):
+        super().__init__(('127.0.0.1', 0), MockHandler)
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.fail_every = fail_every
+        self.requests = 0
+        self.failures = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, чтобы клиент мог переиспользовать соединения
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+            fail = server.fail_every and server.requests % server.fail_every == 0
+            if fail:
+                server.failures += 1
+
+        if fail:
+            self._send_json(503, {"error": {"message": "mock overload", "type": "server_error"}})
+            return
+
+        words = [f"слово{i} " for i in range(server.tokens)]
+        base = {"id": "mock", "created": int(time.time()), "model": request['model']}
+
+        if not request.get('stream'):
+            time.sleep(server.token_delay * server.tokens)
+            self._send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(words)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 1, "completion_tokens": server.tokens, "total_tokens": server.tokens + 1}
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i, word in enumerate(words + [None]):
+            if word is not None:
+                time.sleep(server.token_delay)
+            chunk = {
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": word} if word is not None else {},
+                    "finish_reason": None if word is not None else "stop"
+                }]
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+
+async def run_requests(client: AsyncOpenAIClient, requests: int):
+    """Возвращает TTFT и время полного ответа каждого запроса в миллисекундах"""
+    async def one(i: int):
+        start = time.perf_counter()
+        first = None
+        async for _ in client.stream(f"вопрос {i}", "контекст"):
+            if first is None:
+                first = time.perf_counter() - start
+        return first * 1000, (time.perf_counter() - start) * 1000
+
+    results = await asyncio.gather(*(one(i) for i in range(requests)))
+    await client.aclose()
+    return np.array(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=8, help="max_concurrency клиента")
+    parser.add_argument('--tokens', type=int, default=100)
+    parser.add_argument('--token-delay-ms', type=float, default=10)
+    parser.add_argument('--fail-every', type=int, default=0, help="каждый N-й запрос получает 503")
+    args = parser.parse_args()
+
+    server = MockServer(args.tokens, args.token_delay_ms / 1000, args.fail_every)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = AsyncOpenAIClient(
+        api_key="mock",
+        base_url=server.base_url,
+        max_concurrency=args.concurrency,
+        backoff=0.05
+    )
+    start = time.perf_counter()
+    results = asyncio.run(run_requests(client, args.requests))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    ttft, total = results[:, 0], results[:, 1]
+    print(f"запросов: {args.requests}, одновременно: {args.concurrency}, токенов в ответе: {args.tokens}")
+    print(f"TTFT, мс:         p50 {np.percentile(ttft, 50):8.1f}  p99 {np.percentile(ttft, 99):8.1f}")
+    print(f"полный ответ, мс: p50 {np.percentile(total, 50):8.1f}  p99 {np.percentile(total, 99):8.1f}")
+    print(f"пропускная способность: {args.requests / elapsed:.1f} ответов/с")
+    print(f"HTTP-запросов: {server.requests}, ошибок 503: {server.failures}, TCP-соединений: {len(server.connections)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Микробенчмарк model.retriever.Retriever на корпусах от 10 тыс. до 1 млн чанков:
+время поэтапного добавления документов, задержка одиночного запроса
+и пропускная способность батчевого поиска. Для сравнения на небольших
+корпусах измеряется прежняя схема (np.vstack на каждый документ,
+перенормировка матрицы и полная сортировка на каждый запрос).
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_retriever --sizes 10000 100000 1000000
+"""
+import argparse
+import time
+import numpy as np
+from model.retriever import Retriever
+
+
+def legacy_ingest(chunks: np.ndarray, chunks_per_doc: int) -> np.ndarray:
+    embeddings = None
+    for start in range(0, len(chunks), chunks_per_doc):
+        batch = chunks[start:start + chunks_per_doc]
+        embeddings = batch if embeddings is None else np.vstack([embeddings, batch])
+    return embeddings
+
+
+def legacy_query(embeddings: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    similarities = normed @ (query / np.linalg.norm(query))
+    return np.argsort(similarities)[-k:][::-1]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--dimension', type=int, default=384)
+    parser.add_argument('--chunks-per-doc', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--batch', type=int, default=32)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--legacy-max', type=int, default=100000,
+                        help="максимальный размер корпуса для замера прежней схемы")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'chunks':>8} {'impl':>7} {'ingest s':>9} {'p50 ms':>8} {'p99 ms':>8} {'batch q/s':>10}")
+
+    for size in args.sizes:
+        chunks = rng.standard_normal((size, args.dimension), dtype=np.float32)
+        queries = rng.standard_normal((args.queries, args.dimension), dtype=np.float32)
+
+        retriever = Retriever(top_k=args.k)
+        documents = [{"chunk_id": i} for i in range(size)]
+
+        def ingest():
+            for start in range(0, size, args.chunks_per_doc):
+                end = start + args.chunks_per_doc
+                retriever.add_documents(documents[start:end], chunks[start:end])
+
+        _, ingest_time = timed(ingest)
+
+        latencies = []
+        for query in queries:
+            _, elapsed = timed(retriever.retrieve, query)
+            latencies.append(elapsed * 1000)
+
+        _, batch_time = timed(
+            lambda: [retriever.retrieve_batch(queries[i:i + args.batch]) for i in range(0, len(queries), args.batch)]
+        )
+        print(
+            f"{size:>8} {'new':>7} {ingest_time:>9.2f} {np.percentile(latencies, 50):>8.2f} "
+            f"{np.percentile(latencies, 99):>8.2f} {len(queries) / batch_time:>10.0f}"
+        )
+
+        if size > args.legacy_max:
+            continue
+
+        embeddings, ingest_time = timed(legacy_ingest, chunks, args.chunks_per_doc)
+        latencies = []
+        for query in queries:
+            _, elapsed = timed(legacy_query, embeddings, query, args.k)
+            latencies.append(elapsed * 1000)
+        print(
+            f"{size:>8} {'legacy':>7} {ingest_time:>9.2f} {np.percentile(latencies, 50):>8.2f} "
+            f"{np.percentile(latencies, 99):>8.2f} {1000 / np.mean(latencies):>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
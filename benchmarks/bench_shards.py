@@ -0,0 +1,171 @@
+"""
+Проверка и замеры шардированного индекса (bot.sharded_store.ShardedVectorStore)
+на нескольких локальных процессах: результаты поиска по всему индексу и по
+книге сравниваются с индексом в одном процессе, затем проверяется
+выравнивание шардов после удаления книг, сохранение, загрузка и перезапуск
+упавшего шарда. Замеряются добавление, задержка одиночного запроса и
+пропускная способность батчей.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_shards --chunks 200000 --shards 2 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks.bench_index import make_corpus
+from bot.sharded_store import ShardedVectorStore
+from bot.vector_store import INDEX_MODES, VectorStore
+
+
+def make_books(chunks: int, mean_size: int, rng: np.random.Generator):
+    """Книги разного размера (логнормальное распределение), ID чанков идут подряд"""
+    books, start = {}, 0
+    while start < chunks:
+        size = int(min(max(rng.lognormal(np.log(mean_size), 1.0), 1), chunks - start))
+        books[len(books) + 1] = np.arange(start, start + size)
+        start += size
+    return books
+
+
+def fill(store, books, vectors, batch_size: int = 256):
+    for doc_id, ids in books.items():
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i:i + batch_size]
+            store.add(batch, vectors[batch], document_id=doc_id)
+
+
+def same_results(expected, actual) -> bool:
+    """Совпадают расстояния и ID (при равных расстояниях порядок ID может отличаться)"""
+    (expected_distances, expected_ids), (actual_distances, actual_ids) = expected, actual
+    found = expected_ids != -1
+    return (
+        np.array_equal(found, actual_ids != -1)
+        and np.allclose(expected_distances[found], actual_distances[found], rtol=1e-4, atol=1e-4)
+        and all(set(e[f]) == set(a[f]) for e, a, f in zip(expected_ids, actual_ids, found))
+    )
+
+
+def check(title: str, passed: bool) -> bool:
+    print(f"  {title}: {'ok' if passed else 'ОШИБКА'}")
+    return passed
+
+
+def balanced(store: ShardedVectorStore) -> bool:
+    sizes = store.sizes
+    return max(sizes) - min(sizes) <= max(store.rebalance_tolerance * store.ntotal / store.shards, 1)
+
+
+def percentiles(latencies) -> str:
+    latencies = np.array(latencies) * 1000
+    return f"p50 {np.percentile(latencies, 50):7.2f}  p99 {np.percentile(latencies, 99):7.2f} мс"
+
+
+def measure(store, queries: np.ndarray, k: int, batch: int):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        store.search(query, k)
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch):
+        store.search(queries[i:i + batch], k)
+    return latencies, len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=100000)
+    parser.add_argument('--dimension', type=int, default=384)
+    parser.add_argument('--book-size', type=int, default=500, help="средний размер книги в чанках")
+    parser.add_argument('--shards', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--mode', default='flat', choices=INDEX_MODES)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=32, help="запросов в батче для замера пропускной способности")
+    parser.add_argument('--k', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = make_corpus(args.chunks, args.dimension, rng)
+    queries = make_corpus(args.queries, args.dimension, rng)
+    books = make_books(args.chunks, args.book_size, rng)
+    deleted = [doc_id for doc_id in books if doc_id % 4 == 0]
+    scope_book = max(books, key=lambda doc_id: len(books[doc_id]))
+    print(f"чанков: {args.chunks}, книг: {len(books)}, ядер: {os.cpu_count()}, индекс {args.mode}")
+
+    reference = VectorStore(args.dimension, args.mode)
+    start = time.perf_counter()
+    fill(reference, books, vectors)
+    print(f"\n1 процесс: добавление {time.perf_counter() - start:.1f} с")
+    latencies, throughput = measure(reference, queries, args.k, args.batch)
+    print(f"  одиночный запрос: {percentiles(latencies)}, батчи: {throughput:.0f} запросов/с")
+    expected = reference.search(queries, args.k)
+    expected_scoped = reference.search(queries, args.k, ids=books[scope_book])
+    reference.remove(np.concatenate([books[doc_id] for doc_id in deleted]))
+    expected_after_delete = reference.search(queries, args.k)
+
+    # Точное совпадение с одним процессом проверяется только для точного индекса
+    exact = args.mode == 'flat'
+    passed = True
+    for shards in args.shards:
+        start = time.perf_counter()
+        store = ShardedVectorStore(args.dimension, args.mode, shards=shards)
+        print(f"\n{shards} шарда: запуск процессов {time.perf_counter() - start:.1f} с")
+        try:
+            start = time.perf_counter()
+            fill(store, books, vectors)
+            print(f"  добавление {time.perf_counter() - start:.1f} с, размеры шардов: {store.sizes}")
+            latencies, throughput = measure(store, queries, args.k, args.batch)
+            print(f"  одиночный запрос: {percentiles(latencies)}, батчи: {throughput:.0f} запросов/с")
+
+            passed &= check("все векторы в индексе", store.ntotal == args.chunks and len(store.ids()) == args.chunks)
+            if exact:
+                passed &= check("поиск совпадает с одним процессом", same_results(expected, store.search(queries, args.k)))
+                passed &= check(
+                    f"поиск по книге {scope_book} совпадает",
+                    same_results(expected_scoped, store.search(queries, args.k, ids=books[scope_book]))
+                )
+            passed &= check("шарды выровнены после добавления", balanced(store))
+
+            start = time.perf_counter()
+            removed = store.remove(np.concatenate([books[doc_id] for doc_id in deleted]))
+            print(f"  удаление {len(deleted)} книг и выравнивание {time.perf_counter() - start:.2f} с, "
+                  f"размеры шардов: {store.sizes}")
+            passed &= check(
+                "удалены все векторы книг",
+                removed == sum(len(books[doc_id]) for doc_id in deleted) and store.ntotal == reference.ntotal
+            )
+            passed &= check("шарды выровнены после удаления", balanced(store))
+            if exact:
+                passed &= check("поиск после удаления совпадает",
+                                same_results(expected_after_delete, store.search(queries, args.k)))
+
+            with tempfile.TemporaryDirectory() as workdir:
+                path = os.path.join(workdir, 'bench.faiss')
+                store.save(path, {'bench': True})
+                before = store.search(queries, args.k)
+                sizes = store.sizes
+                store.close()
+                start = time.perf_counter()
+                store, manifest = ShardedVectorStore.load(path, args.mode, shards=shards)
+                print(f"  загрузка {time.perf_counter() - start:.1f} с")
+                passed &= check("после загрузки те же шарды и результаты",
+                                manifest['bench'] and store.sizes == sizes
+                                and same_results(before, store.search(queries, args.k)))
+
+                # Процесс шарда завершается: он перезапускается из сохранения, поиск повторяется
+                store._shards[0].process.kill()
+                store._shards[0].process.wait()
+                passed &= check("упавший шард перезапущен из сохранения",
+                                same_results(before, store.search(queries, args.k)) and store.sizes == sizes)
+        finally:
+            store.close()
+
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Разбивка времени холодного старта бота по компонентам.
+
+Каждый замер выполняется в отдельном процессе Python, чтобы модули
+не оставались в памяти от предыдущего замера:
+  * импорт тяжелых библиотек (torch, transformers, faiss, ...) по отдельности;
+  * импорт main.py - время до запуска опроса Telegram, когда бот уже
+    отвечает на /start;
+  * фоновая загрузка (AskDocsBot.warm_up): модель эмбеддингов, индекс,
+    языковая модель, с приростом резидентной памяти.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --db books.db --skip-warmup
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = [
+    'telegram', 'numpy', 'faiss', 'PyPDF2', 'torch', 'transformers', 'sentence_transformers', 'whisper',
+]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+try:
+    __import__(sys.argv[1])
+    print(json.dumps({'seconds': time.perf_counter() - start}))
+except ImportError as e:
+    print(json.dumps({'error': str(e)}))
+"""
+
+WARMUP_SCRIPT = """
+import asyncio, json, sys
+from bot.ask_docs_bot import AskDocsBot
+from bot.model_registry import registry
+
+bot = AskDocsBot(db_path=sys.argv[1])
+asyncio.run(bot.warm_up())
+print(json.dumps({
+    'status': bot.warmup_status,
+    'error': bot.warmup_error,
+    'memory': {stats.name: stats.memory_bytes for stats in registry.stats()},
+}))
+"""
+
+
+def run_python(script: str, *args: str, cwd: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=ROOT, TELEGRAM_BOT_TOKEN=os.environ.get('TELEGRAM_BOT_TOKEN', '0:bench'))
+    result = subprocess.run(
+        [sys.executable, '-c', script, *args], cwd=cwd, env=env, capture_output=True, text=True
+    )
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        return {'error': (result.stderr.strip().splitlines() or ['неизвестная ошибка'])[-1]}
+    return json.loads(lines[-1])
+
+
+def print_row(name: str, result: dict, extra: str = ""):
+    if 'error' in result and result['error']:
+        print(f"{name:<32} {'—':>9}  {result['error']}")
+    else:
+        print(f"{name:<32} {result['seconds']:>9.2f}{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help="база с книгами для замера прогрева индекса (копируется во временный каталог)")
+    parser.add_argument('--skip-warmup', action='store_true', help="не загружать модели")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'books.db')
+        if args.db:
+            shutil.copy(args.db, db_path)
+            index_path = os.path.splitext(args.db)[0] + '.faiss'
+            for suffix in ('', '.json'):
+                if os.path.exists(index_path + suffix):
+                    shutil.copy(index_path + suffix, os.path.join(workdir, 'books.faiss' + suffix))
+
+        print(f"{'компонент':<32} {'сек':>9}")
+        print("Импорт библиотек:")
+        for module in HEAVY_MODULES:
+            print_row(f"  {module}", run_python(IMPORT_SCRIPT, module, cwd=workdir))
+
+        print("Запуск бота:")
+        print_row("  import main (до опроса Telegram)", run_python(IMPORT_SCRIPT, 'main', cwd=workdir))
+
+        if args.skip_warmup:
+            return
+
+        print("Фоновая загрузка:")
+        result = run_python(WARMUP_SCRIPT, db_path, cwd=workdir)
+        if 'status' not in result:
+            print_row("  warm_up", result)
+            return
+        for name, seconds in result['status'].items():
+            memory = result['memory'].get(name)
+            extra = f"  +{memory / 2 ** 20:.0f} МБ" if memory else ""
+            if seconds is None:
+                print_row(f"  {name}", {'error': result['error'] or 'не загружено'})
+            else:
+                print_row(f"  {name}", {'seconds': seconds}, extra)
+
+
+if __name__ == "__main__":
+    main()
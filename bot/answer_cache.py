@@ -0,0 +1,144 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+import threading
+import time
+import numpy as np
+
+CacheKey = Tuple[str, Tuple[int, ...]]
+
+
+@dataclass
+class CacheEntry:
+    """Закешированный ответ вместе с данными для поиска и инвалидации"""
+    answer: str
+    embedding: np.ndarray  # нормированный эмбеддинг запроса
+    document_ids: FrozenSet[int]
+    created_at: float
+
+
+def normalize_query(query: str) -> str:
+    """Приводит запрос к виду, не зависящему от регистра и пробелов"""
+    return " ".join(query.lower().split())
+
+
+class AnswerCache:
+    """LRU-кеш ответов с TTL и поиском похожих запросов по эмбеддингу
+
+    Точный ключ - нормализованный запрос и ID найденных чанков. Если точного
+    совпадения нет, среди ответов по тем же чанкам ищется запрос с косинусной
+    близостью не ниже threshold. Записи, построенные по документу, удаляются
+    при его изменении или удалении.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 3600, threshold: float = 0.95):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self._by_chunks: Dict[Tuple[int, ...], Set[CacheKey]] = {}
+        self._by_document: Dict[int, Set[CacheKey]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype='float32').ravel()
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return time.monotonic() - entry.created_at > self.ttl
+
+    @staticmethod
+    def _unlink(index: Dict, value, key: CacheKey):
+        keys = index.get(value)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[value]
+
+    def _remove(self, key: CacheKey):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._unlink(self._by_chunks, key[1], key)
+        for doc_id in entry.document_ids:
+            self._unlink(self._by_document, doc_id, key)
+
+    def _touch(self, key: CacheKey) -> Optional[str]:
+        """Возвращает ответ живой записи и помечает ее как недавно использованную"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry.answer
+
+    def get(
+        self,
+        query: str,
+        chunk_ids: Iterable[int],
+        embedding: Optional[np.ndarray] = None
+    ) -> Optional[str]:
+        """Ищет ответ сначала по точному ключу, затем по похожему запросу"""
+        chunk_key = tuple(chunk_ids)
+        key = (normalize_query(query), chunk_key)
+        with self._lock:
+            answer = self._touch(key)
+            if answer is not None or embedding is None:
+                return answer
+
+            candidates = list(self._by_chunks.get(chunk_key, ()))
+            if not candidates:
+                return None
+
+            embedding = self._normalize(embedding)
+            similarities = np.stack([self._entries[k].embedding for k in candidates]) @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            return self._touch(candidates[best])
+
+    def put(
+        self,
+        query: str,
+        chunk_ids: Iterable[int],
+        embedding: np.ndarray,
+        answer: str,
+        document_ids: Iterable[int]
+    ):
+        """Сохраняет ответ, вытесняя самые давно использованные записи"""
+        key = (normalize_query(query), tuple(chunk_ids))
+        entry = CacheEntry(
+            answer=answer,
+            embedding=self._normalize(embedding),
+            document_ids=frozenset(document_ids),
+            created_at=time.monotonic()
+        )
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._by_chunks.setdefault(key[1], set()).add(key)
+            for doc_id in entry.document_ids:
+                self._by_document.setdefault(doc_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_documents(self, document_ids: Iterable[int]):
+        """Удаляет ответы, построенные по указанным документам"""
+        with self._lock:
+            for doc_id in document_ids:
+                for key in list(self._by_document.get(doc_id, ())):
+                    self._remove(key)
+
+    def clear(self):
+        """Очищает кеш"""
+        with self._lock:
+            self._entries.clear()
+            self._by_chunks.clear()
+            self._by_document.clear()
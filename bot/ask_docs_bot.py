@@ -1,70 +1,596 @@
-from typing import Optional
+from functools import partial
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
 import asyncio
-from sentence_transformers import SentenceTransformer
-import faiss
+import hashlib
+import logging
+import threading
+import time
 import numpy as np
-import sqlite3
 import os
+from config import EMBEDDING_CONFIG
 from llm import LLM
+from model.embedding_cache import EmbeddingCache
+from model.text_splitter import iter_chunks
+from .answer_cache import AnswerCache
+from .batcher import MicroBatcher
+from .config import Config
+from .context_builder import ContextBuilder
+from .database import Database, content_hash
+from .inference_pool import InferencePool
+from .lexical_index import LexicalIndex, reciprocal_rank_fusion
+from .model_registry import registry
+from .reranker import load_cross_encoder, rerank
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+    from .vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+
+def _load_embedding_model(model_name: str, backend: str) -> 'SentenceTransformer':
+    # Бэкенды импортируют torch или onnxruntime, поэтому импорт отложен до загрузки модели
+    from inference_backends import load_sentence_encoder
+    return load_sentence_encoder(model_name, backend)
+
 
 class AskDocsBot:
-    def __init__(self):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.index = None
-        self.texts = []
-        self.db_path = "books.db"
-        self.llm = LLM()
-        self.initialize_index()
+    # Сколько чанков кодируется и добавляется в индекс за один шаг
+    INDEX_BATCH_SIZE = 256
 
-    def initialize_index(self):
-        """Инициализирует индекс FAISS и загружает тексты из базы данных"""
-        if not os.path.exists(self.db_path):
-            print(f"База данных {self.db_path} не найдена")
+    def __init__(self, db_path: str = "books.db"):
+        self.model_name = EMBEDDING_CONFIG['model_name']
+        self.embedding_backend = EMBEDDING_CONFIG['backend']
+        # Векторы разных бэкендов немного отличаются, поэтому кеш и индекс их не смешивают
+        self.embedding_key = self.model_name
+        if self.embedding_backend != 'torch':
+            self.embedding_key += f":{self.embedding_backend}"
+        # Модели общие для процесса и загружаются при первом обращении
+        registry.register('embeddings', partial(_load_embedding_model, self.model_name, self.embedding_backend))
+        registry.register('llm', LLM)
+        # Кросс-энкодер переупорядочивает кандидатов поиска, оставляя лучшие фрагменты
+        self.rerank = Config.RERANK
+        if self.rerank:
+            registry.register('reranker', partial(load_cross_encoder, Config.RERANK_MODEL, Config.RERANK_MAX_LENGTH))
+        self.chunk_size = Config.CHUNK_SIZE
+        self.chunk_overlap = Config.CHUNK_OVERLAP
+        self.index_mode = Config.INDEX_MODE
+        self.index_params = Config.INDEX_PARAMS
+        self.index_shards = Config.INDEX_SHARDS
+        self.index: Optional['VectorStore'] = None  # векторы чанков по их ID
+        self.indexed_hashes: Dict[int, str] = {}  # id документа -> хеш проиндексированного текста
+        self._document_chunks: Dict[int, List[int]] = {}  # id документа -> ID его чанков для поиска по книге
+        self.db_path = db_path
+        # Индекс хранится рядом с базой данных: books.db -> books.faiss
+        self.index_path = os.path.splitext(db_path)[0] + ".faiss"
+        # Лексический индекс BM25 для гибридного поиска: books.db -> books.bm25
+        self.hybrid_search = Config.HYBRID_SEARCH
+        self.lexical_path = os.path.splitext(db_path)[0] + ".bm25"
+        self.lexical_index: Optional[LexicalIndex] = None
+        self.database = Database(db_path, async_workers=Config.DB_WORKERS)
+        # Эмбеддинги чанков хранятся по хешу текста, повторно кодируются только новые;
+        # кеш работает через общий пул соединений базы
+        self.embedding_cache = EmbeddingCache(
+            db_path, pool=self.database.pool, max_entries=Config.EMBEDDING_CACHE_MAX_ENTRIES
+        )
+        # Инференс выполняется вне цикла событий, изменения индекса сериализуются
+        self.pool = InferencePool(Config.INFERENCE_WORKERS)
+        self._index_lock = threading.Lock()
+        # Одновременные запросы пользователей обрабатываются общими батчами
+        self._retrieval_batcher = MicroBatcher(
+            self._retrieve_batch, self.pool, Config.BATCH_MAX_SIZE, Config.BATCH_MAX_WAIT_MS
+        )
+        self._generation_batcher = MicroBatcher(
+            self._generate_batch, self.pool, Config.BATCH_MAX_SIZE, Config.BATCH_MAX_WAIT_MS
+        )
+        self.context_builder = ContextBuilder(
+            cache_size=Config.CONTEXT_TOKEN_CACHE_SIZE,
+            duplicate_threshold=Config.CONTEXT_DUPLICATE_THRESHOLD
+        )
+        self.answer_cache = AnswerCache(
+            max_size=Config.ANSWER_CACHE_SIZE,
+            ttl=Config.ANSWER_CACHE_TTL,
+            threshold=Config.ANSWER_CACHE_THRESHOLD
+        )
+        # Индекс и модели загружаются в фоне после запуска бота (warm_up),
+        # до этого доступны только команды, которым они не нужны
+        self.warmup_status: Dict[str, Optional[float]] = {
+            'embeddings': None, 'index': None, 'llm': None
+        }  # компонент -> время загрузки в секундах
+        if self.rerank:
+            self.warmup_status['reranker'] = None
+        self.warmup_error: Optional[str] = None
+        self._ready = asyncio.Event()
+
+    @property
+    def is_ready(self) -> bool:
+        """Закончилась ли фоновая загрузка индекса и моделей"""
+        return self._ready.is_set()
+
+    async def wait_ready(self):
+        await self._ready.wait()
+
+    async def warm_up(self):
+        """Фоновая загрузка модели эмбеддингов, индекса и языковой модели"""
+        steps = [
+            ('embeddings', lambda: self.model),
+            ('index', self.initialize_index),
+            ('llm', lambda: self.llm),
+        ]
+        if self.rerank:
+            steps.append(('reranker', partial(registry.get, 'reranker')))
+        try:
+            for name, load in steps:
+                start = time.perf_counter()
+                await self.pool.run(load)
+                self.warmup_status[name] = time.perf_counter() - start
+                logger.info("Прогрев: %s готов за %.1f с", name, self.warmup_status[name])
+        except Exception as e:
+            # Не блокируем ожидающих навсегда: запросы получат ошибку обработки
+            logger.exception("Ошибка фоновой загрузки")
+            self.warmup_error = str(e)
+        finally:
+            self._ready.set()
+
+    @property
+    def model(self) -> 'SentenceTransformer':
+        """Модель эмбеддингов из общего реестра"""
+        return registry.get('embeddings')
+
+    @property
+    def llm(self) -> LLM:
+        """Текущая языковая модель из общего реестра, меняется командой /model"""
+        return registry.get('llm')
+
+    async def current_llm(self) -> LLM:
+        """Языковая модель для кода в цикле событий
+
+        Загруженная модель берется из реестра сразу, иначе загрузка идет в пуле
+        инференса, чтобы ожидание блокировки реестра не останавливало цикл событий.
+        """
+        llm = registry.get_loaded('llm')
+        if llm is None:
+            llm = await self.pool.run(registry.get, 'llm')
+        return llm
+
+    def _new_index(self) -> 'VectorStore':
+        """Создает пустой индекс под размерность модели эмбеддингов"""
+        dimension = self.model.get_sentence_embedding_dimension()
+        if self.index_shards > 1:
+            from .sharded_store import ShardedVectorStore
+            return ShardedVectorStore(
+                dimension, self.index_mode, self.index_params,
+                self.index_shards, Config.INDEX_REBALANCE_TOLERANCE
+            )
+        from .vector_store import VectorStore
+        return VectorStore(dimension, self.index_mode, self.index_params)
+
+    def _index_settings(self) -> Dict:
+        """Параметры, при смене которых индекс нужно построить заново"""
+        return {
+            'model': self.embedding_key,
+            'chunk_size': self.chunk_size,
+            'chunk_overlap': self.chunk_overlap,
+            'index_mode': self.index_mode,
+            # Параметры поиска (nprobe, ef_search) применяются без перестроения
+            'index_build': {
+                key: self.index_params[key] for key in ('nlist', 'hnsw_m', 'pq_m', 'pq_nbits')
+            },
+        }
+
+    def _load_index(self) -> bool:
+        """Загружает сохраненный индекс, если он построен с теми же параметрами"""
+        if self.index_shards > 1:
+            from .sharded_store import ShardedVectorStore
+            loaded = ShardedVectorStore.load(
+                self.index_path, self.index_mode, self.index_params,
+                self.index_shards, Config.INDEX_REBALANCE_TOLERANCE
+            )
+        else:
+            from .vector_store import VectorStore
+            loaded = VectorStore.load(self.index_path, self.index_mode, self.index_params)
+        if loaded is None:
+            return False
+
+        index, manifest = loaded
+        settings = self._index_settings()
+        # Манифест шардированного индекса лежит на месте обычного, поэтому число шардов тоже сверяется
+        if manifest.get('shards', 1) != self.index_shards or any(
+            manifest.get(key) != value for key, value in settings.items()
+        ):
+            print("Параметры индекса изменились, требуется переиндексация")
+            index.close()
+            return False
+
+        self.index = index
+        self.indexed_hashes = {int(doc_id): h for doc_id, h in manifest.get('documents', {}).items()}
+        return True
+
+    def save_index(self):
+        """Сохраняет индекс и соответствие документов их хешам на диск"""
+        if self.index is None:
             return
+        self.index.save(self.index_path, dict(self._index_settings(), documents=self.indexed_hashes))
+        if self.lexical_index is not None:
+            self.lexical_index.save(self.lexical_path)
+
+    def close(self):
+        """Освобождает индекс, завершая процессы шардов"""
+        with self._index_lock:
+            if self.index is not None:
+                self.index.close()
+                self.index = None
+
+    def _index_chunks(
+        self,
+        doc_id: int,
+        chunks: Iterable[str],
+        on_progress: Optional[Callable[[str, int], None]] = None
+    ):
+        """Сохраняет поток чанков документа и добавляет их векторы в индекс порциями
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Получаем все тексты из базы данных
-        cursor.execute("SELECT text FROM documents")
-        self.texts = [row[0] for row in cursor.fetchall()]
-        
-        if not self.texts:
+        on_progress вызывается со стадией ('chunking' при появлении первого чанка,
+        затем 'embedding') и количеством уже проиндексированных чанков.
+        """
+        batch = []
+        position = 0
+        for chunk in chunks:
+            if on_progress is not None and not position and not batch:
+                on_progress('chunking', 0)
+            batch.append(chunk)
+            if len(batch) >= self.INDEX_BATCH_SIZE:
+                self._index_chunk_batch(doc_id, batch, position, on_progress)
+                position += len(batch)
+                batch = []
+        if batch:
+            self._index_chunk_batch(doc_id, batch, position, on_progress)
+
+    def _index_chunk_batch(
+        self,
+        doc_id: int,
+        chunks: List[str],
+        start_position: int,
+        on_progress: Optional[Callable[[str, int], None]] = None
+    ):
+        if on_progress is not None:
+            on_progress('embedding', start_position)
+        chunk_ids = self.database.add_chunks(doc_id, chunks, start_position)
+        embeddings = self.embedding_cache.encode(self.model.encode, self.embedding_key, chunks)
+        with self._index_lock:
+            self.index.add(chunk_ids, embeddings, document_id=doc_id)
+            if self.lexical_index is not None:
+                self.lexical_index.add(chunk_ids, chunks)
+        if on_progress is not None:
+            on_progress('embedding', start_position + len(chunks))
+
+    def _index_document(self, doc_id: int, text: str):
+        """Заново разбивает сохраненный документ на чанки и индексирует их"""
+        self.database.delete_chunks(doc_id)
+        self._index_chunks(doc_id, iter_chunks([text], self.chunk_size, self.chunk_overlap))
+        self.database.update_chunk_count(doc_id)
+        with self._index_lock:
+            self.indexed_hashes[doc_id] = content_hash(text)
+            self._document_chunks.pop(doc_id, None)
+
+    def initialize_index(self):
+        """Загружает индекс с диска и доиндексирует только измененные документы"""
+        if not self._load_index():
+            self.index = self._new_index()
+            self.indexed_hashes = {}
+
+        hashes = self.database.get_document_hashes()
+        if not hashes:
             print("База данных пуста")
-            return
 
-        # Создаем эмбеддинги для всех текстов
-        embeddings = self.model.encode(self.texts)
-        
-        # Создаем и настраиваем индекс FAISS
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(embeddings.astype('float32'))
-        
-        conn.close()
-
-    async def process_query(self, query: str) -> str:
-        """Обрабатывает запрос пользователя"""
-        if not self.index or not self.texts:
+        # Оставляем только документы, которые не изменились с прошлой индексации
+        self.indexed_hashes = {
+            doc_id: h for doc_id, h in self.indexed_hashes.items() if hashes.get(doc_id) == h
+        }
+
+        # Убираем векторы удаленных и измененных документов
+        valid_chunk_ids = set(self.database.get_chunk_ids(self.indexed_hashes.keys()))
+        stale = [chunk_id for chunk_id in self.index.ids() if chunk_id not in valid_chunk_ids]
+        self.index.remove(stale)
+        lexical_changed = self._sync_lexical_index(valid_chunk_ids)
+
+        # Создаем эмбеддинги только для новых и измененных документов
+        missing = [doc_id for doc_id in hashes if doc_id not in self.indexed_hashes]
+        if missing:
+            print(f"Индексация документов: {len(missing)}")
+        for doc_id in missing:
+            text = self.database.get_texts([doc_id])[doc_id]
+            self._index_document(doc_id, text)
+
+        if stale or missing or lexical_changed:
+            self.save_index()
+
+    def _sync_lexical_index(self, valid_chunk_ids: Set[int]) -> bool:
+        """Приводит лексический индекс к набору чанков векторного индекса
+
+        Недостающие чанки (например, после включения гибридного поиска)
+        добавляются из базы данных без пересчета эмбеддингов. Возвращает
+        True, если индекс изменился.
+        """
+        if not self.hybrid_search:
+            return False
+        if self.lexical_index is None:
+            self.lexical_index = LexicalIndex.load(self.lexical_path, k1=Config.BM25_K1, b=Config.BM25_B)
+            if self.lexical_index is None:
+                self.lexical_index = LexicalIndex(Config.BM25_K1, Config.BM25_B)
+
+        indexed = set(self.lexical_index.ids())
+        removed = self.lexical_index.remove(indexed - valid_chunk_ids)
+        missing = sorted(valid_chunk_ids - indexed)
+        if missing:
+            print(f"Построение лексического индекса: {len(missing)} чанков")
+        for i in range(0, len(missing), self.INDEX_BATCH_SIZE):
+            chunks = self.database.get_chunks(missing[i:i + self.INDEX_BATCH_SIZE])
+            self.lexical_index.add(chunks.keys(), (chunk["text"] for chunk in chunks.values()))
+        return bool(removed or missing)
+
+    def ingest_document(
+        self,
+        parts: Iterable[str],
+        title: str = None,
+        file_type: str = None,
+        job_id: Optional[int] = None,
+        on_progress: Optional[Callable[[str, int], None]] = None
+    ) -> int:
+        """Потоково добавляет новый документ в базу данных и индекс, возвращает его ID
+
+        parts - части текста (страницы или строки), которые по мере чтения
+        разбиваются на чанки и индексируются, не дожидаясь конца документа.
+        ID документа записывается в задачу загрузки job_id в той же транзакции,
+        что создает документ, поэтому после сбоя задача знает, что откатить.
+        Для PDF части - это страницы, их число сохраняется как page_count.
+        При ошибке документ удаляется вместе с уже проиндексированными чанками.
+        """
+        doc_id = self.database.add_document(text="", title=title, file_type=file_type, job_id=job_id)
+        hasher = hashlib.sha256()
+        collected = []
+
+        def read_parts():
+            for part in parts:
+                hasher.update(part.encode('utf-8'))
+                collected.append(part)
+                yield part
+
+        try:
+            self._index_chunks(
+                doc_id, iter_chunks(read_parts(), self.chunk_size, self.chunk_overlap), on_progress
+            )
+            text_hash = hasher.hexdigest()
+            page_count = len(collected) if file_type == 'pdf' else None
+            self.database.update_document_text(doc_id, "".join(collected), text_hash, page_count)
+        except Exception:
+            self.delete_document(doc_id)
+            raise
+
+        with self._index_lock:
+            self.indexed_hashes[doc_id] = text_hash
+            self._document_chunks.pop(doc_id, None)
+            self.save_index()
+        self.answer_cache.invalidate_documents([doc_id])
+        return doc_id
+
+    def delete_document(self, doc_id: int) -> bool:
+        """Удаляет документ из базы данных и его векторы из индекса"""
+        chunk_ids = self.database.get_chunk_ids([doc_id])
+        deleted = self.database.delete_document(doc_id)
+        with self._index_lock:
+            if self.index is not None:
+                self.index.remove(chunk_ids)
+            if self.lexical_index is not None:
+                self.lexical_index.remove(chunk_ids)
+            self._document_chunks.pop(doc_id, None)
+            if self.indexed_hashes.pop(doc_id, None) is not None:
+                self.save_index()
+        self.answer_cache.invalidate_documents([doc_id])
+        return deleted
+
+    async def process_query(
+        self,
+        query: str,
+        on_queued: Optional[Callable[[int], Awaitable[None]]] = None,
+        on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+        document_ids: Optional[Iterable[int]] = None
+    ) -> str:
+        """Обрабатывает запрос пользователя в пуле инференса
+
+        Если все воркеры заняты, перед ожиданием вызывается on_queued
+        с позицией запроса в очереди. Если модель умеет отдавать ответ
+        потоком, on_partial получает накопленный текст после каждого фрагмента.
+        document_ids ограничивает поиск указанными книгами.
+        """
+        await self.wait_ready()
+        if self.index is None or self.index.ntotal == 0:
             return "Извините, база данных документов пуста или не инициализирована."
 
-        # Создаем эмбеддинг для запроса
-        query_embedding = self.model.encode([query])[0]
-        
-        # Ищем ближайшие документы
-        k = 3  # количество ближайших документов
-        distances, indices = self.index.search(
-            query_embedding.reshape(1, -1).astype('float32'), 
-            k
+        if self.pool.saturated and on_queued is not None:
+            await on_queued(self.pool.queued + 1)
+
+        scope = tuple(sorted(set(document_ids))) if document_ids is not None else None
+        query_embedding, chunks = await self._retrieval_batcher.submit((query, scope))
+        if scope is not None and not chunks:
+            return "Извините, в выбранных книгах не найдено подходящих фрагментов."
+        chunk_ids = [chunk["id"] for chunk in chunks]
+
+        # Повторные и почти совпадающие вопросы по тем же фрагментам берем из кеша
+        cached = self.answer_cache.get(query, chunk_ids, query_embedding)
+        if cached is not None:
+            return cached
+
+        # Собираем контекст из найденных фрагментов в порядке релевантности
+        context = await self.pool.run(self.build_context, query, chunks)
+
+        # OpenAI всегда отвечает потоком через асинхронный клиент, в батчи
+        # генерации попадает только локальная модель без потоковой выдачи
+        llm = await self.current_llm()
+        if llm.supports_streaming:
+            response = await self._stream_answer(llm, query, context, on_partial)
+        else:
+            response = await self._generation_batcher.submit((query, context))
+        if response is None:
+            return "Извините, произошла ошибка при генерации ответа. Попробуйте позже."
+
+        self.answer_cache.put(
+            query, chunk_ids, query_embedding, response,
+            document_ids={chunk["document_id"] for chunk in chunks}
         )
-        
-        # Собираем контекст из найденных документов
-        context = "\n\n".join([self.texts[idx] for idx in indices[0] if idx < len(self.texts)])
-        
-        # Генерируем ответ с помощью LLM
+        return response
+
+    def build_context(self, query: str, chunks: List[Dict[str, Any]]) -> str:
+        """Контекст для вопроса, который вместе с ним помещается во вход языковой модели"""
+        llm = self.llm
+        context, _ = self.context_builder.build(chunks, llm, llm.context_budget(query))
+        return context
+
+    async def _stream_answer(
+        self,
+        llm: LLM,
+        query: str,
+        context: str,
+        on_partial: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Optional[str]:
+        """Потоковая генерация ответа, при ошибке возвращает None
+
+        Локальная модель генерирует ответ в пуле инференса, текст передается
+        в цикл событий по мере появления токенов.
+        """
+        text = ""
+        try:
+            async for delta in llm.stream_response(query, context, runner=self.pool.run):
+                text += delta
+                if on_partial is not None:
+                    await on_partial(text)
+        except Exception as e:
+            print(f"Ошибка при генерации ответа: {e}")
+            return None
+        return text
+
+    def _retrieve_batch(
+        self, items: List[Tuple[str, Optional[Tuple[int, ...]]]]
+    ) -> List[Tuple[np.ndarray, List[Dict[str, Any]]]]:
+        """Поиск фрагментов для батча запросов, выполняется в потоке пула
+
+        Элемент батча - запрос и ID документов, которыми ограничен поиск (None - все).
+        """
+        queries = [query for query, _ in items]
+        scopes = [
+            self._scope_chunk_ids(document_ids) if document_ids is not None else None
+            for _, document_ids in items
+        ]
+        # Создаем эмбеддинги для всех запросов одним вызовом модели
+        query_embeddings = self.model.encode(queries)
+
+        # Ищем ближайшие чанки; при переранжировании сначала берем больше кандидатов
+        k = Config.RETRIEVAL_TOP_K
+        candidates = max(k, Config.RERANK_CANDIDATES) if self.rerank else k
+        with self._index_lock:
+            if self.lexical_index is not None:
+                ranked_ids = self._hybrid_search(queries, query_embeddings, candidates, scopes)
+            else:
+                ranked_ids = self._dense_search(query_embeddings, candidates, scopes)
+
+        chunks = self.database.get_chunks({chunk_id for row in ranked_ids for chunk_id in row})
+        ranked_ids = [[chunk_id for chunk_id in row if chunk_id in chunks] for row in ranked_ids]
+        if self.rerank:
+            # Если бюджет времени исчерпан, неоцененные кандидаты остаются в исходном порядке
+            ranked_ids, _ = rerank(
+                registry.get('reranker'),
+                queries,
+                ranked_ids,
+                {chunk_id: chunk["text"] for chunk_id, chunk in chunks.items()},
+                batch_size=Config.RERANK_BATCH_SIZE,
+                budget=Config.RERANK_BUDGET_MS / 1000
+            )
+        return [
+            (embedding, [chunks[chunk_id] for chunk_id in row[:k]])
+            for embedding, row in zip(query_embeddings, ranked_ids)
+        ]
+
+    def _scope_chunk_ids(self, document_ids: Tuple[int, ...]) -> List[int]:
+        """ID чанков документов области поиска, список чанков документа кешируется
+
+        Кеш читается и заполняется под блокировкой индекса, как и сбрасывается
+        при загрузке и удалении документа, и только для полностью
+        проиндексированных документов: иначе список чанков, прочитанный во
+        время загрузки книги, мог бы остаться в кеше после ее завершения.
+        """
+        chunk_ids = []
+        with self._index_lock:
+            for doc_id in document_ids:
+                cached = self._document_chunks.get(doc_id)
+                if cached is None:
+                    cached = self.database.get_chunk_ids([doc_id])
+                    if doc_id in self.indexed_hashes:
+                        self._document_chunks[doc_id] = cached
+                chunk_ids.extend(cached)
+        return chunk_ids
+
+    def _dense_search(
+        self, query_embeddings: np.ndarray, k: int, allowed: List[Optional[List[int]]]
+    ) -> List[List[int]]:
+        """Векторный поиск, возвращает ID чанков
+
+        Запросы без ограничений ищутся одним батчем, остальные - только среди
+        чанков из allowed.
+        """
+        results: List[List[int]] = [[] for _ in allowed]
+        unfiltered = [i for i, ids in enumerate(allowed) if ids is None]
+        if unfiltered:
+            _, ids = self.index.search(query_embeddings[unfiltered], k)
+            for i, row in zip(unfiltered, ids):
+                results[i] = [int(chunk_id) for chunk_id in row if chunk_id != -1]
+        for i, chunk_ids in enumerate(allowed):
+            if chunk_ids:
+                _, ids = self.index.search(query_embeddings[i], k, ids=chunk_ids)
+                results[i] = [int(chunk_id) for chunk_id in ids[0] if chunk_id != -1]
+        return results
+
+    def _hybrid_search(
+        self,
+        queries: List[str],
+        query_embeddings: np.ndarray,
+        k: int,
+        scopes: List[Optional[List[int]]]
+    ) -> List[List[int]]:
+        """Векторный поиск и BM25 с объединением списков через RRF, возвращает ID чанков
+
+        Оба поиска ограничены чанками области запроса, если она задана. Когда
+        область (или весь индекс) велика, векторный поиск идет только среди
+        лучших по BM25 чанков, если слова запроса нашлись хотя бы в
+        RETRIEVAL_CANDIDATES чанках; иначе (например, запрос - перефразировка)
+        ищем по всей области.
+        """
+        candidates = max(k, Config.RETRIEVAL_CANDIDATES)
+        allowed = []
+        lexical = []
+        for query, scope in zip(queries, scopes):
+            size = self.index.ntotal if scope is None else len(scope)
+            prefilter = 0 < Config.LEXICAL_PREFILTER_MIN_CHUNKS <= size
+            lexical_k = max(Config.LEXICAL_PREFILTER_SIZE, candidates) if prefilter else candidates
+            lexical_ids = [chunk_id for chunk_id, _ in self.lexical_index.search(query, lexical_k, ids=scope)]
+            lexical.append(lexical_ids[:candidates])
+            allowed.append(lexical_ids if prefilter and len(lexical_ids) >= candidates else scope)
+
+        dense = self._dense_search(query_embeddings, candidates, allowed)
+        return [
+            reciprocal_rank_fusion([dense_ids, lexical_ids], Config.RRF_K)[:k]
+            for dense_ids, lexical_ids in zip(dense, lexical)
+        ]
+
+    def _generate_batch(self, items: List[Tuple[str, str]]) -> List[Optional[str]]:
+        """Генерация ответов для батча запросов, выполняется в потоке пула
+
+        Локальная модель отвечает на весь батч одним вызовом generate, поэтому
+        при ее ошибке None возвращается для всех запросов батча. Запросы к OpenAI
+        выполняются параллельно, и None получают только те, что завершились ошибкой.
+        """
+        queries = [query for query, _ in items]
+        contexts = [context for _, context in items]
         try:
-            response = self.llm.generate_response(query, context)
-            return response
+            return self.llm.generate_responses(queries, contexts)
         except Exception as e:
             print(f"Ошибка при генерации ответа: {e}")
-            return "Извините, произошла ошибка при генерации ответа. Попробуйте позже." 
\ No newline at end of file
+            return [None] * len(items)
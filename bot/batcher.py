@@ -0,0 +1,69 @@
+from typing import Any, Callable, List, Optional, Set, Tuple
+import asyncio
+from .inference_pool import InferencePool
+
+
+class MicroBatcher:
+    """Объединяет одновременные запросы в батчи для одного вызова модели
+
+    Запросы копятся до max_batch_size штук или max_wait_ms миллисекунд
+    с момента первого запроса в батче, после чего batch_fn выполняется
+    в пуле инференса и каждый ожидающий получает свой результат.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        pool: InferencePool,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10
+    ):
+        self.batch_fn = batch_fn
+        self.pool = pool
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        """Ставит запрос в текущий батч и ждет его результата"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """Отправляет накопленный батч на выполнение"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[Any, asyncio.Future]]):
+        """Выполняет батч и раздает результаты ожидающим"""
+        items = [item for item, _ in batch]
+        try:
+            results = await self.pool.run(self.batch_fn, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -18,6 +18,9 @@ class Config:
     # Директория для хранения книг
     BOOKS_DIR = os.getenv('BOOKS_DIR', 'books')
     
+    # Файл базы данных SQLite; индексы (books.faiss, books.faiss.N, books.bm25) хранятся рядом с ним
+    DB_PATH = os.getenv('DB_PATH', 'books.db')
+    
     # Модель для эмбеддингов
     EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'sentence-transformers/all-mpnet-base-v2')
     
@@ -27,6 +30,105 @@ class Config:
     # Количество ближайших документов для поиска
     TOP_K = int(os.getenv('TOP_K', '3'))
     
+    # Размер чанка документа и перекрытие соседних чанков (в символах)
+    CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', '1000'))
+    CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', '200'))
+    
+    # Потоки асинхронного интерфейса базы данных (await database.aio...)
+    DB_WORKERS = int(os.getenv('DB_WORKERS', '4'))
+    
+    # Количество книг на одной странице списка /books
+    BOOKS_PAGE_SIZE = int(os.getenv('BOOKS_PAGE_SIZE', '10'))
+    
+    # Количество воркеров фоновой загрузки документов
+    INGESTION_WORKERS = int(os.getenv('INGESTION_WORKERS', '1'))
+    
+    # Параллельное извлечение текста PDF: число процессов, страниц на задачу
+    # и минимальный размер файла, начиная с которого включается пул процессов
+    PDF_WORKERS = int(os.getenv('PDF_WORKERS', '2'))
+    PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '16'))
+    PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '64'))
+    
+    # Количество одновременно выполняемых задач инференса (эмбеддинги, поиск, генерация)
+    INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '2'))
+    
+    # Тип векторного индекса: flat, ivf_flat, hnsw или ivf_pq
+    INDEX_MODE = os.getenv('INDEX_MODE', 'flat')
+    
+    # Параметры построения и поиска для приближенных индексов
+    INDEX_PARAMS = {
+        'nlist': int(os.getenv('INDEX_NLIST', '256')),
+        'nprobe': int(os.getenv('INDEX_NPROBE', '16')),
+        'hnsw_m': int(os.getenv('INDEX_HNSW_M', '32')),
+        'ef_construction': int(os.getenv('INDEX_EF_CONSTRUCTION', '200')),
+        'ef_search': int(os.getenv('INDEX_EF_SEARCH', '64')),
+        'pq_m': int(os.getenv('INDEX_PQ_M', '16')),
+        'pq_nbits': int(os.getenv('INDEX_PQ_NBITS', '8')),
+        'train_sample': int(os.getenv('INDEX_TRAIN_SAMPLE', '50000')),
+        'exact_filter_max': int(os.getenv('INDEX_EXACT_FILTER_MAX', '20000')),
+    }
+    
+    # Число шардов векторного индекса: при 2 и больше книги распределяются между
+    # процессами-шардами, поиск идет во всех параллельно; 1 - индекс в процессе бота
+    INDEX_SHARDS = int(os.getenv('INDEX_SHARDS', '1'))
+    # Допустимый разрыв размеров шардов (доля от среднего) до переноса книг
+    INDEX_REBALANCE_TOLERANCE = float(os.getenv('INDEX_REBALANCE_TOLERANCE', '0.2'))
+    
+    # Гибридный поиск: BM25 по словам вместе с векторным поиском, списки
+    # объединяются через reciprocal rank fusion с константой RRF_K
+    HYBRID_SEARCH = os.getenv('HYBRID_SEARCH', 'true').lower() == 'true'
+    BM25_K1 = float(os.getenv('BM25_K1', '1.2'))
+    BM25_B = float(os.getenv('BM25_B', '0.75'))
+    RRF_K = int(os.getenv('RRF_K', '60'))
+    
+    # Сколько лучших фрагментов передается сборщику контекста (в контекст попадают те,
+    # что помещаются в бюджет токенов модели) и кандидатов каждого вида поиска для объединения
+    RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '8'))
+    RETRIEVAL_CANDIDATES = int(os.getenv('RETRIEVAL_CANDIDATES', '20'))
+    
+    # Переранжирование кросс-энкодером: RERANK_CANDIDATES кандидатов поиска оцениваются
+    # батчами по RERANK_BATCH_SIZE, пока не истечет RERANK_BUDGET_MS миллисекунд
+    RERANK = os.getenv('RERANK', 'true').lower() == 'true'
+    RERANK_MODEL = os.getenv('RERANK_MODEL', 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')
+    RERANK_MAX_LENGTH = int(os.getenv('RERANK_MAX_LENGTH', '256'))
+    RERANK_CANDIDATES = int(os.getenv('RERANK_CANDIDATES', '50'))
+    RERANK_BATCH_SIZE = int(os.getenv('RERANK_BATCH_SIZE', '16'))
+    RERANK_BUDGET_MS = float(os.getenv('RERANK_BUDGET_MS', '300'))
+    
+    # Начиная с LEXICAL_PREFILTER_MIN_CHUNKS чанков векторный поиск идет только среди
+    # LEXICAL_PREFILTER_SIZE лучших по BM25 чанков, 0 - без предварительного отбора
+    LEXICAL_PREFILTER_MIN_CHUNKS = int(os.getenv('LEXICAL_PREFILTER_MIN_CHUNKS', '100000'))
+    LEXICAL_PREFILTER_SIZE = int(os.getenv('LEXICAL_PREFILTER_SIZE', '5000'))
+    
+    # Сборка контекста: размер кеша числа токенов чанков и порог сходства
+    # (доля общих шинглов), начиная с которого фрагмент считается повтором
+    CONTEXT_TOKEN_CACHE_SIZE = int(os.getenv('CONTEXT_TOKEN_CACHE_SIZE', '50000'))
+    CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv('CONTEXT_DUPLICATE_THRESHOLD', '0.8'))
+    
+    # Кеш эмбеддингов чанков: максимальное число записей, 0 - без ограничения
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '1000000'))
+    
+    # Микробатчинг одновременных запросов: максимальный размер батча и время ожидания
+    BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '8'))
+    BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', '10'))
+    
+    # Кеш ответов: размер, время жизни записи (сек) и порог косинусной близости запросов
+    ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '1000'))
+    ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', '3600'))
+    ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.95'))
+    
+    # История сообщений: размер и интервал (сек) пакетной записи,
+    # лимит сообщений на пользователя и срок хранения (дней), 0 - без ограничения
+    HISTORY_FLUSH_SIZE = int(os.getenv('HISTORY_FLUSH_SIZE', '32'))
+    HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', '1.0'))
+    HISTORY_MAX_MESSAGES = int(os.getenv('HISTORY_MAX_MESSAGES', '200'))
+    HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '30'))
+    
+    # Потоковый ответ: минимальный интервал (сек) между редактированиями сообщения
+    # и минимальный прирост текста (символов) для очередного редактирования
+    STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))
+    STREAM_EDIT_MIN_CHARS = int(os.getenv('STREAM_EDIT_MIN_CHARS', '20'))
+    
     # Использовать локальную модель
     USE_LOCAL_MODEL = not bool(OPENAI_API_KEY)
     
@@ -36,4 +138,6 @@ class Config:
             raise ValueError("TELEGRAM_BOT_TOKEN не найден в переменных окружения")
             
         # Создаем директорию для книг, если она не существует
-        Path(self.BOOKS_DIR).mkdir(exist_ok=True) 
\ No newline at end of file
+        Path(self.BOOKS_DIR).mkdir(exist_ok=True)
+        # И директорию данных, если база лежит не в корне проекта
+        Path(self.DB_PATH).parent.mkdir(parents=True, exist_ok=True) 
\ No newline at end of file
@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Set, Tuple
+import threading
+
+if TYPE_CHECKING:
+    from llm import LLM
+
+SEPARATOR = "\n\n"
+SHINGLE_SIZE = 5  # слов в шингле для поиска почти совпадающих фрагментов
+MAX_OVERLAP_WORDS = 200
+
+
+def _shingles(text: str) -> Set[int]:
+    words = text.lower().split()
+    return {hash(tuple(words[i:i + SHINGLE_SIZE])) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+
+
+def strip_overlap(previous: str, text: str) -> str:
+    """Убирает из начала text слова, которыми заканчивается previous
+
+    Соседние чанки документа перекрываются на несколько слов (CHUNK_OVERLAP),
+    при склейке перекрытие не должно повторяться.
+    """
+    previous_words, words = previous.split(), text.split()
+    for size in range(min(len(previous_words), len(words), MAX_OVERLAP_WORDS), 0, -1):
+        if previous_words[-size:] == words[:size]:
+            return " ".join(words[size:])
+    return text
+
+
+class ContextBuilder:
+    """Собирает контекст ответа из найденных фрагментов в пределах бюджета токенов
+
+    Фрагменты просматриваются в порядке релевантности: повторы и почти
+    совпадающие фрагменты (например, одна книга, загруженная дважды)
+    отбрасываются, остальные добавляются, пока помещаются в бюджет.
+    Выбранные соседние чанки одного документа склеиваются в один отрывок
+    без повторения перекрытия. Число токенов чанка кешируется по ID чанка
+    и токенизатору, поэтому популярные чанки токенизируются один раз.
+    """
+
+    def __init__(self, cache_size: int = 50000, duplicate_threshold: float = 0.8):
+        self.cache_size = cache_size
+        self.duplicate_threshold = duplicate_threshold
+        self._token_counts: "OrderedDict[Tuple[str, int], int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count_tokens(self, llm: 'LLM', chunk: Dict[str, Any]) -> int:
+        """Число токенов чанка с кешированием"""
+        key = (llm.tokenizer_key, chunk["id"])
+        with self._lock:
+            count = self._token_counts.get(key)
+            if count is not None:
+                self._token_counts.move_to_end(key)
+                return count
+
+        count = llm.count_tokens(chunk["text"])
+        with self._lock:
+            self._token_counts[key] = count
+            if len(self._token_counts) > self.cache_size:
+                self._token_counts.popitem(last=False)
+        return count
+
+    def _deduplicate(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Отбрасывает фрагменты, почти совпадающие с более релевантными"""
+        kept, kept_shingles = [], []
+        for chunk in chunks:
+            shingles = _shingles(chunk["text"])
+            if any(
+                len(shingles & other) / len(shingles | other) >= self.duplicate_threshold
+                for other in kept_shingles
+            ):
+                continue
+            kept.append(chunk)
+            kept_shingles.append(shingles)
+        return kept
+
+    @staticmethod
+    def _merge_adjacent(chunks: List[Dict[str, Any]]) -> List[str]:
+        """Склеивает соседние чанки одного документа, отрывки идут в порядке лучшего чанка"""
+        rank = {chunk["id"]: i for i, chunk in enumerate(chunks)}
+        ordered = sorted(chunks, key=lambda chunk: (chunk["document_id"], chunk["position"]))
+
+        runs: List[List[Dict[str, Any]]] = []
+        for chunk in ordered:
+            previous = runs[-1][-1] if runs else None
+            if (
+                previous is not None
+                and previous["document_id"] == chunk["document_id"]
+                and previous["position"] + 1 == chunk["position"]
+            ):
+                runs[-1].append(chunk)
+            else:
+                runs.append([chunk])
+
+        runs.sort(key=lambda run: min(rank[chunk["id"]] for chunk in run))
+        passages = []
+        for run in runs:
+            text = run[0]["text"]
+            for previous, chunk in zip(run, run[1:]):
+                text += " " + strip_overlap(previous["text"], chunk["text"])
+            passages.append(text)
+        return passages
+
+    def build(self, chunks: List[Dict[str, Any]], llm: 'LLM', budget: int) -> Tuple[str, List[int]]:
+        """Контекст из фрагментов (в порядке релевантности) не длиннее budget токенов
+
+        Возвращает текст контекста и ID вошедших в него чанков. Если даже
+        самый релевантный фрагмент не помещается, он обрезается по бюджету.
+        """
+        if budget <= 0 or not chunks:
+            return "", []
+
+        separator_tokens = llm.count_tokens(SEPARATOR)
+        selected, used = [], 0
+        for chunk in self._deduplicate(chunks):
+            cost = self.count_tokens(llm, chunk) + (separator_tokens if selected else 0)
+            if used + cost <= budget:
+                selected.append(chunk)
+                used += cost
+
+        if not selected:
+            best = chunks[0]
+            return llm.truncate_tokens(best["text"], budget), [best["id"]]
+
+        context = SEPARATOR.join(self._merge_adjacent(selected))
+        # На стыках склеенных частей токенизация может дать лишний токен,
+        # поэтому вплотную к бюджету длина контекста проверяется целиком
+        if used + len(selected) > budget and llm.count_tokens(context) > budget:
+            context = llm.truncate_tokens(context, budget)
+        return context, [chunk["id"] for chunk in selected]
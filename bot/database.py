@@ -1,61 +1,471 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import asyncio
+import hashlib
 import sqlite3
-from datetime import datetime
+import threading
+
+# Максимальное число параметров в одном запросе IN (...)
+SQL_BATCH_SIZE = 500
+
+
+def content_hash(text: str) -> str:
+    """Хеш содержимого текста: актуальность индекса документа и ключ кеша эмбеддингов"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class ConnectionPool:
+    """Постоянные соединения с SQLite, по одному на поток
+
+    Соединение открывается при первом обращении из потока и переиспользуется,
+    поэтому кеш подготовленных выражений sqlite3 работает между вызовами.
+    База переводится в режим WAL: читатели не блокируют писателя, а
+    конкурирующие писатели ждут busy_timeout вместо ошибки "database is locked".
+    """
+
+    PRAGMAS = (
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA busy_timeout = 5000",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA cache_size = -16000",
+    )
+
+    def __init__(self, db_path: str, cached_statements: int = 256):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=5.0,
+                check_same_thread=False,  # закрываются все соединения из close_all
+                cached_statements=self.cached_statements
+            )
+            for pragma in self.PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def cursor(self) -> Iterator[sqlite3.Cursor]:
+        """Курсор в транзакции: фиксация при успехе, откат при исключении"""
+        conn = self.connection()
+        cursor = conn.cursor()
+        try:
+            yield cursor
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def close_all(self):
+        """Закрывает соединения всех потоков"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+class AsyncDatabase:
+    """Асинхронный интерфейс к Database
+
+    Методы Database вызываются через await и выполняются в отдельном пуле
+    потоков, не блокируя цикл событий:
+        books, has_prev, has_next = await database.aio.get_documents_page(limit=10)
+    """
+
+    def __init__(self, database: 'Database', max_workers: int = 4):
+        self._database = database
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+
+    def __getattr__(self, name: str):
+        method = getattr(self._database, name)
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(method, *args, **kwargs))
+
+        return call
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
 
 class Database:
-    def __init__(self, db_path="books.db"):
+    def __init__(self, db_path="books.db", async_workers: int = 4):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path)
+        self.aio = AsyncDatabase(self, async_workers)
         self.init_db()
 
+    def close(self):
+        """Останавливает асинхронный пул, переносит WAL в файл базы и закрывает соединения"""
+        self.aio.shutdown()
+        with self.pool.cursor() as cursor:
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.pool.close_all()
+
     def init_db(self):
         """Инициализация базы данных"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.pool.cursor() as cursor:
+            # Создаем таблицу для документов
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    text TEXT NOT NULL,
+                    title TEXT,
+                    file_type TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Таблица чанков документов, по которым строится векторный индекс
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    text TEXT NOT NULL
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_document_id ON chunks (document_id)")
+
+            # Очередь фоновой загрузки документов
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    chat_id INTEGER NOT NULL,
+                    message_id INTEGER,
+                    file_path TEXT NOT NULL,
+                    title TEXT,
+                    file_type TEXT,
+                    state TEXT NOT NULL,
+                    pages_done INTEGER NOT NULL DEFAULT 0,
+                    pages_total INTEGER,
+                    chunks_done INTEGER NOT NULL DEFAULT 0,
+                    document_id INTEGER,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_user_id ON ingestion_jobs (user_id)")
+
+            # Полка пользователя: книги, которыми ограничен поиск по его вопросам
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS shelves (
+                    user_id INTEGER NOT NULL,
+                    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+                    PRIMARY KEY (user_id, document_id)
+                )
+            """)
+
+            # Хеш содержимого добавлен позже, поэтому колонка создается миграцией
+            cursor.execute("PRAGMA table_info(documents)")
+            columns = {row[1] for row in cursor.fetchall()}
+            if 'content_hash' not in columns:
+                cursor.execute("ALTER TABLE documents ADD COLUMN content_hash TEXT")
+
+            # Метаданные для списка книг хранятся отдельно, чтобы не читать текст
+            stats_added = 'size_bytes' not in columns
+            if stats_added:
+                cursor.execute("ALTER TABLE documents ADD COLUMN size_bytes INTEGER")
+                cursor.execute("ALTER TABLE documents ADD COLUMN page_count INTEGER")
+                cursor.execute("ALTER TABLE documents ADD COLUMN chunk_count INTEGER")
 
-        # Создаем таблицу для документов
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS documents (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                text TEXT NOT NULL,
-                title TEXT,
-                file_type TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            # Заполняем хеши для документов, загруженных до миграции
+            cursor.execute("SELECT id, text FROM documents WHERE content_hash IS NULL")
+            missing = [(content_hash(text), doc_id) for doc_id, text in cursor.fetchall()]
+            if missing:
+                cursor.executemany("UPDATE documents SET content_hash = ? WHERE id = ?", missing)
+
+            # Размер и число чанков документов, загруженных до миграции
+            if stats_added:
+                cursor.execute("""
+                    UPDATE documents SET
+                        size_bytes = length(CAST(text AS BLOB)),
+                        chunk_count = (SELECT COUNT(*) FROM chunks WHERE document_id = documents.id)
+                """)
+
+    def add_document(
+        self, text: str, title: str = None, file_type: str = None, job_id: Optional[int] = None
+    ) -> int:
+        """Добавление нового документа, возвращает его ID
+
+        Если задан job_id, ID документа записывается в задачу загрузки
+        в той же транзакции.
+        """
+        with self.pool.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO documents (text, title, file_type, content_hash, size_bytes, chunk_count)
+                VALUES (?, ?, ?, ?, ?, 0)
+                """,
+                (text, title, file_type, content_hash(text), len(text.encode('utf-8')))
             )
-        """)
+            doc_id = cursor.lastrowid
+            if job_id is not None:
+                cursor.execute(
+                    "UPDATE ingestion_jobs SET document_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (doc_id, job_id)
+                )
+        return doc_id
 
-        conn.commit()
-        conn.close()
+    # Колонки списка книг: все, кроме текста документа
+    DOCUMENT_META_FIELDS = (
+        'id', 'title', 'file_type', 'created_at', 'size_bytes', 'page_count', 'chunk_count'
+    )
 
-    def add_document(self, text: str, title: str = None, file_type: str = None):
-        """Добавление нового документа"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def get_documents_page(
+        self,
+        after_id: Optional[int] = None,
+        before_id: Optional[int] = None,
+        limit: int = 10
+    ) -> Tuple[List[Dict[str, Any]], bool, bool]:
+        """Страница метаданных документов по ID (keyset-пагинация)
 
-        cursor.execute(
-            "INSERT INTO documents (text, title, file_type) VALUES (?, ?, ?)",
-            (text, title, file_type)
-        )
+        after_id - следующая страница после документа, before_id - предыдущая
+        перед ним, без обоих - первая. Возвращает документы по возрастанию ID
+        и признаки наличия предыдущей и следующей страниц.
+        """
+        fields = ", ".join(self.DOCUMENT_META_FIELDS)
+        with self.pool.cursor() as cursor:
+            cursor.row_factory = sqlite3.Row
+            # Лишняя строка показывает, есть ли документы дальше в направлении чтения
+            if before_id is not None:
+                cursor.execute(
+                    f"SELECT {fields} FROM documents WHERE id < ? ORDER BY id DESC LIMIT ?",
+                    (before_id, limit + 1)
+                )
+            else:
+                cursor.execute(
+                    f"SELECT {fields} FROM documents WHERE id > ? ORDER BY id LIMIT ?",
+                    (after_id or 0, limit + 1)
+                )
+            documents = [dict(row) for row in cursor.fetchall()]
 
-        conn.commit()
-        conn.close()
+        has_more = len(documents) > limit
+        documents = documents[:limit]
+        if before_id is not None:
+            return documents[::-1], has_more, True
+        return documents, after_id is not None, has_more
 
-    def get_all_documents(self):
-        """Получение всех документов"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def get_document_hashes(self) -> Dict[int, str]:
+        """Получение хешей содержимого всех документов"""
+        with self.pool.cursor() as cursor:
+            cursor.execute("SELECT id, content_hash FROM documents")
+            hashes = dict(cursor.fetchall())
+        return hashes
+
+    def get_texts(self, doc_ids: Iterable[int]) -> Dict[int, str]:
+        """Получение текстов документов по списку ID"""
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return {}
 
-        cursor.execute("SELECT * FROM documents")
-        documents = cursor.fetchall()
+        with self.pool.cursor() as cursor:
+            # Разбиваем список, чтобы не упереться в лимит параметров SQLite
+            texts = {}
+            for i in range(0, len(doc_ids), SQL_BATCH_SIZE):
+                batch = doc_ids[i:i + SQL_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+                cursor.execute(f"SELECT id, text FROM documents WHERE id IN ({placeholders})", batch)
+                texts.update(cursor.fetchall())
+        return texts
 
-        conn.close()
-        return documents
+    def update_document_text(self, doc_id: int, text: str, text_hash: str, page_count: Optional[int] = None):
+        """Сохранение текста документа, собранного после потоковой обработки, и его метаданных"""
+        with self.pool.cursor() as cursor:
+            cursor.execute(
+                "UPDATE documents SET text = ?, content_hash = ?, size_bytes = ?, page_count = ? WHERE id = ?",
+                (text, text_hash, len(text.encode('utf-8')), page_count, doc_id)
+            )
+        self.update_chunk_count(doc_id)
+
+    def update_chunk_count(self, doc_id: int):
+        """Пересчет числа чанков документа после индексации"""
+        with self.pool.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE documents SET chunk_count = (SELECT COUNT(*) FROM chunks WHERE document_id = ?)
+                WHERE id = ?
+                """,
+                (doc_id, doc_id)
+            )
+
+    def add_chunks(self, doc_id: int, chunks: List[str], start_position: int = 0) -> List[int]:
+        """Добавление чанков документа, возвращает их ID в порядке следования"""
+        with self.pool.cursor() as cursor:
+            chunk_ids = []
+            for position, chunk in enumerate(chunks, start=start_position):
+                cursor.execute(
+                    "INSERT INTO chunks (document_id, position, text) VALUES (?, ?, ?)",
+                    (doc_id, position, chunk)
+                )
+                chunk_ids.append(cursor.lastrowid)
+        return chunk_ids
+
+    def delete_chunks(self, doc_id: int):
+        """Удаление всех чанков документа"""
+        with self.pool.cursor() as cursor:
+            cursor.execute("DELETE FROM chunks WHERE document_id = ?", (doc_id,))
+
+    def get_chunk_ids(self, doc_ids: Optional[Iterable[int]] = None) -> List[int]:
+        """Получение ID чанков указанных документов (или всех чанков)"""
+        with self.pool.cursor() as cursor:
+            if doc_ids is None:
+                cursor.execute("SELECT id FROM chunks")
+                chunk_ids = [row[0] for row in cursor.fetchall()]
+            else:
+                doc_ids = list(doc_ids)
+                chunk_ids = []
+                for i in range(0, len(doc_ids), SQL_BATCH_SIZE):
+                    batch = doc_ids[i:i + SQL_BATCH_SIZE]
+                    placeholders = ", ".join("?" * len(batch))
+                    cursor.execute(f"SELECT id FROM chunks WHERE document_id IN ({placeholders})", batch)
+                    chunk_ids.extend(row[0] for row in cursor.fetchall())
+        return chunk_ids
+
+    def get_chunks(self, chunk_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """Получение чанков по списку ID"""
+        chunk_ids = list(chunk_ids)
+        if not chunk_ids:
+            return {}
+
+        with self.pool.cursor() as cursor:
+            chunks = {}
+            for i in range(0, len(chunk_ids), SQL_BATCH_SIZE):
+                batch = chunk_ids[i:i + SQL_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+                cursor.execute(
+                    f"SELECT id, document_id, position, text FROM chunks WHERE id IN ({placeholders})",
+                    batch
+                )
+                for chunk_id, document_id, position, text in cursor.fetchall():
+                    chunks[chunk_id] = {
+                        "id": chunk_id,
+                        "document_id": document_id,
+                        "position": position,
+                        "text": text
+                    }
+        return chunks
 
     def delete_document(self, doc_id: int):
-        """Удаление документа по ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Удаление документа и его чанков по ID"""
+        with self.pool.cursor() as cursor:
+            cursor.execute("DELETE FROM chunks WHERE document_id = ?", (doc_id,))
+            cursor.execute("DELETE FROM shelves WHERE document_id = ?", (doc_id,))
+            cursor.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+            deleted = cursor.rowcount > 0
+        return deleted
+
+    def get_document_titles(self, doc_ids: Iterable[int]) -> Dict[int, Optional[str]]:
+        """Названия существующих документов из списка ID"""
+        doc_ids = list(doc_ids)
+        titles = {}
+        with self.pool.cursor() as cursor:
+            for i in range(0, len(doc_ids), SQL_BATCH_SIZE):
+                batch = doc_ids[i:i + SQL_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+                cursor.execute(f"SELECT id, title FROM documents WHERE id IN ({placeholders})", batch)
+                titles.update(cursor.fetchall())
+        return titles
+
+    def get_shelf(self, user_id: int) -> List[int]:
+        """ID книг на полке пользователя"""
+        with self.pool.cursor() as cursor:
+            cursor.execute("SELECT document_id FROM shelves WHERE user_id = ? ORDER BY document_id", (user_id,))
+            doc_ids = [row[0] for row in cursor.fetchall()]
+        return doc_ids
+
+    def set_shelf(self, user_id: int, doc_ids: Iterable[int]):
+        """Заменяет книги на полке пользователя, пустой список очищает полку"""
+        with self.pool.cursor() as cursor:
+            cursor.execute("DELETE FROM shelves WHERE user_id = ?", (user_id,))
+            cursor.executemany(
+                "INSERT OR IGNORE INTO shelves (user_id, document_id) VALUES (?, ?)",
+                [(user_id, doc_id) for doc_id in doc_ids]
+            )
+
+    # Колонки задачи загрузки, которые можно изменять через update_job
+    JOB_FIELDS = (
+        'message_id', 'state', 'pages_done', 'pages_total',
+        'chunks_done', 'document_id', 'error'
+    )
+
+    def add_job(
+        self,
+        user_id: int,
+        chat_id: int,
+        file_path: str,
+        title: str,
+        file_type: str,
+        state: str
+    ) -> int:
+        """Добавление задачи загрузки документа, возвращает ее ID"""
+        with self.pool.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO ingestion_jobs (user_id, chat_id, file_path, title, file_type, state)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (user_id, chat_id, file_path, title, file_type, state)
+            )
+            job_id = cursor.lastrowid
+        return job_id
+
+    def update_job(self, job_id: int, **fields):
+        """Обновление полей задачи загрузки"""
+        unknown = set(fields) - set(self.JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"Неизвестные поля задачи: {', '.join(sorted(unknown))}")
+
+        with self.pool.cursor() as cursor:
+            assignments = "".join(f"{name} = ?, " for name in fields)
+            cursor.execute(
+                f"UPDATE ingestion_jobs SET {assignments}updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                list(fields.values()) + [job_id]
+            )
+
+    def _query_jobs(self, where: str, params: tuple) -> List[Dict[str, Any]]:
+        with self.pool.cursor() as cursor:
+            cursor.row_factory = sqlite3.Row
+
+            cursor.execute(f"SELECT * FROM ingestion_jobs WHERE {where}", params)
+            jobs = [dict(row) for row in cursor.fetchall()]
+        return jobs
+
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Получение задачи загрузки по ID"""
+        jobs = self._query_jobs("id = ?", (job_id,))
+        return jobs[0] if jobs else None
+
+    def get_user_jobs(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+        """Последние задачи загрузки пользователя"""
+        return self._query_jobs("user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit))
 
-        cursor.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+    def get_document_jobs(self, doc_id: int, states: Iterable[str]) -> List[Dict[str, Any]]:
+        """Задачи загрузки документа в указанных состояниях"""
+        states = tuple(states)
+        placeholders = ", ".join("?" * len(states))
+        return self._query_jobs(f"document_id = ? AND state IN ({placeholders}) ORDER BY id", (doc_id,) + states)
 
-        conn.commit()
-        conn.close()
-        return cursor.rowcount > 0 
\ No newline at end of file
+    def get_jobs_in_states(self, states: Iterable[str]) -> List[Dict[str, Any]]:
+        """Задачи загрузки в указанных состояниях в порядке создания"""
+        states = tuple(states)
+        placeholders = ", ".join("?" * len(states))
+        return self._query_jobs(f"state IN ({placeholders}) ORDER BY id", states)
@@ -3,9 +3,9 @@ from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters
 from model.pipeline import Pipeline
 from model.database import Database
 from .config import Config
+from .text_extractor import iter_pdf_pages
 import os
 from pathlib import Path
-import PyPDF2
 import io
 import logging
 
@@ -118,12 +118,7 @@ class BotHandlers:
         
     def _extract_text_from_pdf(self, file_path):
         """Извлечение текста из PDF файла"""
-        text = ""
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        return text
+        return "".join(iter_pdf_pages(file_path))
         
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик текстовых сообщений"""
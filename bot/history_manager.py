@@ -1,56 +1,191 @@
-from datetime import datetime
-from typing import List, Dict
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Tuple
 import json
+import logging
 import os
+import threading
+import time
+from .database import ConnectionPool
+
+logger = logging.getLogger(__name__)
 
 class HistoryManager:
-    def __init__(self, history_file: str = "chat_history.json"):
-        self.history_file = history_file
-        self.history: Dict[int, List[Dict]] = {}  # user_id -> list of messages
-        self.load_history()
-
-    def load_history(self):
-        """Загружает историю из файла"""
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    self.history = json.load(f)
-            except json.JSONDecodeError:
-                self.history = {}
-        else:
-            self.history = {}
-
-    def save_history(self):
-        """Сохраняет историю в файл"""
-        with open(self.history_file, 'w', encoding='utf-8') as f:
-            json.dump(self.history, f, ensure_ascii=False, indent=2)
+    """История сообщений пользователей в SQLite
+
+    Новые сообщения копятся в буфере и записываются одной транзакцией
+    фоновым потоком: по достижении flush_size сообщений или раз в
+    flush_interval секунд. Чтение идет по индексу (user_id, id), поэтому
+    в памяти хранится только еще не записанный буфер. При записи история
+    каждого пользователя обрезается до max_messages, а раз в час удаляются
+    сообщения старше retention_days.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "books.db",
+        flush_size: int = 32,
+        flush_interval: float = 1.0,
+        max_messages: int = 200,
+        retention_days: int = 30,
+        legacy_file: Optional[str] = "chat_history.json",
+        pool: Optional[ConnectionPool] = None
+    ):
+        self.db_path = db_path
+        # Общий пул соединений базы, иначе история открывает собственный
+        self._owns_pool = pool is None
+        self.pool = pool or ConnectionPool(db_path)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_messages = max_messages  # 0 - без ограничения
+        self.retention_days = retention_days  # 0 - хранить бессрочно
+        self._pending: List[Tuple[int, str, str, int]] = []  # (user_id, timestamp, message, is_bot)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._last_compaction = 0.0
+
+        self.init_db()
+        if legacy_file:
+            self._import_legacy(legacy_file)
+        self.compact()
+
+        self._flusher = threading.Thread(target=self._flush_loop, name='history-flusher', daemon=True)
+        self._flusher.start()
+
+    def init_db(self):
+        """Инициализация таблицы истории"""
+        with self.pool.cursor() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS chat_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    is_bot INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_chat_history_user_id ON chat_history (user_id, id)"
+            )
+
+    def _import_legacy(self, legacy_file: str):
+        """Однократный перенос истории из прежнего JSON-файла"""
+        if not os.path.exists(legacy_file):
+            return
+
+        try:
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+        except json.JSONDecodeError:
+            history = {}
+
+        rows = [
+            (int(user_id), msg["timestamp"], msg["message"], int(msg["is_bot"]))
+            for user_id, messages in history.items()
+            for msg in messages
+        ]
+        rows.sort(key=lambda row: row[1])
+        self._write(rows)
+
+        os.replace(legacy_file, legacy_file + ".migrated")
+        logger.info("История из %s перенесена в базу данных (%d сообщений)", legacy_file, len(rows))
 
     def add_message(self, user_id: int, message: str, is_bot: bool = False):
-        """Добавляет сообщение в историю"""
-        if user_id not in self.history:
-            self.history[user_id] = []
-        
-        self.history[user_id].append({
-            "timestamp": datetime.now().isoformat(),
-            "message": message,
-            "is_bot": is_bot
-        })
-        self.save_history()
+        """Добавляет сообщение в буфер записи"""
+        with self._lock:
+            self._pending.append((user_id, datetime.now().isoformat(), message, int(is_bot)))
+            if len(self._pending) >= self.flush_size:
+                self._wakeup.set()
+
+    def flush(self):
+        """Записывает накопленные сообщения одной транзакцией"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if rows:
+                self._write(rows)
+
+        if time.monotonic() - self._last_compaction >= 3600:
+            self.compact()
+
+    def _write(self, rows: List[Tuple[int, str, str, int]]):
+        if not rows:
+            return
+
+        with self.pool.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO chat_history (user_id, timestamp, message, is_bot) VALUES (?, ?, ?, ?)",
+                rows
+            )
+
+            # Обрезаем историю только тех пользователей, которым добавились сообщения
+            if self.max_messages:
+                for user_id in {row[0] for row in rows}:
+                    cursor.execute("""
+                        DELETE FROM chat_history WHERE user_id = ? AND id <= (
+                            SELECT id FROM chat_history WHERE user_id = ?
+                            ORDER BY id DESC LIMIT 1 OFFSET ?
+                        )
+                    """, (user_id, user_id, self.max_messages))
+
+    def compact(self):
+        """Удаляет сообщения старше retention_days"""
+        self._last_compaction = time.monotonic()
+        if not self.retention_days:
+            return
+
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+        with self.pool.cursor() as cursor:
+            cursor.execute("DELETE FROM chat_history WHERE timestamp < ?", (cutoff,))
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Ошибка записи истории сообщений")
+
+    def close(self):
+        """Останавливает фоновую запись и сохраняет остаток буфера"""
+        self._closed = True
+        self._wakeup.set()
+        self._flusher.join()
+        self.flush()
+        if self._owns_pool:
+            self.pool.close_all()
 
     def get_user_history(self, user_id: int, limit: int = 10) -> List[Dict]:
         """Получает историю сообщений пользователя"""
-        if user_id not in self.history:
-            return []
-        return self.history[user_id][-limit:]
+        # Блокировка записи не дает увидеть сообщения между буфером и базой
+        with self._flush_lock:
+            with self._lock:
+                pending = [row for row in self._pending if row[0] == user_id][-limit:]
+
+            rows = []
+            if len(pending) < limit:
+                with self.pool.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT user_id, timestamp, message, is_bot FROM chat_history
+                        WHERE user_id = ? ORDER BY id DESC LIMIT ?
+                    """, (user_id, limit - len(pending)))
+                    rows = cursor.fetchall()[::-1]
+
+        return [
+            {"timestamp": timestamp, "message": message, "is_bot": bool(is_bot)}
+            for _, timestamp, message, is_bot in rows + pending
+        ]
 
     def format_history(self, messages: List[Dict]) -> str:
         """Форматирует историю сообщений для вывода"""
         if not messages:
             return "История пуста"
-        
+
         result = "📜 История последних сообщений:\n\n"
         for msg in messages:
             timestamp = datetime.fromisoformat(msg["timestamp"]).strftime("%d.%m.%Y %H:%M")
             prefix = "🤖" if msg["is_bot"] else "👤"
             result += f"{prefix} {timestamp}\n{msg['message']}\n\n"
-        return result 
\ No newline at end of file
+        return result
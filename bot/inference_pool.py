@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+import asyncio
+
+
+class InferencePool:
+    """Ограниченный пул потоков для CPU-нагруженного инференса
+
+    Задачи сверх лимита ждут своей очереди в пуле, не блокируя цикл событий.
+    Счетчики меняются только из цикла событий, поэтому блокировки не нужны.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='inference')
+        self.in_flight = 0  # выполняемые и ожидающие задачи
+
+    @property
+    def saturated(self) -> bool:
+        """Все воркеры заняты, новая задача встанет в очередь"""
+        return self.in_flight >= self.max_workers
+
+    @property
+    def queued(self) -> int:
+        """Количество задач, ожидающих свободного воркера"""
+        return max(0, self.in_flight - self.max_workers)
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Выполняет функцию в пуле и дожидается результата"""
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self):
+        """Останавливает пул, дожидаясь выполнения текущих задач"""
+        self.executor.shutdown(wait=True)
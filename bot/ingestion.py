@@ -0,0 +1,248 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Set
+import asyncio
+import logging
+import time
+from .config import Config
+from .text_extractor import extract_pdf_pages, iter_text_file
+
+logger = logging.getLogger(__name__)
+
+# Состояния задачи загрузки в порядке прохождения конвейера
+QUEUED = 'queued'
+EXTRACTING = 'extracting'
+CHUNKING = 'chunking'
+EMBEDDING = 'embedding'
+INDEXED = 'indexed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+ACTIVE_STATES = (QUEUED, EXTRACTING, CHUNKING, EMBEDDING)
+FINAL_STATES = (INDEXED, FAILED, CANCELLED)
+_STAGE_ORDER = {state: i for i, state in enumerate(ACTIVE_STATES + (INDEXED,))}
+
+
+class IngestionCancelled(Exception):
+    """Задача загрузки отменена пользователем"""
+
+
+class IngestionInterrupted(Exception):
+    """Задача загрузки прервана остановкой бота"""
+
+
+class IngestionQueue:
+    """Фоновая очередь загрузки документов с персистентными задачами
+
+    Задачи хранятся в таблице ingestion_jobs, поэтому после перезапуска
+    незавершенные задачи откатываются и выполняются заново. Каждый воркер
+    обрабатывает одну задачу в своем потоке, не занимая пул инференса.
+    """
+
+    def __init__(
+        self,
+        ask_docs_bot,
+        workers: int = 1,
+        on_update: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        update_interval: float = 2.0
+    ):
+        self.ask_docs_bot = ask_docs_bot
+        self.database = ask_docs_bot.database
+        self.workers = workers
+        self.on_update = on_update  # уведомление о смене состояния или прогрессе задачи
+        self.update_interval = update_interval
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingestion')
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self._cancelled: Set[int] = set()
+        self._stopping = False
+        self._last_update: Dict[int, float] = {}
+        self._progress_state: Dict[int, Dict[str, Any]] = {}  # стадия и счетчики выполняемых задач
+
+    async def start(self):
+        """Запускает воркеры и возобновление незавершенных задач
+
+        Новые задачи принимаются сразу, а обрабатываются после того,
+        как бот загрузит индекс и модели.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+
+        # Задачи прошлого запуска читаем до того, как появятся новые
+        interrupted = await self.database.aio.get_jobs_in_states(ACTIVE_STATES)
+        self._tasks = [self._loop.create_task(self._resume(interrupted))]
+        self._tasks += [self._loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _resume(self, jobs: List[Dict[str, Any]]):
+        """Откатывает и заново ставит в очередь задачи, прерванные перезапуском"""
+        await self.ask_docs_bot.wait_ready()
+        for job in jobs:
+            await self._loop.run_in_executor(self.executor, self._reset_job, job)
+            self._queue.put_nowait(job['id'])
+            logger.info("Задача загрузки %s возобновлена после перезапуска", job['id'])
+
+    async def stop(self):
+        """Останавливает воркеры, прерванные задачи возобновятся при следующем запуске
+
+        Выполняемые задачи прерываются на следующей части документа, и
+        остановка дожидается их потоков: после нее индекс и базу можно
+        закрывать. Состояние прерванных задач не меняется, поэтому при
+        следующем запуске их подхватит _resume.
+        """
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.to_thread(self.executor.shutdown, wait=True, cancel_futures=True)
+
+    def _reset_job(self, job: Dict[str, Any]):
+        """Откатывает частично загруженный документ прерванной задачи"""
+        if job['document_id'] is not None:
+            self.ask_docs_bot.delete_document(job['document_id'])
+        self.database.update_job(
+            job['id'], state=QUEUED, document_id=None, pages_done=0, chunks_done=0, error=None
+        )
+
+    async def submit(
+        self,
+        user_id: int,
+        chat_id: int,
+        file_path: str,
+        title: str,
+        file_type: str,
+        message_id: Optional[int] = None
+    ) -> int:
+        """Ставит файл в очередь загрузки, возвращает ID задачи"""
+        job_id = await self.database.aio.add_job(user_id, chat_id, file_path, title, file_type, QUEUED)
+        if message_id is not None:
+            await self.database.aio.update_job(job_id, message_id=message_id)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    async def cancel(self, job_id: int, user_id: int) -> bool:
+        """Отменяет активную задачу пользователя"""
+        job = await self.database.aio.get_job(job_id)
+        if job is None or job['user_id'] != user_id or job['state'] not in ACTIVE_STATES:
+            return False
+
+        self._cancelled.add(job_id)
+        if job['state'] == QUEUED:
+            # Задача еще не взята воркером, он пропустит ее
+            await self.database.aio.update_job(job_id, state=CANCELLED)
+            await self._notify(job_id)
+        return True
+
+    async def _worker(self):
+        await self.ask_docs_bot.wait_ready()
+        while True:
+            job_id = await self._queue.get()
+            try:
+                if job_id in self._cancelled and (await self.database.aio.get_job(job_id))['state'] == CANCELLED:
+                    continue
+                await self._loop.run_in_executor(self.executor, self._run_job, job_id)
+                await self._notify(job_id)
+            except Exception:
+                logger.exception("Ошибка воркера загрузки")
+            finally:
+                self._cancelled.discard(job_id)
+                self._last_update.pop(job_id, None)
+                self._progress_state.pop(job_id, None)
+                self._queue.task_done()
+
+    def _run_job(self, job_id: int):
+        """Выполняет задачу в потоке воркера: извлечение, чанкинг, эмбеддинги, индексация"""
+        job = self.database.get_job(job_id)
+        self._progress(job_id, EXTRACTING)
+
+        if job['file_type'] == 'pdf':
+            parts = extract_pdf_pages(
+                job['file_path'],
+                workers=Config.PDF_WORKERS,
+                pages_per_task=Config.PDF_PAGES_PER_TASK,
+                parallel_min_pages=Config.PDF_PARALLEL_MIN_PAGES,
+                on_progress=lambda done, total: self._progress(
+                    job_id, EXTRACTING, pages_done=done, pages_total=total
+                )
+            )
+        else:
+            parts = iter_text_file(job['file_path'])
+
+        try:
+            doc_id = self.ask_docs_bot.ingest_document(
+                self._check_cancelled(job_id, parts),
+                title=job['title'],
+                file_type=job['file_type'],
+                job_id=job_id,
+                on_progress=lambda stage, chunks: self._progress(job_id, stage, chunks_done=chunks)
+            )
+        except IngestionCancelled:
+            self.database.update_job(job_id, state=CANCELLED, document_id=None)
+            return
+        except IngestionInterrupted:
+            # Задача остается активной и будет выполнена заново после перезапуска
+            logger.info("Задача загрузки %s прервана остановкой бота", job_id)
+            return
+        except Exception as e:
+            logger.exception("Ошибка загрузки документа по задаче %s", job_id)
+            self.database.update_job(job_id, state=FAILED, document_id=None, error=str(e))
+            return
+
+        if job_id in self._cancelled:
+            # Отмена пришла после того, как была прочитана последняя часть документа
+            self.ask_docs_bot.delete_document(doc_id)
+            self.database.update_job(job_id, state=CANCELLED, document_id=None)
+            return
+
+        # Записываем итоговые счетчики, которые могли быть пропущены из-за ограничения частоты
+        progress = self._progress_state.get(job_id, {})
+        progress.update(state=INDEXED, document_id=doc_id)
+        self.database.update_job(job_id, **progress)
+
+    def _check_cancelled(self, job_id: int, parts: Iterable[str]) -> Iterator[str]:
+        """Прерывает чтение документа, если задачу отменили или бот останавливается"""
+        for part in parts:
+            if job_id in self._cancelled:
+                raise IngestionCancelled()
+            if self._stopping:
+                raise IngestionInterrupted()
+            yield part
+
+    def _progress(self, job_id: int, stage: str, **counters):
+        """Сохраняет прогресс задачи: смену стадии сразу, счетчики не чаще update_interval"""
+        progress = self._progress_state.setdefault(job_id, {'state': QUEUED})
+        progress.update(counters)
+        stage_changed = _STAGE_ORDER[stage] > _STAGE_ORDER[progress['state']]
+        if stage_changed:
+            progress['state'] = stage
+
+        now = time.monotonic()
+        if not stage_changed and now - self._last_update.get(job_id, 0) < self.update_interval:
+            return
+        self._last_update[job_id] = now
+
+        self.database.update_job(job_id, **progress)
+        asyncio.run_coroutine_threadsafe(self._notify(job_id), self._loop)
+
+    async def _notify(self, job_id: int):
+        if self.on_update is None:
+            return
+        try:
+            await self.on_update(await self.database.aio.get_job(job_id))
+        except Exception as e:
+            logger.warning("Не удалось отправить статус задачи %s: %s", job_id, e)
+
+
+def format_job(job: Dict[str, Any]) -> str:
+    """Краткое описание задачи загрузки для пользователя"""
+    icons = {
+        QUEUED: '⏳', EXTRACTING: '📄', CHUNKING: '✂️', EMBEDDING: '🧮',
+        INDEXED: '✅', FAILED: '❌', CANCELLED: '🚫'
+    }
+    text = f"{icons.get(job['state'], '•')} #{job['id']} {job['title']}: {job['state']}"
+    if job['pages_total']:
+        text += f", страниц {job['pages_done']}/{job['pages_total']}"
+    if job['chunks_done']:
+        text += f", фрагментов {job['chunks_done']}"
+    if job['error']:
+        text += f"\n   {job['error']}"
+    return text
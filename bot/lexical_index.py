@@ -0,0 +1,283 @@
+from array import array
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import math
+import os
+import re
+import zipfile
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r'\w+')
+CYRILLIC_PATTERN = re.compile(r'[а-я]')
+
+# Окончания для упрощенного стемминга русских слов, если snowballstemmer не установлен
+RUSSIAN_ENDINGS = sorted([
+    'иями', 'ями', 'ами', 'его', 'ого', 'ему', 'ому', 'ыми', 'ими', 'ией', 'ешь', 'ишь', 'ете', 'ите',
+    'ться', 'тся', 'ать', 'ять', 'ить', 'еть', 'ует', 'уют', 'ов', 'ев', 'ей', 'ой', 'ий', 'ый',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю', 'ах', 'ях', 'ам', 'ям', 'ом', 'ем', 'ым', 'им',
+    'ет', 'ит', 'ут', 'ют', 'ат', 'ят', 'ла', 'ли', 'ло', 'ть', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю',
+    'ь', 'й',
+], key=len, reverse=True)
+MIN_STEM_LENGTH = 3
+STEM_CACHE_SIZE = 200000
+
+
+def _suffix_stem(word: str) -> str:
+    """Отрезает самое длинное окончание, оставляя не меньше MIN_STEM_LENGTH букв"""
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+class Analyzer:
+    """Разбивает текст на термы: нижний регистр, ё -> е и стемминг
+
+    Русские и английские слова приводятся к основе стеммером Snowball,
+    без него у русских слов отрезаются типичные окончания. Токены
+    с цифрами (номера формул, ГОСТы, годы) не изменяются.
+    """
+
+    def __init__(self):
+        try:
+            import snowballstemmer
+            self.name = 'snowball'
+            self._russian = snowballstemmer.stemmer('russian').stemWord
+            self._english = snowballstemmer.stemmer('english').stemWord
+        except ImportError:
+            print("snowballstemmer не установлен, для русских слов используется упрощенный стемминг окончаний")
+            self.name = 'suffix'
+            self._russian = _suffix_stem
+            self._english = None
+        # Словарь корпуса ограничен, поэтому основы слов кешируются
+        self.stem = lru_cache(maxsize=STEM_CACHE_SIZE)(self._stem)
+
+    def _stem(self, token: str) -> str:
+        if any(char.isdigit() for char in token):
+            return token
+        if CYRILLIC_PATTERN.search(token):
+            return self._russian(token)
+        return self._english(token) if self._english is not None else token
+
+    def __call__(self, text: str) -> List[str]:
+        return [self.stem(token) for token in TOKEN_PATTERN.findall(text.lower().replace('ё', 'е'))]
+
+
+class LexicalIndex:
+    """Инвертированный индекс BM25 по чанкам
+
+    Чанкам присваиваются внутренние номера по порядку добавления, список
+    вхождений терма хранится в двух массивах array: номера чанков (uint32)
+    и частоты терма (uint16), что занимает 6 байт на вхождение вместо
+    десятков байт у списков Python. Поиск складывает вклады термов запроса
+    векторно через numpy.
+
+    Удаленные чанки помечаются и пропускаются при поиске, а когда их
+    становится больше compact_ratio, списки вхождений перестраиваются.
+    До перестроения удаленные чанки учитываются в документной частоте
+    термов, что немного занижает их IDF.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, compact_ratio: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.compact_ratio = compact_ratio
+        self.analyzer = Analyzer()
+        self._terms: Dict[str, int] = {}             # терм -> номер терма
+        self._postings: List[array] = []             # номер терма -> номера чанков
+        self._frequencies: List[array] = []          # номер терма -> частоты в чанках
+        self._chunk_ids = array('q')                 # внутренний номер -> ID чанка
+        self._lengths = array('I')                   # внутренний номер -> число термов
+        self._alive = bytearray()                    # внутренний номер -> 1, если чанк не удален
+        self._numbers: Dict[int, int] = {}           # ID чанка -> внутренний номер
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        """Количество проиндексированных чанков"""
+        return len(self._numbers)
+
+    @property
+    def size_bytes(self) -> int:
+        """Размер списков вхождений в байтах"""
+        return sum(
+            postings.itemsize * len(postings) + frequencies.itemsize * len(frequencies)
+            for postings, frequencies in zip(self._postings, self._frequencies)
+        )
+
+    def ids(self) -> List[int]:
+        """ID всех проиндексированных чанков"""
+        return list(self._numbers)
+
+    def add(self, chunk_ids: Iterable[int], texts: Iterable[str]):
+        """Добавляет чанки, повторно добавленный чанк заменяет прежний"""
+        for chunk_id, text in zip(chunk_ids, texts):
+            if chunk_id in self._numbers:
+                self.remove([chunk_id])
+            counts = Counter(self.analyzer(text))
+            number = len(self._chunk_ids)
+            for term, count in counts.items():
+                term_id = self._terms.get(term)
+                if term_id is None:
+                    term_id = self._terms[term] = len(self._postings)
+                    self._postings.append(array('I'))
+                    self._frequencies.append(array('H'))
+                self._postings[term_id].append(number)
+                self._frequencies[term_id].append(min(count, 0xFFFF))
+
+            length = sum(counts.values())
+            self._chunk_ids.append(chunk_id)
+            self._lengths.append(length)
+            self._alive.append(1)
+            self._numbers[chunk_id] = number
+            self._total_length += length
+
+    def remove(self, chunk_ids: Iterable[int]) -> int:
+        """Удаляет чанки из индекса, возвращает число удаленных"""
+        removed = 0
+        for chunk_id in chunk_ids:
+            number = self._numbers.pop(chunk_id, None)
+            if number is None:
+                continue
+            self._alive[number] = 0
+            self._total_length -= self._lengths[number]
+            removed += 1
+
+        if removed and len(self._chunk_ids) - len(self._numbers) > self.compact_ratio * len(self._chunk_ids):
+            self._compact()
+        return removed
+
+    def _compact(self):
+        """Перенумеровывает живые чанки и убирает удаленные из списков вхождений"""
+        alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+        renumber = np.cumsum(alive, dtype=np.int64) - 1
+
+        terms, postings, frequencies = {}, [], []
+        for term, term_id in self._terms.items():
+            numbers = np.frombuffer(self._postings[term_id], dtype=np.uint32)
+            keep = alive[numbers]
+            if not keep.any():
+                continue
+            terms[term] = len(postings)
+            postings.append(array('I', renumber[numbers[keep]].astype(np.uint32).tobytes()))
+            frequencies.append(array('H', np.frombuffer(self._frequencies[term_id], dtype=np.uint16)[keep].tobytes()))
+
+        chunk_ids = np.frombuffer(self._chunk_ids, dtype=np.int64)[alive]
+        self._terms, self._postings, self._frequencies = terms, postings, frequencies
+        self._chunk_ids = array('q', chunk_ids.tobytes())
+        self._lengths = array('I', np.frombuffer(self._lengths, dtype=np.uint32)[alive].tobytes())
+        self._alive = bytearray(b'\x01' * len(chunk_ids))
+        self._numbers = {int(chunk_id): number for number, chunk_id in enumerate(chunk_ids)}
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 каждого внутреннего номера чанка, у удаленных чанков 0"""
+        count = len(self._numbers)
+        scores = np.zeros(len(self._chunk_ids), dtype=np.float32)
+        if not count:
+            return scores
+
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+        norm = self.k1 * (1 - self.b + self.b * lengths / (self._total_length / count or 1))
+        for term in set(self.analyzer(query)):
+            term_id = self._terms.get(term)
+            if term_id is None:
+                continue
+            numbers = np.frombuffer(self._postings[term_id], dtype=np.uint32)
+            frequencies = np.frombuffer(self._frequencies[term_id], dtype=np.uint16).astype(np.float32)
+            df = len(numbers)
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            # Номера в списке вхождений уникальны, поэтому сложение без np.add.at корректно
+            scores[numbers] += idf * frequencies * (self.k1 + 1) / (frequencies + norm[numbers])
+        scores *= np.frombuffer(bytes(self._alive), dtype=np.uint8)
+        return scores
+
+    def search(self, query: str, k: int, ids: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """До k чанков с наибольшим BM25 в виде (ID чанка, оценка), только с ненулевой оценкой
+
+        Если заданы ids, в результат попадают только чанки с этими ID.
+        """
+        scores = self.scores(query)
+        if ids is not None:
+            allowed = np.zeros(len(scores), dtype=bool)
+            allowed[[self._numbers[chunk_id] for chunk_id in ids if chunk_id in self._numbers]] = True
+            scores *= allowed
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind='stable')]
+        return [(self._chunk_ids[number], float(scores[number])) for number in matched]
+
+    def save(self, path: str):
+        """Сохраняет индекс на диск атомарной заменой файла
+
+        Списки вхождений записываются подряд в два массива со смещениями
+        начала каждого терма.
+        """
+        offsets = np.zeros(len(self._postings) + 1, dtype=np.int64)
+        np.cumsum([len(postings) for postings in self._postings], out=offsets[1:])
+        terms = sorted(self._terms, key=self._terms.get)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                meta=np.frombuffer(json.dumps({
+                    'analyzer': self.analyzer.name,
+                    'terms': terms,
+                    'total_length': self._total_length,
+                }, ensure_ascii=False).encode('utf-8'), dtype=np.uint8),
+                offsets=offsets,
+                postings=np.frombuffer(b''.join(postings.tobytes() for postings in self._postings), dtype=np.uint32),
+                frequencies=np.frombuffer(
+                    b''.join(frequencies.tobytes() for frequencies in self._frequencies), dtype=np.uint16
+                ),
+                chunk_ids=np.frombuffer(self._chunk_ids, dtype=np.int64),
+                lengths=np.frombuffer(self._lengths, dtype=np.uint32),
+                alive=np.frombuffer(bytes(self._alive), dtype=np.uint8),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> Optional['LexicalIndex']:
+        """Загружает индекс, сохраненный методом save
+
+        Возвращает None, если файла нет, он поврежден или термы в нем
+        получены другим анализатором.
+        """
+        if not os.path.exists(path):
+            return None
+
+        index = cls(**kwargs)
+        try:
+            with np.load(path) as data:
+                meta = json.loads(data['meta'].tobytes().decode('utf-8'))
+                offsets, postings, frequencies = data['offsets'], data['postings'], data['frequencies']
+                chunk_ids, lengths, alive = data['chunk_ids'], data['lengths'], data['alive']
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile, json.JSONDecodeError) as e:
+            print(f"Не удалось загрузить лексический индекс {path}: {e}")
+            return None
+        if meta.get('analyzer') != index.analyzer.name:
+            return None
+
+        index._terms = {term: term_id for term_id, term in enumerate(meta['terms'])}
+        index._postings = [
+            array('I', postings[start:end].tobytes()) for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+        index._frequencies = [
+            array('H', frequencies[start:end].tobytes()) for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+        index._chunk_ids = array('q', chunk_ids.tobytes())
+        index._lengths = array('I', lengths.tobytes())
+        index._alive = bytearray(alive.tobytes())
+        index._numbers = {int(chunk_id): number for number, chunk_id in enumerate(chunk_ids) if alive[number]}
+        index._total_length = meta['total_length']
+        return index
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[int]], k: int = 60) -> List[int]:
+    """Объединяет ранжированные списки ID: оценка ID - сумма 1 / (k + позиция) по спискам"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
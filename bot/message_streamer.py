@@ -0,0 +1,49 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class MessageStreamer:
+    """Постепенно показывает генерируемый ответ, редактируя одно сообщение
+
+    Telegram ограничивает частоту редактирования, поэтому промежуточный текст
+    отправляется не чаще min_interval секунд и только если он вырос хотя бы
+    на min_chars символов. Итоговый текст отправляется всегда.
+    """
+
+    def __init__(self, message, min_interval: float = 1.0, min_chars: int = 20, cursor: str = " ▌"):
+        self.message = message
+        self.min_interval = min_interval
+        self.min_chars = min_chars
+        self.cursor = cursor  # признак того, что ответ еще дописывается
+        self._shown = ""
+        self._last_edit = 0.0
+
+    async def update(self, text: str):
+        """Показывает промежуточный текст, если подошло время очередного редактирования"""
+        if not text.strip():
+            return
+        if len(text) - len(self._shown) < self.min_chars:
+            return
+        if time.monotonic() - self._last_edit < self.min_interval:
+            return
+        await self._edit(text, self.cursor)
+
+    async def finish(self, text: str):
+        """Показывает итоговый текст ответа"""
+        await self._edit(text, "")
+
+    async def _edit(self, text: str, suffix: str):
+        limit = TELEGRAM_MESSAGE_LIMIT - len(suffix)
+        shown = text[:limit] + suffix
+        self._last_edit = time.monotonic()
+        try:
+            await self.message.edit_text(shown)
+            self._shown = text
+        except Exception as e:
+            # Например, "Message is not modified" или превышение частоты запросов
+            logger.warning("Не удалось обновить сообщение с ответом: %s", e)
@@ -0,0 +1,163 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import gc
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ModelStats:
+    """Сведения о загруженной модели"""
+    name: str
+    load_seconds: float
+    memory_bytes: Optional[int]  # прирост резидентной памяти процесса при загрузке
+    loaded_at: float
+
+
+def resident_memory() -> Optional[int]:
+    """Резидентная память процесса в байтах или None, если ее не узнать"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class ModelRegistry:
+    """Общие для всего процесса экземпляры моделей
+
+    Модель регистрируется фабрикой и создается при первом get(), все
+    компоненты получают один и тот же экземпляр. Загрузки через get()
+    выполняются по одной, поэтому прирост памяти процесса относится к загружаемой модели.
+    replace() загружает новую модель рядом со старой и подменяет ее только
+    после успешной загрузки; запросы, уже получившие старый экземпляр,
+    дорабатывают с ним.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._stats: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._replace_lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        """Регистрирует фабрику модели, если модель с таким именем еще не зарегистрирована"""
+        with self._lock:
+            self._factories.setdefault(name, factory)
+
+    def get(self, name: str) -> Any:
+        """Экземпляр модели, при первом обращении модель загружается"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._load_lock:
+            # Модель могли загрузить, пока мы ждали блокировку
+            instance = self._instances.get(name)
+            if instance is not None:
+                return instance
+
+            factory = self._factories.get(name)
+            if factory is None:
+                raise KeyError(f"Модель {name} не зарегистрирована")
+
+            instance, stats = self._create(name, factory)
+            with self._lock:
+                self._instances[name] = instance
+                self._stats[name] = stats
+            return instance
+
+    def _create(self, name: str, factory: Callable[[], Any]) -> Tuple[Any, ModelStats]:
+        """Создает экземпляр фабрикой, замеряя время загрузки и прирост памяти"""
+        memory_before = resident_memory()
+        start = time.perf_counter()
+        instance = factory()
+        load_seconds = time.perf_counter() - start
+        memory_after = resident_memory()
+
+        memory = None
+        if memory_before is not None and memory_after is not None:
+            memory = max(memory_after - memory_before, 0)
+        logger.info("Модель %s загружена за %.1f с", name, load_seconds)
+        return instance, ModelStats(name, load_seconds, memory, time.time())
+
+    def get_loaded(self, name: str) -> Optional[Any]:
+        """Экземпляр модели, только если она уже загружена"""
+        return self._instances.get(name)
+
+    def unload(self, name: str):
+        """Выгружает модель, фабрика остается зарегистрированной"""
+        with self._load_lock:
+            self._unload(name)
+
+    def _unload(self, name: str) -> Optional[Any]:
+        """Убирает экземпляр модели из реестра, вызывается под _load_lock"""
+        with self._lock:
+            instance = self._instances.pop(name, None)
+            self._stats.pop(name, None)
+        if instance is not None:
+            self._release_memory()
+            logger.info("Модель %s выгружена", name)
+        return instance
+
+    def replace(self, name: str, factory: Callable[[], Any], preload: bool = True) -> Optional[Any]:
+        """Заменяет модель новой, созданной фабрикой
+
+        Новый экземпляр создается вне блокировки загрузки, и пока он
+        загружается, get() без ожидания возвращает текущую модель. Фабрика и
+        экземпляр меняются вместе только после успешной загрузки: если фабрика
+        упала, исключение передается вызывающему, а в реестре остается прежняя
+        модель. Без preload старый экземпляр выгружается сразу, а новая модель
+        загрузится при первом get().
+
+        Замены выполняются по одной. Возвращает замененный экземпляр (или None),
+        чтобы вызывающий освободил его ресурсы, например соединения клиента OpenAI.
+        """
+        with self._replace_lock:
+            if not preload:
+                with self._load_lock:
+                    with self._lock:
+                        self._factories[name] = factory
+                    return self._unload(name)
+
+            instance, stats = self._create(name, factory)
+            with self._load_lock:
+                with self._lock:
+                    old = self._instances.get(name)
+                    self._factories[name] = factory
+                    self._instances[name] = instance
+                    self._stats[name] = stats
+            if old is not None:
+                self._release_memory()
+                logger.info("Модель %s заменена", name)
+            return old
+
+    def stats(self) -> List[ModelStats]:
+        """Сведения о загруженных моделях в порядке загрузки"""
+        with self._lock:
+            return sorted(self._stats.values(), key=lambda stats: stats.loaded_at)
+
+    @staticmethod
+    def _release_memory():
+        gc.collect()
+        try:
+            import torch
+        except ImportError:
+            return
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+# Реестр моделей процесса
+registry = ModelRegistry()
@@ -0,0 +1,58 @@
+from typing import TYPE_CHECKING, Dict, List, Tuple
+import logging
+import time
+
+if TYPE_CHECKING:
+    from sentence_transformers import CrossEncoder
+
+logger = logging.getLogger(__name__)
+
+
+def load_cross_encoder(model_name: str, max_length: int) -> 'CrossEncoder':
+    # sentence_transformers импортирует torch, поэтому импорт отложен до загрузки модели
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name, max_length=max_length)
+
+
+def rerank(
+    model: 'CrossEncoder',
+    queries: List[str],
+    candidates: List[List[int]],
+    texts: Dict[int, str],
+    batch_size: int = 16,
+    budget: float = 0.3
+) -> Tuple[List[List[int]], bool]:
+    """Переранжирует кандидатов запросов кросс-энкодером в пределах бюджета времени
+
+    candidates - ID чанков каждого запроса в порядке первичного ранжирования.
+    Пары (запрос, чанк) оцениваются батчами от верхних позиций к нижним,
+    по одной позиции у всех запросов, поэтому при исчерпании бюджета
+    оценены лучшие кандидаты каждого запроса. Оцененные кандидаты
+    упорядочиваются по оценке, остальные следуют за ними в исходном порядке.
+    Возвращает новые ранжирования и признак того, что оценены все кандидаты.
+    """
+    deadline = time.monotonic() + budget
+    pairs = []
+    for rank in range(max(map(len, candidates), default=0)):
+        for i, ranking in enumerate(candidates):
+            if rank < len(ranking):
+                pairs.append((i, ranking[rank]))
+
+    scores: List[Dict[int, float]] = [{} for _ in queries]
+    scored = 0
+    for start in range(0, len(pairs), batch_size):
+        if time.monotonic() >= deadline:
+            logger.info("Бюджет переранжирования исчерпан: оценено %d из %d кандидатов", scored, len(pairs))
+            break
+        batch = pairs[start:start + batch_size]
+        predicted = model.predict([(queries[i], texts[chunk_id]) for i, chunk_id in batch], batch_size=batch_size)
+        for (i, chunk_id), score in zip(batch, predicted):
+            scores[i][chunk_id] = float(score)
+        scored += len(batch)
+
+    # Оценены всегда верхние позиции ранжирования, их и переупорядочиваем
+    reranked = [
+        sorted(ranking[:len(scores[i])], key=scores[i].get, reverse=True) + ranking[len(scores[i]):]
+        for i, ranking in enumerate(candidates)
+    ]
+    return reranked, scored == len(pairs)
@@ -0,0 +1,517 @@
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import faiss
+import numpy as np
+from .vector_store import DEFAULT_INDEX_PARAMS, VectorStore
+
+# Корень проекта: процессы шардов запускаются как python -m bot.sharded_store
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger(__name__)
+
+EMPTY_IDS = np.empty(0, dtype='int64')
+
+
+class ShardFailed(RuntimeError):
+    """Процесс шарда завершился или соединение с ним разорвано"""
+
+
+def shard_path(path: str, number: int) -> str:
+    """Файл индекса шарда: books.faiss -> books.faiss.0, books.faiss.1, ..."""
+    return f"{path}.{number}"
+
+
+def _runs(ids: np.ndarray) -> List[List[int]]:
+    """Сжимает ID чанков книги в отрезки [начало, конец): ID одной книги идут подряд"""
+    ids = np.sort(ids)
+    if not len(ids):
+        return []
+    breaks = np.flatnonzero(np.diff(ids) != 1) + 1
+    starts = ids[np.r_[0, breaks]]
+    stops = ids[np.r_[breaks - 1, len(ids) - 1]] + 1
+    return [[int(start), int(stop)] for start, stop in zip(starts, stops)]
+
+
+def _expand(runs: List[List[int]]) -> np.ndarray:
+    return np.concatenate([np.arange(start, stop, dtype='int64') for start, stop in runs]) if runs else EMPTY_IDS
+
+
+class _Shard:
+    """Индекс шарда и ID чанков каждой книги в нем, живет в процессе шарда"""
+
+    def __init__(self, store: VectorStore, documents: Optional[Dict[int, np.ndarray]] = None):
+        self.store = store
+        self.documents = documents or {}
+        self._known: Optional[np.ndarray] = None  # отсортированные ID всех чанков шарда
+
+    @classmethod
+    def open(
+        cls,
+        dimension: int,
+        mode: str,
+        params: Dict[str, Any],
+        path: Optional[str],
+        threads: int
+    ) -> Tuple['_Shard', bool]:
+        """Загружает шард с диска или создает пустой, возвращает шард и признак загрузки"""
+        # Шарды делят ядра между собой, чтобы потоки FAISS не мешали друг другу
+        faiss.omp_set_num_threads(threads)
+        loaded = VectorStore.load(path, mode, params) if path else None
+        if loaded is not None:
+            store, manifest = loaded
+            documents = {int(doc_id): _expand(runs) for doc_id, runs in manifest.get('documents', {}).items()}
+            if sum(map(len, documents.values())) == store.ntotal:
+                return cls(store, documents), True
+            print(f"Состав книг шарда {path} не совпадает с индексом")
+        return cls(VectorStore(dimension, mode, params)), False
+
+    def _contains(self, ids: np.ndarray) -> np.ndarray:
+        """Маска ID, векторы которых лежат в этом шарде"""
+        if self._known is None:
+            self._known = np.sort(np.concatenate(list(self.documents.values()))) if self.documents else EMPTY_IDS
+        if not len(self._known):
+            return np.zeros(len(ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(self._known, ids), len(self._known) - 1)
+        return self._known[positions] == ids
+
+    def ntotal(self) -> int:
+        return self.store.ntotal
+
+    def ids(self) -> np.ndarray:
+        return self.store.ids()
+
+    def document_sizes(self) -> Dict[int, int]:
+        """Число чанков каждой книги шарда"""
+        return {doc_id: len(ids) for doc_id, ids in self.documents.items()}
+
+    def add(self, document_id: int, ids: np.ndarray, vectors: np.ndarray):
+        self.store.add(ids, vectors)
+        self.documents[document_id] = np.concatenate([self.documents.get(document_id, EMPTY_IDS), ids])
+        self._known = None
+
+    def remove(self, ids: np.ndarray) -> int:
+        """Удаляет векторы с ID из этого шарда, остальные ID пропускаются"""
+        ids = ids[self._contains(ids)]
+        if not len(ids):
+            # Не трогаем индекс: HNSW перестраивается при любом удалении
+            return 0
+        removed = self.store.remove(ids)
+        for doc_id, doc_ids in list(self.documents.items()):
+            kept = doc_ids[np.isin(doc_ids, ids, invert=True)]
+            if len(kept):
+                self.documents[doc_id] = kept
+            else:
+                del self.documents[doc_id]
+        self._known = None
+        return removed
+
+    def export_document(self, document_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """ID и векторы чанков книги для переноса в другой шард"""
+        ids = self.documents.get(document_id, EMPTY_IDS)
+        return ids, self.store.reconstruct(ids)
+
+    def remove_document(self, document_id: int) -> int:
+        return self.remove(self.documents.get(document_id, EMPTY_IDS))
+
+    def search(self, queries: np.ndarray, k: int, ids: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        if ids is not None:
+            # Точный поиск по восстановленным векторам возможен только для ID этого шарда
+            ids = ids[self._contains(ids)]
+        return self.store.search(queries, k, ids)
+
+    def save(self, path: str):
+        documents = {doc_id: _runs(ids) for doc_id, ids in self.documents.items()}
+        self.store.save(path, {'documents': documents})
+
+
+def _serve(connection: Connection):
+    """Выполняет запросы основного процесса к шарду, пока соединение открыто"""
+    shard: Optional[_Shard] = None
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break  # основной процесс завершился
+        if request is None:
+            break
+        method, args = request
+        try:
+            if method == 'open':
+                shard, result = _Shard.open(*args)
+            else:
+                result = getattr(shard, method)(*args)
+            connection.send((True, result))
+        except Exception as e:
+            connection.send((False, e))
+
+
+def _main():
+    # Ctrl+C в терминале получает вся группа процессов, завершением шардов управляет основной
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    authkey = bytes.fromhex(sys.stdin.readline().strip())
+    with Listener(authkey=authkey) as listener:
+        print(listener.address, flush=True)
+        # stdout занят адресом, сообщения индекса идут в stderr
+        sys.stdout = sys.stderr
+        with listener.accept() as connection:
+            _serve(connection)
+
+
+class _ShardProcess:
+    """Процесс шарда и соединение с ним"""
+
+    def __init__(self, number: int, authkey: bytes):
+        self.number = number
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'bot.sharded_store'],
+            cwd=PROJECT_ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        )
+        self.process.stdin.write(authkey.hex() + "\n")
+        self.process.stdin.close()
+        self.connection: Optional[Connection] = None
+
+    def connect(self, authkey: bytes):
+        address = self.process.stdout.readline().strip()
+        self.process.stdout.close()
+        if not address:
+            raise RuntimeError(f"Процесс шарда {self.number} не запустился")
+        self.connection = Client(address, authkey=authkey)
+
+    def send(self, method: str, args: Tuple = ()):
+        try:
+            self.connection.send((method, args))
+        except OSError as e:
+            raise ShardFailed(f"Процесс шарда {self.number} завершился") from e
+
+    def receive(self) -> Any:
+        try:
+            ok, result = self.connection.recv()
+        except (EOFError, OSError) as e:
+            raise ShardFailed(f"Процесс шарда {self.number} завершился") from e
+        if not ok:
+            raise result
+        return result
+
+    def close(self):
+        if self.connection is None or self.connection.closed:
+            # Процесс не подключился и ждет соединения, которого не будет
+            self.process.kill()
+        else:
+            try:
+                self.connection.send(None)
+                self.connection.close()
+            except OSError:
+                pass
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class ShardedVectorStore:
+    """Векторный индекс, разделенный по книгам между процессами-шардами
+
+    Каждый шард - отдельный процесс со своим VectorStore, связь с ним идет
+    через локальный сокет (multiprocessing.connection). Все векторы книги
+    лежат в одном шарде, новая книга попадает в наименьший. Поиск
+    рассылается всем шардам сразу, и они ищут параллельно на разных ядрах,
+    после чего лучшие k результатов шардов объединяются по расстоянию.
+
+    При добавлении новой книги и после удаления шарды выравниваются
+    (rebalance): пока разрыв между самым большим и самым маленьким шардом
+    превышает rebalance_tolerance от среднего размера, книги целиком
+    переносятся из большего шарда в меньший.
+
+    Завершившийся процесс шарда перезапускается из последнего сохранения
+    (save): изменения шарда после него теряются, о чем пишется в лог, а
+    запрос, при котором это обнаружилось, завершается ошибкой ShardFailed
+    (поиск перед этим повторяется один раз).
+
+    Интерфейс совпадает с VectorStore, но add требует ID документа, а после
+    работы индекс нужно закрыть (close), чтобы завершить процессы шардов.
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        mode: str = 'flat',
+        params: Optional[Dict[str, Any]] = None,
+        shards: int = 2,
+        rebalance_tolerance: float = 0.2,
+        threads: Optional[int] = None,
+        path: Optional[str] = None
+    ):
+        if shards < 2:
+            raise ValueError("Шардированному индексу нужно не меньше двух шардов")
+
+        self.dimension = dimension
+        self.mode = mode
+        self.params = dict(DEFAULT_INDEX_PARAMS, **(params or {}))
+        self.rebalance_tolerance = rebalance_tolerance
+        self._threads = threads or max(1, (os.cpu_count() or 1) // shards)
+        # Путь последнего сохранения, из него перезапускаются упавшие шарды
+        self._path = None if path is None else os.path.abspath(path)
+
+        self._lock = threading.Lock()
+        self._authkey = os.urandom(32)
+        self._shards: List[_ShardProcess] = []
+        try:
+            # Процессы запускаются сразу все, импорт FAISS в них идет параллельно
+            for i in range(shards):
+                self._shards.append(_ShardProcess(i, self._authkey))
+            for shard in self._shards:
+                shard.connect(self._authkey)
+            opened = self._scatter('open', [self._open_args(i) for i in range(shards)], restart=False)
+        except Exception:
+            self.close()
+            raise
+        self.loaded = all(opened)  # все шарды загружены с диска
+
+        self._placement: Dict[int, int] = {}  # id документа -> номер шарда
+        self._sizes: List[int] = [0] * shards  # число векторов в каждом шарде
+        self._refresh()
+
+    @property
+    def shards(self) -> int:
+        return len(self._shards)
+
+    @property
+    def ntotal(self) -> int:
+        """Количество векторов во всех шардах"""
+        return sum(self._sizes)
+
+    @property
+    def sizes(self) -> List[int]:
+        """Количество векторов в каждом шарде"""
+        return list(self._sizes)
+
+    def _open_args(self, number: int) -> Tuple:
+        path = None if self._path is None else shard_path(self._path, number)
+        return self.dimension, self.mode, self.params, path, self._threads
+
+    def _scatter(self, method: str, args: Optional[List[Tuple]] = None, restart: bool = True) -> List[Any]:
+        """Отправляет запрос всем шардам и собирает ответы в порядке шардов"""
+        args = args or [()] * len(self._shards)
+        sent, failed = [], {}
+        for number, (shard, shard_args) in enumerate(zip(self._shards, args)):
+            try:
+                shard.send(method, shard_args)
+                sent.append(number)
+            except ShardFailed as e:
+                failed[number] = e
+
+        # Ответы дочитываются у всех шардов, получивших запрос, даже если какой-то
+        # вернул ошибку, иначе они достались бы следующему запросу
+        results, error = [None] * len(self._shards), None
+        for number in sent:
+            try:
+                results[number] = self._shards[number].receive()
+            except ShardFailed as e:
+                failed[number] = e
+            except Exception as e:
+                error = error or e
+        if failed:
+            if restart:
+                self._restart(sorted(failed))
+            raise next(iter(failed.values()))
+        if error is not None:
+            raise error
+        return results
+
+    def _call(self, number: int, method: str, *args) -> Any:
+        shard = self._shards[number]
+        try:
+            shard.send(method, args)
+            return shard.receive()
+        except ShardFailed:
+            self._restart([number])
+            raise
+
+    def _restart(self, numbers: List[int]):
+        """Перезапускает завершившиеся шарды из последнего сохранения"""
+        for number in numbers:
+            logger.warning(
+                "Процесс шарда %d завершился, перезапуск из %s; изменения после сохранения потеряны",
+                number, shard_path(self._path, number) if self._path else "пустого индекса"
+            )
+            self._shards[number].close()
+            shard = _ShardProcess(number, self._authkey)
+            self._shards[number] = shard
+            try:
+                shard.connect(self._authkey)
+                shard.send('open', self._open_args(number))
+                shard.receive()
+            except Exception:
+                logger.exception("Не удалось перезапустить шард %d", number)
+                raise
+
+        # Книги, перенесенные из шарда после сохранения, лежат и в другом шарде:
+        # в перезапущенном их копии удаляются, чтобы поиск не возвращал дубли
+        documents = self._scatter('document_sizes')
+        for number in numbers:
+            for doc_id in documents[number]:
+                if any(doc_id in sizes for other, sizes in enumerate(documents) if other not in numbers):
+                    self._call(number, 'remove_document', doc_id)
+        self._refresh()
+
+    def _refresh(self) -> List[Dict[int, int]]:
+        """Перечитывает у шардов размеры книг, возвращает их по шардам"""
+        documents = self._scatter('document_sizes')
+        self._placement = {doc_id: number for number, sizes in enumerate(documents) for doc_id in sizes}
+        self._sizes = [sum(sizes.values()) for sizes in documents]
+        return documents
+
+    def ids(self) -> np.ndarray:
+        """Идентификаторы всех векторов в индексе"""
+        with self._lock:
+            return np.concatenate(self._scatter('ids'))
+
+    def add(self, ids: Iterable[int], vectors: np.ndarray, document_id: Optional[int] = None):
+        """Добавляет векторы чанков документа в его шард"""
+        if document_id is None:
+            raise ValueError("Шардированному индексу нужен ID документа")
+        vectors = np.ascontiguousarray(vectors, dtype='float32').reshape(-1, self.dimension)
+        ids = np.ascontiguousarray(list(ids), dtype='int64')
+        if len(ids) != len(vectors):
+            raise ValueError("Количество идентификаторов не совпадает с количеством векторов")
+
+        with self._lock:
+            number = self._placement.get(document_id)
+            if number is None:
+                # Новая книга: сначала выравниваем шарды после предыдущих, затем кладем в наименьший
+                self._rebalance()
+                number = int(np.argmin(self._sizes))
+                self._placement[document_id] = number
+            self._call(number, 'add', document_id, ids, vectors)
+            self._sizes[number] += len(ids)
+
+    def remove(self, ids: Iterable[int]) -> int:
+        """Удаляет векторы по идентификаторам из всех шардов, возвращает число удаленных"""
+        ids = np.ascontiguousarray(list(ids), dtype='int64')
+        if not len(ids):
+            return 0
+        with self._lock:
+            removed = self._scatter('remove', [(ids,)] * len(self._shards))
+            if any(removed):
+                self._rebalance()
+            return sum(removed)
+
+    def rebalance(self) -> int:
+        """Выравнивает размеры шардов, возвращает число перенесенных книг"""
+        with self._lock:
+            return self._rebalance()
+
+    def _rebalance(self) -> int:
+        documents = self._refresh()
+        moved = 0
+        while True:
+            source, target = int(np.argmax(self._sizes)), int(np.argmin(self._sizes))
+            gap = self._sizes[source] - self._sizes[target]
+            if gap <= self.rebalance_tolerance * self.ntotal / len(self._shards):
+                break
+            # Перенос книги меньше разрыва его сокращает, лучше всего - книги в половину разрыва
+            candidates = [(size, doc_id) for doc_id, size in documents[source].items() if size < gap]
+            if not candidates:
+                break
+            size, doc_id = min(candidates, key=lambda candidate: abs(gap - 2 * candidate[0]))
+            self._move(doc_id, source, target)
+            documents[target][doc_id] = documents[source].pop(doc_id)
+            self._sizes[source] -= size
+            self._sizes[target] += size
+            moved += 1
+        if moved:
+            logger.info("Шарды выровнены, перенесено книг: %d, размеры: %s", moved, self._sizes)
+        return moved
+
+    def _move(self, document_id: int, source: int, target: int):
+        """Переносит векторы книги из шарда source в шард target"""
+        # В IVF-PQ векторы восстанавливаются приближенно и кодируются заново
+        ids, vectors = self._call(source, 'export_document', document_id)
+        self._call(target, 'add', document_id, ids, vectors)
+        self._call(source, 'remove_document', document_id)
+        self._placement[document_id] = target
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        ids: Optional[Iterable[int]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Ищет k ближайших векторов во всех шардах, отсутствующие позиции помечены id -1
+
+        Если заданы ids, каждый шард ищет только среди тех из них, что лежат в нем.
+        """
+        queries = np.ascontiguousarray(queries, dtype='float32').reshape(-1, self.dimension)
+        if ids is not None:
+            ids = np.ascontiguousarray(list(ids), dtype='int64')
+        with self._lock:
+            try:
+                results = self._scatter('search', [(queries, k, ids)] * len(self._shards))
+            except ShardFailed:
+                # Упавшие шарды уже перезапущены, поиск повторяется один раз
+                results = self._scatter('search', [(queries, k, ids)] * len(self._shards))
+
+        distances = np.concatenate([shard_distances for shard_distances, _ in results], axis=1)
+        labels = np.concatenate([shard_labels for _, shard_labels in results], axis=1)
+        distances[labels == -1] = np.inf
+        top = np.argsort(distances, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(distances, top, axis=1), np.take_along_axis(labels, top, axis=1)
+
+    def save(self, path: str, metadata: Dict[str, Any]):
+        """Сохраняет шарды (books.faiss.0, ...) и общий манифест на диск"""
+        with self._lock:
+            self._scatter('save', [(shard_path(os.path.abspath(path), i),) for i in range(len(self._shards))])
+            self._path = os.path.abspath(path)
+
+        manifest = dict(metadata, dimension=self.dimension, shards=len(self._shards))
+        tmp_manifest = f"{path}.json.tmp"
+        with open(tmp_manifest, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_manifest, f"{path}.json")
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        mode: str = 'flat',
+        params: Optional[Dict[str, Any]] = None,
+        shards: int = 2,
+        rebalance_tolerance: float = 0.2
+    ) -> Optional[Tuple['ShardedVectorStore', Dict[str, Any]]]:
+        """Запускает шарды с индексами, сохраненными методом save"""
+        manifest_path = f"{path}.json"
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Не удалось загрузить индекс {path}: {e}")
+            return None
+        if manifest.get('shards', 1) != shards:
+            print(f"Индекс сохранен с другим числом шардов: {manifest.get('shards', 1)}")
+            return None
+
+        store = cls(manifest['dimension'], mode, params, shards, rebalance_tolerance, path=path)
+        if not store.loaded:
+            store.close()
+            return None
+        return store, manifest
+
+    def close(self):
+        """Завершает процессы шардов"""
+        for shard in self._shards:
+            shard.close()
+        self._shards = []
+
+
+if __name__ == '__main__':
+    _main()
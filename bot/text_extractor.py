@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional
+import json
+import os
+import subprocess
+import sys
+
+# Корень проекта: воркеры извлечения запускаются как python -m bot.text_extractor
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Вызывается после каждой извлеченной страницы: (обработано страниц, всего страниц)
+ProgressCallback = Callable[[int, int], None]
+
+
+def iter_text_file(file_path, encoding: str = 'utf-8') -> Iterator[str]:
+    """Построчно читает текстовый файл, не загружая его целиком"""
+    with open(file_path, 'r', encoding=encoding) as file:
+        yield from file
+
+
+def count_pdf_pages(file_path) -> int:
+    """Количество страниц в PDF файле"""
+    import PyPDF2
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def iter_pdf_pages(file_path, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    """Постранично извлекает текст PDF, каждая страница завершается переводом строки"""
+    import PyPDF2
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        stop = len(pdf_reader.pages) if stop is None else min(stop, len(pdf_reader.pages))
+        for page_number in range(start, stop):
+            yield (pdf_reader.pages[page_number].extract_text() or "") + "\n"
+
+
+def _extract_pages(file_path, start: int, stop: int) -> List[str]:
+    """Извлечение диапазона страниц в отдельном процессе
+
+    Процесс запускается как python -m bot.text_extractor: он не импортирует
+    main.py (как spawn) и не копирует потоки инференса и OpenMP бота (как fork).
+    """
+    result = subprocess.run(
+        [sys.executable, '-m', 'bot.text_extractor', os.path.abspath(file_path), str(start), str(stop)],
+        cwd=PROJECT_ROOT, capture_output=True
+    )
+    if result.returncode:
+        error = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise RuntimeError(f"Не удалось извлечь страницы {start}-{stop}: {error[-1] if error else result.returncode}")
+    return json.loads(result.stdout)
+
+
+def extract_pdf_pages(
+    file_path,
+    workers: int = 1,
+    pages_per_task: int = 16,
+    parallel_min_pages: int = 64,
+    on_progress: Optional[ProgressCallback] = None
+) -> Iterator[str]:
+    """Потоковое извлечение страниц PDF с сохранением порядка
+
+    Большие файлы разбираются диапазонами по pages_per_task страниц в
+    отдельных процессах, не больше workers одновременно. В работе не больше
+    2 * workers диапазонов, поэтому память не растет, даже если потребитель
+    страниц медленнее извлечения.
+    """
+    total = count_pdf_pages(file_path)
+
+    if workers <= 1 or total < parallel_min_pages:
+        for page_number, page in enumerate(iter_pdf_pages(file_path), start=1):
+            yield page
+            if on_progress is not None:
+                on_progress(page_number, total)
+        return
+
+    ranges = [(start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task)]
+    # Потоки пула только ждут процессы извлечения
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pdf') as executor:
+        pending = []
+        next_range = 0
+        done = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < 2 * workers:
+                pending.append(executor.submit(_extract_pages, file_path, *ranges[next_range]))
+                next_range += 1
+
+            for page in pending.pop(0).result():
+                done += 1
+                yield page
+                if on_progress is not None:
+                    on_progress(done, total)
+
+
+if __name__ == '__main__':
+    # Воркер извлечения: python -m bot.text_extractor <файл> <первая страница> <конец диапазона>
+    path, first, last = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+    json.dump(list(iter_pdf_pages(path, first, last)), sys.stdout)
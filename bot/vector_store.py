@@ -0,0 +1,279 @@
+from typing import Any, Dict, Iterable, Optional, Tuple
+import json
+import os
+import faiss
+import numpy as np
+
+# Поддерживаемые типы индекса
+INDEX_MODES = ('flat', 'ivf_flat', 'hnsw', 'ivf_pq')
+
+# Параметры индекса по умолчанию
+DEFAULT_INDEX_PARAMS = {
+    'nlist': 256,             # число кластеров IVF
+    'nprobe': 16,             # число просматриваемых кластеров IVF при поиске
+    'hnsw_m': 32,             # число связей вершины HNSW
+    'ef_construction': 200,   # ширина поиска HNSW при построении
+    'ef_search': 64,          # ширина поиска HNSW при запросе
+    'pq_m': 16,               # число подвекторов PQ, должно делить размерность
+    'pq_nbits': 8,            # бит на код подвектора PQ
+    'train_sample': 50000,    # максимальный размер выборки для обучения
+    'exact_filter_max': 20000,  # до скольких ID поиск с фильтром идет точно по их векторам
+}
+
+# Верхняя граница ширины поиска HNSW с фильтром по ID
+MAX_FILTERED_EF_SEARCH = 1024
+
+
+class VectorStore:
+    """Индекс FAISS со стабильными идентификаторами векторов
+
+    Режимы flat и hnsw работают сразу. Режимы ivf_flat и ivf_pq требуют
+    обучения, поэтому до накопления достаточной выборки векторы хранятся
+    в точном индексе, который затем переобучается в целевой (maybe_train).
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        mode: str = 'flat',
+        params: Optional[Dict[str, Any]] = None,
+        index: Optional[faiss.Index] = None
+    ):
+        if mode not in INDEX_MODES:
+            raise ValueError(f"Неизвестный тип индекса {mode}, доступны: {', '.join(INDEX_MODES)}")
+
+        self.dimension = dimension
+        self.mode = mode
+        self.params = dict(DEFAULT_INDEX_PARAMS, **(params or {}))
+        if mode == 'ivf_pq' and dimension % self.params['pq_m']:
+            raise ValueError(f"Размерность {dimension} не делится на pq_m={self.params['pq_m']}")
+
+        if index is None:
+            index = self._build_index('hnsw' if mode == 'hnsw' else 'flat')
+        self.index = index
+        self._apply_search_params()
+
+    @property
+    def ntotal(self) -> int:
+        """Количество векторов в индексе"""
+        return self.index.ntotal
+
+    @property
+    def is_trained(self) -> bool:
+        """Индекс уже имеет целевой тип, а не временный точный"""
+        return self.mode in ('flat', 'hnsw') or isinstance(self.index, faiss.IndexIVF)
+
+    @property
+    def train_size(self) -> int:
+        """Минимальное число векторов для обучения IVF-режимов"""
+        centroids = self.params['nlist']
+        if self.mode == 'ivf_pq':
+            centroids = max(centroids, 2 ** self.params['pq_nbits'])
+        # FAISS рекомендует не меньше 39 точек на центроид
+        return centroids * 39
+
+    def _build_index(self, mode: str, sample: Optional[np.ndarray] = None) -> faiss.Index:
+        """Создает пустой индекс заданного типа, обучая его на выборке"""
+        if mode == 'flat':
+            return faiss.IndexIDMap2(faiss.IndexFlatL2(self.dimension))
+
+        if mode == 'hnsw':
+            hnsw = faiss.IndexHNSWFlat(self.dimension, self.params['hnsw_m'])
+            hnsw.hnsw.efConstruction = self.params['ef_construction']
+            return faiss.IndexIDMap2(hnsw)
+
+        quantizer = faiss.IndexFlatL2(self.dimension)
+        if mode == 'ivf_flat':
+            index = faiss.IndexIVFFlat(quantizer, self.dimension, self.params['nlist'])
+        else:
+            index = faiss.IndexIVFPQ(
+                quantizer, self.dimension, self.params['nlist'],
+                self.params['pq_m'], self.params['pq_nbits']
+            )
+        index.train(np.ascontiguousarray(sample, dtype='float32'))
+        # IVF сам хранит ID векторов, хеш-таблица нужна для удаления и восстановления
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index
+
+    def _apply_search_params(self):
+        """Применяет параметры поиска к текущему индексу"""
+        if isinstance(self.index, faiss.IndexIVF):
+            self.index.nprobe = self.params['nprobe']
+        elif isinstance(self.index, faiss.IndexIDMap2):
+            inner = faiss.downcast_index(self.index.index)
+            if isinstance(inner, faiss.IndexHNSW):
+                inner.hnsw.efSearch = self.params['ef_search']
+
+    def _export(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Извлекает ID и векторы из индекса с отображением ID"""
+        ids = faiss.vector_to_array(self.index.id_map)
+        if not len(ids):
+            return ids, np.empty((0, self.dimension), dtype='float32')
+        return ids, self.index.index.reconstruct_n(0, self.index.ntotal)
+
+    def _rebuild(self, ids: np.ndarray, vectors: np.ndarray, mode: str):
+        """Перестраивает индекс заданного типа из векторов"""
+        sample = None
+        if mode in ('ivf_flat', 'ivf_pq'):
+            size = min(len(vectors), self.params['train_sample'])
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), size, replace=False)]
+        index = self._build_index(mode, sample)
+        if len(ids):
+            index.add_with_ids(np.ascontiguousarray(vectors, dtype='float32'), ids)
+        self.index = index
+        self._apply_search_params()
+
+    def maybe_train(self) -> bool:
+        """Переводит временный точный индекс в IVF, когда векторов достаточно для обучения"""
+        if self.is_trained or self.ntotal < self.train_size:
+            return False
+        ids, vectors = self._export()
+        print(f"Обучение индекса {self.mode} на {len(ids)} векторах")
+        self._rebuild(ids, vectors, self.mode)
+        return True
+
+    def ids(self) -> np.ndarray:
+        """Идентификаторы всех векторов в индексе"""
+        if not isinstance(self.index, faiss.IndexIVF):
+            return faiss.vector_to_array(self.index.id_map)
+
+        invlists = self.index.invlists
+        ids = [
+            faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+            for list_no in range(invlists.nlist)
+            if invlists.list_size(list_no)
+        ]
+        return np.concatenate(ids) if ids else np.empty(0, dtype='int64')
+
+    def add(self, ids: Iterable[int], vectors: np.ndarray, document_id: Optional[int] = None):
+        """Добавляет векторы с заданными идентификаторами
+
+        document_id нужен только шардированному индексу (ShardedVectorStore).
+        """
+        vectors = np.ascontiguousarray(vectors, dtype='float32').reshape(-1, self.dimension)
+        ids = np.ascontiguousarray(list(ids), dtype='int64')
+        if len(ids) != len(vectors):
+            raise ValueError("Количество идентификаторов не совпадает с количеством векторов")
+        self.index.add_with_ids(vectors, ids)
+        self.maybe_train()
+
+    def remove(self, ids: Iterable[int]) -> int:
+        """Удаляет векторы по идентификаторам, возвращает число удаленных"""
+        ids = np.ascontiguousarray(list(ids), dtype='int64')
+        if not len(ids):
+            return 0
+        try:
+            return self.index.remove_ids(ids)
+        except RuntimeError:
+            # HNSW не поддерживает удаление, поэтому граф строится заново без этих векторов
+            all_ids, vectors = self._export()
+            keep = ~np.isin(all_ids, ids)
+            self._rebuild(all_ids[keep], vectors[keep], 'hnsw')
+            return int((~keep).sum())
+
+    def reconstruct(self, ids: Iterable[int]) -> np.ndarray:
+        """Векторы с заданными ID, все ID должны быть в индексе"""
+        ids = np.ascontiguousarray(list(ids), dtype='int64')
+        if not len(ids):
+            return np.empty((0, self.dimension), dtype='float32')
+        return self.index.reconstruct_batch(ids)
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        ids: Optional[Iterable[int]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Ищет k ближайших векторов, отсутствующие позиции помечены id -1
+
+        Если заданы ids, поиск идет только среди векторов с этими ID: при
+        небольшом их числе векторы восстанавливаются из индекса и сравниваются
+        с запросами напрямую, не затрагивая остальные, иначе FAISS ищет
+        по всему индексу с фильтром IDSelectorBatch.
+        """
+        queries = np.ascontiguousarray(queries, dtype='float32').reshape(-1, self.dimension)
+        if ids is None:
+            return self.index.search(queries, k)
+
+        ids = np.ascontiguousarray(list(ids), dtype='int64')
+        if len(ids) <= self.params['exact_filter_max']:
+            try:
+                return self._search_exact(queries, k, ids)
+            except RuntimeError:
+                pass  # часть ID еще не добавлена в индекс, фильтр FAISS их просто пропустит
+        # Селектор должен жить до конца поиска, параметры FAISS не держат ссылку на него
+        selector = faiss.IDSelectorBatch(ids)
+        return self.index.search(queries, k, params=self._filtered_search_params(selector, len(ids), k))
+
+    def _search_exact(self, queries: np.ndarray, k: int, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Точный поиск по L2 среди векторов с заданными ID"""
+        distances = np.full((len(queries), k), np.inf, dtype='float32')
+        labels = np.full((len(queries), k), -1, dtype='int64')
+        if not len(ids):
+            return distances, labels
+
+        vectors = self.reconstruct(ids)
+        scores = (
+            np.sum(queries ** 2, axis=1, keepdims=True)
+            - 2 * queries @ vectors.T
+            + np.sum(vectors ** 2, axis=1)
+        )
+        found = min(k, len(ids))
+        top = np.argpartition(scores, found - 1, axis=1)[:, :found]
+        top = np.take_along_axis(top, np.argsort(np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+        distances[:, :found] = np.take_along_axis(scores, top, axis=1)
+        labels[:, :found] = ids[top]
+        return distances, labels
+
+    def _filtered_search_params(self, selector: faiss.IDSelector, allowed: int, k: int) -> faiss.SearchParameters:
+        """Параметры поиска текущего индекса с фильтром по ID"""
+        if isinstance(self.index, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.params['nprobe'])
+
+        inner = faiss.downcast_index(self.index.index)
+        if isinstance(inner, faiss.IndexHNSW):
+            # Обход графа пропускает отфильтрованные вершины, поэтому при узком
+            # фильтре ширина поиска растет обратно пропорционально его доле
+            ef_search = max(self.params['ef_search'], k) * self.ntotal // max(allowed, 1)
+            return faiss.SearchParametersHNSW(
+                sel=selector, efSearch=min(max(ef_search, self.params['ef_search'], k), MAX_FILTERED_EF_SEARCH)
+            )
+        return faiss.SearchParameters(sel=selector)
+
+    def save(self, path: str, metadata: Dict[str, Any]):
+        """Сохраняет индекс и его метаданные на диск атомарной заменой файлов"""
+        tmp_index = f"{path}.tmp"
+        faiss.write_index(self.index, tmp_index)
+
+        manifest = dict(metadata, dimension=self.dimension)
+        tmp_manifest = f"{path}.json.tmp"
+        with open(tmp_manifest, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        os.replace(tmp_index, path)
+        os.replace(tmp_manifest, f"{path}.json")
+
+    def close(self):
+        """Индекс живет в памяти процесса, освобождать нечего (ср. ShardedVectorStore.close)"""
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        mode: str = 'flat',
+        params: Optional[Dict[str, Any]] = None
+    ) -> Optional[Tuple['VectorStore', Dict[str, Any]]]:
+        """Загружает индекс и метаданные, сохраненные методом save"""
+        manifest_path = f"{path}.json"
+        if not (os.path.exists(path) and os.path.exists(manifest_path)):
+            return None
+
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            index = faiss.read_index(path)
+        except (OSError, RuntimeError, json.JSONDecodeError) as e:
+            print(f"Не удалось загрузить индекс {path}: {e}")
+            return None
+
+        return cls(manifest['dimension'], mode, params, index), manifest
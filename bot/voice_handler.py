@@ -1,18 +1,31 @@
-import sounddevice as sd
 import numpy as np
-import whisper
 import tempfile
 import os
-from scipy.io import wavfile
+from .model_registry import registry
+
+
+def _load_whisper():
+    # whisper тянет за собой torch, поэтому импортируется только при загрузке модели
+    import whisper
+    return whisper.load_model("base")
+
 
 class VoiceHandler:
     def __init__(self):
-        self.model = whisper.load_model("base")
+        # Whisper загружается при первой голосовой команде
+        registry.register('whisper', _load_whisper)
         self.sample_rate = 16000
         self.channels = 1
         
+    @property
+    def model(self):
+        """Модель распознавания речи из общего реестра"""
+        return registry.get('whisper')
+    
     def record_audio(self, duration=5):
         """Записывает аудио с микрофона"""
+        import sounddevice as sd
+        
         recording = sd.rec(
             int(duration * self.sample_rate),
             samplerate=self.sample_rate,
@@ -24,6 +37,8 @@ class VoiceHandler:
     
     def save_audio(self, recording, filename):
         """Сохраняет аудио во временный файл"""
+        from scipy.io import wavfile
+        
         wavfile.write(filename, self.sample_rate, recording)
     
     def transcribe_audio(self, audio_path):
@@ -9,9 +9,35 @@ TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 # OpenAI API Key (optional)
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
+# OpenAI client configuration; base_url may point to a compatible or mock server
+OPENAI_CONFIG = {
+    'model': os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo'),
+    'base_url': os.getenv('OPENAI_BASE_URL') or None,
+    'temperature': float(os.getenv('OPENAI_TEMPERATURE', '0.7')),
+    'max_tokens': int(os.getenv('OPENAI_MAX_TOKENS', '500')),
+    'max_concurrency': int(os.getenv('OPENAI_MAX_CONCURRENCY', '8')),
+    'timeout': float(os.getenv('OPENAI_TIMEOUT', '30')),
+    'max_retries': int(os.getenv('OPENAI_MAX_RETRIES', '3')),
+}
+
+# Prompt tokens available to the OpenAI model for the question and the retrieved context
+OPENAI_CONTEXT_TOKENS = int(os.getenv('OPENAI_CONTEXT_TOKENS', '3000'))
+
 # Database URL
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///books.db')
 
+# CPU inference backend of local models: torch (fp32), int8 (dynamic quantization) or onnx
+LOCAL_LLM_BACKEND = os.getenv('LOCAL_LLM_BACKEND', 'torch')
+
+# Directory for cached ONNX exports
+ONNX_CACHE_DIR = os.getenv('ONNX_CACHE_DIR', 'onnx_cache')
+
+# Sentence embedding model used for document search
+EMBEDDING_CONFIG = {
+    'model_name': 'all-MiniLM-L6-v2',
+    'backend': os.getenv('EMBEDDING_BACKEND', 'torch'),
+}
+
 # Local LLM Configuration
 LOCAL_LLM_CONFIG = {
     'small': {
@@ -19,6 +45,7 @@ LOCAL_LLM_CONFIG = {
         'max_length': 512,
         'temperature': 0.7,
         'top_p': 0.9,
+        'backend': LOCAL_LLM_BACKEND,
         'description': 'Fast but less accurate'
     },
     'medium': {
@@ -26,6 +53,7 @@ LOCAL_LLM_CONFIG = {
         'max_length': 512,
         'temperature': 0.7,
         'top_p': 0.9,
+        'backend': LOCAL_LLM_BACKEND,
         'description': 'Balanced performance'
     },
     'large': {
@@ -33,10 +61,41 @@ LOCAL_LLM_CONFIG = {
         'max_length': 512,
         'temperature': 0.7,
         'top_p': 0.9,
+        'backend': LOCAL_LLM_BACKEND,
         'description': 'More accurate but slower'
     }
 }
 
+# Decoding profiles of the local model. max_new_tokens bounds the answer only,
+# the input is still truncated to max_length of the model size; sampled
+# decoding takes temperature and top_p from the model size
+GENERATION_PROFILES = {
+    'greedy': {'do_sample': False, 'num_beams': 1, 'max_new_tokens': 64, 'use_cache': True},
+    'sampled': {'do_sample': True, 'num_beams': 1, 'max_new_tokens': 192, 'use_cache': True},
+    'beam': {
+        'do_sample': False,
+        'num_beams': 4,
+        'early_stopping': True,
+        'no_repeat_ngram_size': 3,
+        'max_new_tokens': 128,
+        'use_cache': True,
+    },
+}
+
+# Decoding profile for each query type (see llm.classify_query)
+QUERY_PROFILES = {
+    'factoid': 'greedy',       # short questions about names, dates and numbers
+    'explanation': 'beam',     # how/why questions and summaries
+    'other': 'sampled',
+}
+
+# Use one profile for every query instead of choosing it by query type
+GENERATION_PROFILE = os.getenv('GENERATION_PROFILE') or None
+
+# Stream local model answers token by token (one request per generate call)
+# instead of batching concurrent requests into a single generate call
+LOCAL_STREAMING = os.getenv('LOCAL_STREAMING', 'true').lower() == 'true'
+
 # Default model size
 DEFAULT_MODEL_SIZE = 'medium'
 
@@ -0,0 +1,138 @@
+"""CPU inference backends for the local LLM and the embedding model
+
+* torch - full-precision PyTorch model (the default)
+* int8  - PyTorch model with dynamic int8 quantization of Linear layers
+* onnx  - ONNX Runtime model; the export is cached on disk, so only the
+          first load pays for it, and the loaded sessions are reused for
+          every request through the model registry
+"""
+import logging
+import os
+import shutil
+import tempfile
+import numpy as np
+from config import ONNX_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('torch', 'int8', 'onnx')
+
+
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of: {', '.join(BACKENDS)}")
+
+
+def quantize_dynamic(model):
+    """Replace Linear layers with int8 dynamically quantized ones"""
+    import torch
+
+    model.eval()
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def onnx_cache_path(model_name, task):
+    """Directory where the ONNX export of a model is kept"""
+    return os.path.join(ONNX_CACHE_DIR, task, model_name.replace('/', '--'))
+
+
+def _load_onnx(model_class, model_name, task):
+    """Load an exported model from the cache, exporting it on first use"""
+    path = onnx_cache_path(model_name, task)
+    if os.path.isdir(path):
+        return model_class.from_pretrained(path)
+
+    logger.info("Exporting %s to ONNX...", model_name)
+    model = model_class.from_pretrained(model_name, export=True)
+    # Export into a temporary directory and move it into place, so that a crashed
+    # or concurrent export never leaves a partial directory that looks like a cache hit
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix='.export-', dir=os.path.dirname(path))
+    try:
+        model.save_pretrained(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+        # Another process finished the same export first
+        logger.info("ONNX export of %s is already cached", model_name)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return model
+
+
+def load_seq2seq(model_name, backend='torch'):
+    """Tokenizer and seq2seq model for the given backend"""
+    _check_backend(backend)
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if backend == 'onnx':
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        return tokenizer, _load_onnx(ORTModelForSeq2SeqLM, model_name, 'seq2seq')
+
+    from transformers import AutoModelForSeq2SeqLM
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+    if backend == 'int8':
+        model = quantize_dynamic(model)
+    return tokenizer, model
+
+
+class OnnxSentenceEncoder:
+    """ONNX Runtime replacement for SentenceTransformer.encode
+
+    Reproduces the all-MiniLM pipeline: transformer, mean pooling over
+    non-padding tokens and L2 normalization.
+    """
+
+    def __init__(self, model_name):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        # SentenceTransformer resolves short names inside the sentence-transformers organization
+        if '/' not in model_name:
+            model_name = f"sentence-transformers/{model_name}"
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = _load_onnx(ORTModelForFeatureExtraction, model_name, 'feature-extraction')
+        self.max_seq_length = min(self.tokenizer.model_max_length, 256)
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.config.hidden_size
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        embeddings = []
+        for start in range(0, len(sentences), batch_size):
+            inputs = self.tokenizer(
+                sentences[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors='np'
+            )
+            hidden = self.model(**inputs).last_hidden_state
+            hidden = np.asarray(hidden, dtype='float32')
+            mask = inputs['attention_mask'][..., None].astype('float32')
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            embeddings.append(pooled / np.linalg.norm(pooled, axis=1, keepdims=True).clip(1e-12))
+
+        if not embeddings:
+            embeddings = [np.empty((0, self.get_sentence_embedding_dimension()), dtype='float32')]
+        embeddings = np.concatenate(embeddings)
+        return embeddings[0] if single else embeddings
+
+
+def load_sentence_encoder(model_name, backend='torch'):
+    """Sentence embedding model with a SentenceTransformer-compatible encode()"""
+    _check_backend(backend)
+    if backend == 'onnx':
+        return OnnxSentenceEncoder(model_name)
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, device='cpu' if backend == 'int8' else None)
+    if backend == 'int8':
+        model = quantize_dynamic(model)
+    return model
@@ -1,15 +1,126 @@
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
-import torch
-from config import MODEL_TYPE, OPENAI_API_KEY, LOCAL_LLM_CONFIG, DEFAULT_MODEL_SIZE
+import asyncio
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from config import (
+    MODEL_TYPE, OPENAI_API_KEY, OPENAI_CONFIG, LOCAL_LLM_CONFIG, DEFAULT_MODEL_SIZE, LOCAL_STREAMING,
+    GENERATION_PROFILES, QUERY_PROFILES, GENERATION_PROFILE, OPENAI_CONTEXT_TOKENS
+)
+
+# torch and transformers take seconds to import, so they are imported
+# only when a local model is actually loaded
+
+
+@lru_cache(maxsize=None)
+def _async_text_streamer_class():
+    from transformers import TextStreamer
+    
+    class AsyncTextStreamer(TextStreamer):
+        """Text streamer that hands decoded text from the generation thread to an asyncio queue"""
+        
+        def __init__(self, tokenizer, loop, queue):
+            # For seq2seq models the first chunk is the decoder start token, not the answer
+            super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+            self.loop = loop
+            self.queue = queue
+        
+        def on_finalized_text(self, text, stream_end=False):
+            if text:
+                self.loop.call_soon_threadsafe(self.queue.put_nowait, text)
+        
+        def close(self):
+            """Signal the consumer that no more text will arrive"""
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+    
+    return AsyncTextStreamer
+
+
+# Prompt of the local seq2seq model with retrieved context
+LOCAL_PROMPT_TEMPLATE = "Context: {context}\nQuestion: {prompt}"
+
+# Checked before EXPLANATION_PATTERN, so name questions ("как зовут ...") stay factoid
+FACTOID_PATTERN = re.compile(
+    r'\b(кто|когда|где|сколько|какой|какая|какое|какие|какого|в каком|'
+    r'как (зовут|звали|называется|называлась|называлось|называются|фамилия|имя)|'
+    r'who|when|where|which|how (many|much|old|long)|what(\'s| is| was) (the )?name)\b'
+)
+EXPLANATION_PATTERN = re.compile(
+    r'\b(почему|зачем|как|объясни\w*|расскажи\w*|опиши\w*|перескажи\w*|сравни\w*|'
+    r'why|how|explain\w*|describe\w*|summari[sz]e\w*|compare\w*)\b'
+)
+FACTOID_MAX_WORDS = 12
+
+
+def classify_query(prompt):
+    """Query type that selects the decoding profile: factoid, explanation or other"""
+    text = prompt.lower()
+    if FACTOID_PATTERN.search(text) and len(text.split()) <= FACTOID_MAX_WORDS:
+        return 'factoid'
+    if EXPLANATION_PATTERN.search(text):
+        return 'explanation'
+    return 'other'
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q / 100), len(values) - 1)]
+
+
+class GenerationStats:
+    """Generated length and per-token latency of recent local answers
+    
+    Kept per decoding profile over the last `window` answers. A large share
+    of answers that stop at max_new_tokens means the limit cuts answers short,
+    a p95 length far below it means the limit can be lowered.
+    """
+    
+    def __init__(self, window=1000):
+        self.window = window
+        self._samples = {}  # profile -> deque of (new_tokens, seconds_per_token, hit_limit)
+        self._lock = threading.Lock()
+    
+    def record(self, profile, new_tokens, seconds_per_token, limit):
+        with self._lock:
+            samples = self._samples.setdefault(profile, deque(maxlen=self.window))
+            samples.append((new_tokens, seconds_per_token, new_tokens >= limit))
+    
+    def summary(self):
+        """profile -> count, p50/p95 generated tokens, ms per token and share of answers at the limit"""
+        with self._lock:
+            samples = {profile: list(values) for profile, values in self._samples.items() if values}
+        return {
+            profile: {
+                'count': len(values),
+                'tokens_p50': _percentile([tokens for tokens, _, _ in values], 50),
+                'tokens_p95': _percentile([tokens for tokens, _, _ in values], 95),
+                'ms_per_token': 1000 * sum(latency for _, latency, _ in values) / len(values),
+                'at_limit': sum(hit for _, _, hit in values) / len(values),
+            }
+            for profile, values in samples.items()
+        }
+
 
 class LLM:
-    def __init__(self, model_size=DEFAULT_MODEL_SIZE):
+    def __init__(self, model_size=DEFAULT_MODEL_SIZE, backend=None):
         self.model_type = MODEL_TYPE
         self.model_size = model_size
+        # Inference backend of the local model; defaults to the one in LOCAL_LLM_CONFIG
+        self.backend = backend or LOCAL_LLM_CONFIG[model_size]['backend']
+        if GENERATION_PROFILE and GENERATION_PROFILE not in GENERATION_PROFILES:
+            raise ValueError(
+                f"Unknown generation profile '{GENERATION_PROFILE}', "
+                f"expected one of: {', '.join(GENERATION_PROFILES)}"
+            )
+        self.generation_stats = GenerationStats()
         
         if self.model_type == 'openai':
-            import openai
-            openai.api_key = OPENAI_API_KEY
+            from openai_client import AsyncOpenAIClient
+            self.client = AsyncOpenAIClient(OPENAI_API_KEY, **OPENAI_CONFIG)
+            self._sync_client = None
+            self._encoding = None
         else:
             self._load_local_model()
     
@@ -21,14 +132,21 @@ class LLM:
         self.temperature = config['temperature']
         self.top_p = config['top_p']
         
-        print(f"Loading {self.model_name} model...")
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
+        import torch
+        from inference_backends import load_seq2seq
         
-        if torch.cuda.is_available():
-            self.model = self.model.to('cuda')
-        elif torch.backends.mps.is_available():
-            self.model = self.model.to('mps')
+        print(f"Loading {self.model_name} model ({self.backend} backend)...")
+        self.tokenizer, self.model = load_seq2seq(self.model_name, self.backend)
+        
+        # Quantized and ONNX models run on CPU only
+        self.device = None
+        if self.backend == 'torch':
+            if torch.cuda.is_available():
+                self.device = 'cuda'
+            elif torch.backends.mps.is_available():
+                self.device = 'mps'
+        if self.device:
+            self.model = self.model.to(self.device)
     
     def generate_response(self, prompt, context=None):
         if self.model_type == 'openai':
@@ -36,52 +154,223 @@ class LLM:
         else:
             return self._generate_local_response(prompt, context)
     
+    def generate_responses(self, prompts, contexts=None):
+        """Generate responses for a batch of prompts
+        
+        The local model answers the whole batch with one generate call. OpenAI
+        has no batch endpoint, so its prompts are requested concurrently and a
+        failed request gives None for that prompt instead of failing the batch.
+        """
+        if contexts is None:
+            contexts = [None] * len(prompts)
+        if self.model_type == 'openai':
+            return self._generate_openai_responses(prompts, contexts)
+        else:
+            return self._generate_local_responses(prompts, contexts)
+    
+    @property
+    def tokenizer_key(self):
+        """Identifies the tokenizer, token counts of one text are equal for equal keys"""
+        if self.model_type == 'openai':
+            return f"openai:{OPENAI_CONFIG['model']}"
+        return self.model_name
+    
+    def _openai_encoding(self):
+        import tiktoken
+        
+        if self._encoding is None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(OPENAI_CONFIG['model'])
+            except KeyError:
+                self._encoding = tiktoken.get_encoding('cl100k_base')
+        return self._encoding
+    
+    def count_tokens(self, text):
+        """Number of tokens in text without special tokens"""
+        if self.model_type == 'openai':
+            return len(self._openai_encoding().encode(text))
+        return len(self.tokenizer(text, add_special_tokens=False)['input_ids'])
+    
+    def truncate_tokens(self, text, max_tokens):
+        """Beginning of text that is at most max_tokens tokens long"""
+        if self.model_type == 'openai':
+            encoding = self._openai_encoding()
+            return encoding.decode(encoding.encode(text)[:max_tokens])
+        ids = self.tokenizer(text, add_special_tokens=False)['input_ids'][:max_tokens]
+        return self.tokenizer.decode(ids, skip_special_tokens=True)
+    
+    def context_budget(self, prompt):
+        """Tokens left for the context once the question and the prompt template fit"""
+        if self.model_type == 'openai':
+            # A few tokens per message go to roles and delimiters
+            return OPENAI_CONTEXT_TOKENS - self.count_tokens(prompt) - 16
+        overhead = self.tokenizer(LOCAL_PROMPT_TEMPLATE.format(context="", prompt=prompt))['input_ids']
+        return self.max_length - len(overhead)
+    
+    @staticmethod
+    def select_profile(prompt):
+        """Decoding profile of the local model for a query"""
+        return GENERATION_PROFILE or QUERY_PROFILES[classify_query(prompt)]
+    
+    @property
+    def supports_streaming(self):
+        """Whether stream_response yields the answer incrementally"""
+        return self.model_type == 'openai' or LOCAL_STREAMING
+    
+    async def stream_response(self, prompt, context=None, runner=None):
+        """Yield answer text deltas as they are generated
+        
+        runner(func, *args) is an async callable that executes blocking local
+        generation off the event loop; asyncio.to_thread is used by default.
+        """
+        if self.model_type == 'openai':
+            async for delta in self.client.stream(prompt, context):
+                yield delta
+            return
+        
+        runner = runner or asyncio.to_thread
+        profile = self.select_profile(prompt)
+        if GENERATION_PROFILES[profile]['num_beams'] > 1:
+            # transformers cannot stream beam search, the answer arrives in one piece
+            responses = await runner(self._generate_local_batch, [prompt], [context], profile)
+            yield responses[0]
+            return
+        
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        streamer = _async_text_streamer_class()(self.tokenizer, loop, queue)
+        generation = asyncio.ensure_future(
+            runner(self._generate_local_streaming, prompt, context, streamer, profile)
+        )
+        # If the runner fails before generation starts (e.g. the pool is shut down
+        # or the task is cancelled), the streamer is never closed; end the stream anyway
+        generation.add_done_callback(lambda _: queue.put_nowait(None))
+        while True:
+            text = await queue.get()
+            if text is None:
+                break
+            yield text
+        await generation  # re-raise generation errors
+    
+    def _openai_sync_client(self):
+        if self._sync_client is None:
+            import openai
+            
+            self._sync_client = openai.OpenAI(
+                api_key=OPENAI_API_KEY,
+                base_url=OPENAI_CONFIG['base_url'],
+                timeout=OPENAI_CONFIG['timeout'],
+                max_retries=OPENAI_CONFIG['max_retries']
+            )
+        return self._sync_client
+    
     def _generate_openai_response(self, prompt, context=None):
-        import openai
-        
-        messages = []
-        if context:
-            messages.append({"role": "system", "content": context})
-        messages.append({"role": "user", "content": prompt})
-        
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=500
+        """Blocking request for callers outside the event loop"""
+        response = self._openai_sync_client().chat.completions.create(
+            model=OPENAI_CONFIG['model'],
+            messages=self.client.build_messages(prompt, context),
+            temperature=OPENAI_CONFIG['temperature'],
+            max_tokens=OPENAI_CONFIG['max_tokens']
         )
         return response.choices[0].message.content
     
+    def _generate_openai_responses(self, prompts, contexts):
+        """Independent requests sent concurrently; a failed request yields None for its prompt only"""
+        if not prompts:
+            return []
+        # Create the shared client before the threads start so that only one is made
+        self._openai_sync_client()
+        
+        def request(prompt, context):
+            try:
+                return self._generate_openai_response(prompt, context)
+            except Exception as e:
+                print(f"OpenAI request failed: {e}")
+                return None
+        
+        with ThreadPoolExecutor(max_workers=len(prompts), thread_name_prefix='openai') as executor:
+            return list(executor.map(request, prompts, contexts))
+    
     def _generate_local_response(self, prompt, context=None):
-        if context:
-            prompt = f"Context: {context}\nQuestion: {prompt}"
+        return self._generate_local_responses([prompt], [context])[0]
+    
+    def _generate_local_streaming(self, prompt, context, streamer, profile):
+        """Generate one response, passing text to the streamer as tokens are produced"""
+        try:
+            self._generate([prompt], [context], profile, streamer=streamer)
+        finally:
+            streamer.close()
+    
+    def _generate_local_responses(self, prompts, contexts):
+        """Generate responses for several prompts, one padded batch per decoding profile"""
+        groups = {}
+        for i, prompt in enumerate(prompts):
+            groups.setdefault(self.select_profile(prompt), []).append(i)
         
-        inputs = self.tokenizer(prompt, return_tensors="pt", max_length=self.max_length, truncation=True)
+        responses = [None] * len(prompts)
+        for profile, indices in groups.items():
+            texts = self._generate_local_batch(
+                [prompts[i] for i in indices], [contexts[i] for i in indices], profile
+            )
+            for i, text in zip(indices, texts):
+                responses[i] = text
+        return responses
+    
+    def _generate_local_batch(self, prompts, contexts, profile):
+        outputs = self._generate(prompts, contexts, profile)
+        return self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+    
+    def _generate(self, prompts, contexts, profile, streamer=None):
+        """Run model.generate with a decoding profile and record its length and latency"""
+        start = time.perf_counter()
+        outputs = self.model.generate(**self._local_generate_kwargs(prompts, contexts, profile), streamer=streamer)
+        elapsed = time.perf_counter() - start
         
-        if torch.cuda.is_available():
-            inputs = inputs.to('cuda')
-        elif torch.backends.mps.is_available():
-            inputs = inputs.to('mps')
+        # Decoder outputs start with the decoder start token and are padded after EOS;
+        # every decoding step produces one token for the whole batch
+        generated = outputs[:, 1:]
+        steps = max(generated.shape[1], 1)
+        limit = GENERATION_PROFILES[profile]['max_new_tokens']
+        for new_tokens in (generated != self.tokenizer.pad_token_id).sum(dim=1).tolist():
+            self.generation_stats.record(profile, new_tokens, elapsed / steps, limit)
+        return outputs
+    
+    def _local_generate_kwargs(self, prompts, contexts, profile='sampled'):
+        """Tokenized inputs and decoding settings of the profile for model.generate"""
+        prompts = [
+            LOCAL_PROMPT_TEMPLATE.format(context=context, prompt=prompt) if context else prompt
+            for prompt, context in zip(prompts, contexts)
+        ]
         
-        outputs = self.model.generate(
-            **inputs,
+        inputs = self.tokenizer(
+            prompts,
+            return_tensors="pt",
             max_length=self.max_length,
-            temperature=self.temperature,
-            top_p=self.top_p,
-            num_return_sequences=1,
-            do_sample=True
+            truncation=True,
+            padding=True
         )
         
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        return response
+        if self.device:
+            inputs = inputs.to(self.device)
+        
+        settings = dict(GENERATION_PROFILES[profile])
+        if settings['do_sample']:
+            settings.update(temperature=self.temperature, top_p=self.top_p)
+        
+        return dict(**inputs, **settings, num_return_sequences=1)
+    
+    async def aclose(self):
+        """Release network connections of the OpenAI client"""
+        if self.model_type == 'openai':
+            await self.client.aclose()
     
     def get_model_info(self):
         """Get information about current model"""
         if self.model_type == 'openai':
             return {
                 'type': 'openai',
-                'model': 'gpt-3.5-turbo',
-                'description': 'OpenAI GPT-3.5 Turbo model'
+                'model': OPENAI_CONFIG['model'],
+                'description': f"OpenAI {OPENAI_CONFIG['model']} model"
             }
         else:
             config = LOCAL_LLM_CONFIG[self.model_size]
@@ -89,5 +378,6 @@ class LLM:
                 'type': 'local',
                 'model': config['model_name'],
                 'size': self.model_size,
+                'backend': self.backend,
                 'description': config['description']
             } 
\ No newline at end of file
@@ -1,21 +1,21 @@
 import logging
 import os
 from dotenv import load_dotenv
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, filters, ContextTypes
 from bot.config import Config
 from bot.voice_handler import VoiceHandler
 from bot.ask_docs_bot import AskDocsBot
 from bot.history_manager import HistoryManager
-from bot.database import Database
 from llm import LLM
 from config import LOCAL_LLM_CONFIG
+from inference_backends import BACKENDS
+from bot.ingestion import ACTIVE_STATES, IngestionQueue, format_job
+from bot.message_streamer import MessageStreamer
+from bot.model_registry import registry
+from functools import partial
 import asyncio
 from pathlib import Path
-import PyPDF2
-
-# Глобальные переменные
-llm = None
 
 # Настройка логирования
 logging.basicConfig(
@@ -28,11 +28,18 @@ load_dotenv()
 
 # Инициализация компонентов
 config = Config()
-ask_docs_bot = AskDocsBot()
+ask_docs_bot = AskDocsBot(Config.DB_PATH)
 voice_handler = VoiceHandler()
-history_manager = HistoryManager()
-database = Database()
-llm = LLM()  # Инициализация LLM
+database = ask_docs_bot.database  # общий пул соединений с ботом
+history_manager = HistoryManager(
+    db_path=Config.DB_PATH,
+    flush_size=Config.HISTORY_FLUSH_SIZE,
+    flush_interval=Config.HISTORY_FLUSH_INTERVAL,
+    max_messages=Config.HISTORY_MAX_MESSAGES,
+    retention_days=Config.HISTORY_RETENTION_DAYS,
+    pool=database.pool
+)
+ingestion_queue = IngestionQueue(ask_docs_bot, workers=Config.INGESTION_WORKERS)
 
 # Создаем директорию для книг, если она не существует
 books_dir = Path("books")
@@ -50,7 +57,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "5. 📤 Загружать новые книги (команда /upload)\n"
         "6. 🗑 Удалять книги (команда /delete <id>)\n"
         "7. 📖 Показывать список книг (команда /books)\n"
-        "8. 🔄 Изменять размер модели (команда /model <size>)\n\n"
+        "8. 🔄 Изменять размер модели (команда /model <size>)\n"
+        "9. 📥 Показывать статус загрузок (команда /jobs)\n"
+        "10. 🩺 Показывать готовность бота (команда /status)\n"
+        "11. 🔎 Отвечать по одной книге (команда /ask <id> <вопрос>)\n"
+        "12. 🗂 Искать только в выбранных книгах (команда /shelf)\n\n"
         "💡 Просто отправьте мне вопрос, и я найду ответ в ваших книгах!"
     )
 
@@ -65,7 +76,12 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "📤 /upload - Загрузить новую книгу\n"
         "🗑 /delete <id> - Удалить книгу по ID\n"
         "📖 /books - Показать список загруженных книг\n"
-        "🔄 /model <size> - Изменить размер модели\n\n"
+        "🔄 /model <size> - Изменить размер модели\n"
+        "📥 /jobs - Показать статус загрузок\n"
+        "🚫 /cancel <id> - Отменить загрузку\n"
+        "🩺 /status - Показать готовность бота\n"
+        "🔎 /ask <id> <вопрос> - Задать вопрос по одной книге\n"
+        "🗂 /shelf <id> ... - Искать только в выбранных книгах (/shelf clear - во всех)\n\n"
         "💡 Также вы можете просто отправить текстовый запрос, "
         "и я постараюсь найти релевантную информацию в базе документов."
     )
@@ -81,23 +97,70 @@ async def upload_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     context.user_data['waiting_for_file'] = True
 
-async def books_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать список загруженных книг"""
-    books = database.get_all_documents()
+def format_size(size_bytes) -> str:
+    """Размер документа в читаемом виде"""
+    if size_bytes is None:
+        return 'Не указан'
+    for unit in ('Б', 'КБ', 'МБ'):
+        if size_bytes < 1024:
+            return f"{size_bytes:.0f} {unit}"
+        size_bytes /= 1024
+    return f"{size_bytes:.1f} ГБ"
+
+async def render_books_page(after_id=None, before_id=None):
+    """Текст и кнопки навигации одной страницы списка книг"""
+    books, has_prev, has_next = await database.aio.get_documents_page(
+        after_id=after_id, before_id=before_id, limit=Config.BOOKS_PAGE_SIZE
+    )
     if not books:
-        await update.message.reply_text("📚 У вас пока нет загруженных книг.\nИспользуйте команду /upload для загрузки новой книги.")
-        return
+        return None, None
     
     books_list = "📚 Загруженные книги:\n\n"
     for book in books:
-        books_list += f"📖 ID: {book[0]}\n"
-        books_list += f"📑 Название: {book[2] or 'Без названия'}\n"
-        books_list += f"📄 Тип: {book[3] or 'Не указан'}\n"
-        books_list += f"🕒 Загружено: {book[4]}\n"
+        books_list += f"📖 ID: {book['id']}\n"
+        books_list += f"📑 Название: {book['title'] or 'Без названия'}\n"
+        books_list += f"📄 Тип: {book['file_type'] or 'Не указан'}\n"
+        books_list += f"💾 Размер: {format_size(book['size_bytes'])}\n"
+        if book['page_count']:
+            books_list += f"📃 Страниц: {book['page_count']}\n"
+        books_list += f"🧩 Фрагментов: {book['chunk_count'] or 0}\n"
+        books_list += f"🕒 Загружено: {book['created_at']}\n"
         books_list += "➖➖➖➖➖➖➖➖\n\n"
     
     books_list += "\n💡 Используйте команду /delete <id> для удаления книги"
-    await update.message.reply_text(books_list)
+    
+    # Страницы задаются границами по ID, а не смещением
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"books:prev:{books[0]['id']}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton("Вперед ➡️", callback_data=f"books:next:{books[-1]['id']}"))
+    return books_list, InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def books_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать список загруженных книг"""
+    books_list, keyboard = await render_books_page()
+    if books_list is None:
+        await update.message.reply_text("📚 У вас пока нет загруженных книг.\nИспользуйте команду /upload для загрузки новой книги.")
+        return
+    
+    await update.message.reply_text(books_list, reply_markup=keyboard)
+
+async def books_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Переход по страницам списка книг"""
+    query = update.callback_query
+    await query.answer()
+    
+    _, direction, book_id = query.data.split(':')
+    if direction == 'next':
+        books_list, keyboard = await render_books_page(after_id=int(book_id))
+    else:
+        books_list, keyboard = await render_books_page(before_id=int(book_id))
+    
+    if books_list is None:
+        await query.edit_message_text("📚 На этой странице больше нет книг.\nИспользуйте команду /books, чтобы открыть список заново.")
+        return
+    await query.edit_message_text(books_list, reply_markup=keyboard)
 
 async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Удаление книги по ID"""
@@ -105,14 +168,33 @@ async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Пожалуйста, укажите ID книги: /delete <id>")
         return
         
+    if not ask_docs_bot.is_ready:
+        await update.message.reply_text("⏳ Бот еще загружает индекс, попробуйте через минуту.")
+        return
+        
     try:
         book_id = int(context.args[0])
-        if database.delete_document(book_id):
-            await update.message.reply_text(f"✅ Книга с ID {book_id} успешно удалена.")
-        else:
-            await update.message.reply_text(f"❌ Книга с ID {book_id} не найдена.")
     except ValueError:
         await update.message.reply_text("❌ ID книги должен быть числом.")
+        return
+
+    # Книгу, которая еще загружается, не удаляем: обработчик продолжил бы писать
+    # ее чанки и векторы, поэтому сначала загрузку нужно отменить
+    jobs = await database.aio.get_document_jobs(book_id, ACTIVE_STATES)
+    if jobs:
+        job_id = jobs[0]['id']
+        await update.message.reply_text(
+            f"⏳ Книга с ID {book_id} еще загружается (задача #{job_id}). "
+            f"Отмените загрузку командой /cancel {job_id}."
+        )
+        return
+
+    # Удаляем книгу вместе с ее чанками и векторами в пуле инференса: удаление ждет
+    # блокировку индекса и сохраняет его на диск, цикл событий при этом не блокируется
+    if await ask_docs_bot.pool.run(ask_docs_bot.delete_document, book_id):
+        await update.message.reply_text(f"✅ Книга с ID {book_id} успешно удалена.")
+    else:
+        await update.message.reply_text(f"❌ Книга с ID {book_id} не найдена.")
 
 async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик загруженных файлов"""
@@ -129,47 +211,95 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     file_path = books_dir / file_name
     await file.download_to_drive(file_path)
+    context.user_data['waiting_for_file'] = False
     
-    try:
-        # Обработка файла
-        if file_name.endswith('.pdf'):
-            text = extract_text_from_pdf(file_path)
-            file_type = 'pdf'
-        else:
-            text = file_path.read_text(encoding='utf-8')
-            file_type = 'txt'
-            
-        # Добавляем документ в базу данных
-        title = file_name.rsplit('.', 1)[0]  # Имя файла без расширения
-        database.add_document(
-            text=text,
-            title=title,
-            file_type=file_type
-        )
-        
-        await update.message.reply_text(f"✅ Книга '{title}' успешно загружена!")
-        
-        # Переинициализируем индекс для поиска
-        ask_docs_bot.initialize_index()
-        
-    except Exception as e:
-        await update.message.reply_text(f"❌ Ошибка при обработке файла: {str(e)}")
-    finally:
-        context.user_data['waiting_for_file'] = False
+    # Обработка идет в фоне, статус задачи обновляется в этом сообщении
+    title = file_name.rsplit('.', 1)[0]  # Имя файла без расширения
+    file_type = 'pdf' if file_name.endswith('.pdf') else 'txt'
+    status_message = await update.message.reply_text(f"⏳ Книга '{title}' поставлена в очередь на обработку...")
+    job_id = await ingestion_queue.submit(
+        user_id=update.effective_user.id,
+        chat_id=update.effective_chat.id,
+        file_path=str(file_path),
+        title=title,
+        file_type=file_type,
+        message_id=status_message.message_id
+    )
+    await update.message.reply_text(
+        f"📥 Задача #{job_id} создана.\n"
+        f"💡 /jobs - статус загрузок, /cancel {job_id} - отменить загрузку"
+    )
+
+async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать готовность бота и время загрузки компонентов"""
+    names = {
+        'embeddings': 'Модель эмбеддингов',
+        'index': 'Векторный индекс',
+        'llm': 'Языковая модель',
+        'reranker': 'Модель переранжирования',
+    }
+    if ask_docs_bot.warmup_error:
+        status_text = f"❌ Ошибка загрузки: {ask_docs_bot.warmup_error}\n\n"
+    elif ask_docs_bot.is_ready:
+        status_text = "✅ Бот готов отвечать на вопросы\n\n"
+    else:
+        status_text = "⏳ Бот загружается, вопросы будут обработаны после загрузки\n\n"
+    
+    for name, load_seconds in ask_docs_bot.warmup_status.items():
+        title = names.get(name, name)
+        state = f"готово за {load_seconds:.1f} с" if load_seconds is not None else "загружается"
+        status_text += f"• {title}: {state}\n"
+
+    # Размеры шардов показывают, насколько ровно книги распределены между процессами
+    shard_sizes = getattr(ask_docs_bot.index, 'sizes', None)
+    if shard_sizes:
+        status_text += f"\n🧩 Шарды индекса: {' / '.join(map(str, shard_sizes))} векторов\n"
+
+    # Длина ответов и скорость генерации помогают подобрать max_new_tokens профилей
+    llm = registry.get_loaded('llm')
+    generation = llm.generation_stats.summary() if llm is not None else {}
+    if generation:
+        status_text += "\n📏 Генерация (последние ответы):\n"
+        for profile, stats in generation.items():
+            status_text += (
+                f"• {profile}: {stats['count']} отв., длина p50 {stats['tokens_p50']} / "
+                f"p95 {stats['tokens_p95']} ток., {stats['ms_per_token']:.0f} мс/ток., "
+                f"до лимита {stats['at_limit']:.0%}\n"
+            )
+    await update.message.reply_text(status_text)
 
-def extract_text_from_pdf(file_path):
-    """Извлечение текста из PDF файла"""
-    text = ""
-    with open(file_path, 'rb') as file:
-        pdf_reader = PyPDF2.PdfReader(file)
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-    return text
+async def jobs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать статус последних загрузок пользователя"""
+    jobs = await database.aio.get_user_jobs(update.effective_user.id)
+    if not jobs:
+        await update.message.reply_text("📥 У вас нет загрузок.\nИспользуйте команду /upload для загрузки новой книги.")
+        return
+    
+    jobs_list = "📥 Ваши загрузки:\n\n" + "\n".join(format_job(job) for job in jobs)
+    await update.message.reply_text(jobs_list)
+
+async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отмена загрузки по ID задачи"""
+    if not context.args:
+        await update.message.reply_text("Пожалуйста, укажите ID задачи: /cancel <id>")
+        return
+    
+    try:
+        job_id = int(context.args[0])
+    except ValueError:
+        await update.message.reply_text("❌ ID задачи должен быть числом.")
+        return
+    
+    if await ingestion_queue.cancel(job_id, update.effective_user.id):
+        await update.message.reply_text(f"🚫 Загрузка #{job_id} отменяется.")
+    else:
+        await update.message.reply_text(f"❌ Активная загрузка #{job_id} не найдена.")
 
 async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /history"""
     user_id = update.effective_user.id
-    messages = history_manager.get_user_history(user_id)
+    # Чтение ждет фоновую запись буфера, поэтому выполняется вне цикла событий
+    messages = await asyncio.to_thread(history_manager.get_user_history, user_id)
     history_text = history_manager.format_history(messages)
     await update.message.reply_text(history_text)
 
@@ -186,7 +316,7 @@ async def voice_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         # Записываем и обрабатываем голосовую команду
-        text = voice_handler.process_voice_command(duration=10)
+        text = await asyncio.to_thread(voice_handler.process_voice_command, duration=10)
         
         if text:
             user_id = update.effective_user.id
@@ -194,9 +324,18 @@ async def voice_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             await update.message.reply_text(f"🎯 Распознанный текст:\n{text}")
             # Обрабатываем распознанный текст как обычный запрос
-            response = await ask_docs_bot.process_query(text)
+            answer_message = await update.message.reply_text("🔍 Ищу ответ на ваш вопрос...")
+            streamer = MessageStreamer(
+                answer_message,
+                min_interval=Config.STREAM_EDIT_INTERVAL,
+                min_chars=Config.STREAM_EDIT_MIN_CHARS
+            )
+            shelf = await database.aio.get_shelf(user_id)
+            response = await ask_docs_bot.process_query(
+                text, on_partial=streamer.update, document_ids=shelf or None
+            )
             history_manager.add_message(user_id, response, is_bot=True)
-            await update.message.reply_text(response)
+            await streamer.finish(response)
         else:
             await update.message.reply_text(
                 "❌ Не удалось распознать речь.\n\n"
@@ -210,8 +349,13 @@ async def voice_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик текстовых сообщений"""
+    # Если пользователь выбрал полку, ищем только в ее книгах
+    shelf = await database.aio.get_shelf(update.effective_user.id)
+    await answer_question(update, update.message.text, shelf or None)
+
+async def answer_question(update: Update, message_text: str, document_ids=None):
+    """Поиск ответа на вопрос с выводом по мере генерации, document_ids ограничивает поиск книгами"""
     user_id = update.effective_user.id
-    message_text = update.message.text
     
     # Сохраняем сообщение пользователя
     history_manager.add_message(user_id, message_text)
@@ -219,35 +363,109 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Отправляем сообщение о начале обработки
     processing_message = await update.message.reply_text("🔍 Ищу ответ на ваш вопрос...")
     
-    # Обрабатываем запрос
-    response = await ask_docs_bot.process_query(message_text)
+    if not ask_docs_bot.is_ready:
+        await processing_message.edit_text("⏳ Бот запускается и загружает модели. Ответ придет автоматически.")
+    
+    async def notify_queued(position: int):
+        await processing_message.edit_text(
+            f"⏳ Все обработчики заняты, ваш запрос в очереди (позиция {position}). Ответ придет автоматически."
+        )
+    
+    # Ответ выводится в сообщение о обработке по мере генерации
+    streamer = MessageStreamer(
+        processing_message,
+        min_interval=Config.STREAM_EDIT_INTERVAL,
+        min_chars=Config.STREAM_EDIT_MIN_CHARS
+    )
+    response = await ask_docs_bot.process_query(
+        message_text, on_queued=notify_queued, on_partial=streamer.update, document_ids=document_ids
+    )
     
     # Сохраняем ответ бота
     history_manager.add_message(user_id, response, is_bot=True)
     
-    # Удаляем сообщение о обработке
-    await processing_message.delete()
+    # Показываем итоговый ответ
+    await streamer.finish(response)
+
+async def ask_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Вопрос по одной книге: /ask <id> <вопрос>"""
+    if len(context.args) < 2:
+        await update.message.reply_text("Пожалуйста, укажите ID книги и вопрос: /ask <id> <вопрос>")
+        return
+    
+    try:
+        book_id = int(context.args[0])
+    except ValueError:
+        await update.message.reply_text("❌ ID книги должен быть числом.")
+        return
     
-    # Отправляем ответ
-    await update.message.reply_text(response)
+    if not await database.aio.get_document_titles([book_id]):
+        await update.message.reply_text(f"❌ Книга с ID {book_id} не найдена.")
+        return
+    
+    await answer_question(update, " ".join(context.args[1:]), [book_id])
+
+async def shelf_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Полка пользователя: /shelf - показать, /shelf <id> ... - выбрать книги, /shelf clear - очистить"""
+    user_id = update.effective_user.id
+    if not context.args:
+        shelf = await database.aio.get_shelf(user_id)
+        if not shelf:
+            await update.message.reply_text(
+                "📚 Полка пуста, вопросы ищутся по всем книгам.\n"
+                "Используйте /shelf <id> <id> ..., чтобы искать только в выбранных книгах."
+            )
+            return
+        titles = await database.aio.get_document_titles(shelf)
+        shelf_text = "📚 Ваша полка, вопросы ищутся только в этих книгах:\n\n"
+        for book_id in shelf:
+            shelf_text += f"📖 {book_id}: {titles.get(book_id) or 'Без названия'}\n"
+        shelf_text += "\n💡 /shelf clear - искать по всем книгам"
+        await update.message.reply_text(shelf_text)
+        return
+    
+    if context.args[0].lower() == 'clear':
+        await database.aio.set_shelf(user_id, [])
+        await update.message.reply_text("✅ Полка очищена, вопросы ищутся по всем книгам.")
+        return
+    
+    try:
+        book_ids = [int(arg) for arg in context.args]
+    except ValueError:
+        await update.message.reply_text("❌ ID книг должны быть числами: /shelf <id> <id> ...")
+        return
+    
+    titles = await database.aio.get_document_titles(book_ids)
+    missing = [str(book_id) for book_id in book_ids if book_id not in titles]
+    if missing:
+        await update.message.reply_text(f"❌ Книги не найдены: {', '.join(missing)}")
+        return
+    
+    await database.aio.set_shelf(user_id, book_ids)
+    await update.message.reply_text(f"✅ На полке книг: {len(titles)}. Вопросы будут искаться только в них.")
 
 async def model_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /model command to change model size"""
-    global llm  # Теперь это объявление корректно
-    
     if not context.args:
-        # Show current model info
+        # Show current model info; the model is loaded on first use
+        llm = await asyncio.to_thread(registry.get, 'llm')
         model_info = llm.get_model_info()
         message = f"Current model:\n"
         message += f"Type: {model_info['type']}\n"
         message += f"Model: {model_info['model']}\n"
         if model_info['type'] == 'local':
             message += f"Size: {model_info['size']}\n"
+            message += f"Backend: {model_info['backend']}\n"
         message += f"Description: {model_info['description']}\n\n"
         message += "Available sizes for local model:\n"
         for size, config in LOCAL_LLM_CONFIG.items():
             message += f"- {size}: {config['description']}\n"
-        message += "\nTo change model size, use: /model <size>"
+        message += "\nLoaded models:\n"
+        for stats in registry.stats():
+            memory = format_size(stats.memory_bytes) if stats.memory_bytes is not None else 'n/a'
+            message += f"- {stats.name}: {memory}, loaded in {stats.load_seconds:.1f} s\n"
+        message += f"\nInference backends: {', '.join(BACKENDS)}\n"
+        message += "\nTo change model size, use: /model <size> [backend]"
         await update.message.reply_text(message)
         return
 
@@ -258,16 +476,68 @@ async def model_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    llm = LLM(model_size=size)
+    backend = context.args[1].lower() if len(context.args) > 1 else None
+    if backend is not None and backend not in BACKENDS:
+        await update.message.reply_text(
+            f"Invalid backend. Available backends: {', '.join(BACKENDS)}"
+        )
+        return
+
+    # The current model keeps answering while the new one loads and stays in place if loading fails
+    await update.message.reply_text(f"Loading {size} model...")
+    try:
+        old_llm = await asyncio.to_thread(registry.replace, 'llm', partial(LLM, model_size=size, backend=backend))
+    except Exception as e:
+        logging.getLogger(__name__).exception("Failed to load the %s model", size)
+        await update.message.reply_text(f"❌ Failed to load the {size} model, keeping the current one: {e}")
+        return
+    if old_llm is not None:
+        # The replaced OpenAI client holds an httpx connection pool
+        await old_llm.aclose()
     await update.message.reply_text(f"Model changed to {size} size!")
 
+async def on_startup(application: Application):
+    """Фоновая загрузка моделей и запуск очереди загрузки после инициализации бота"""
+    async def report_job(job):
+        if job['message_id'] is None:
+            return
+        await application.bot.edit_message_text(
+            format_job(job),
+            chat_id=job['chat_id'],
+            message_id=job['message_id']
+        )
+    
+    # Бот начинает принимать команды сразу, индекс и модели загружаются в фоне
+    application.create_task(ask_docs_bot.warm_up())
+    
+    ingestion_queue.on_update = report_job
+    await ingestion_queue.start()
+
+async def on_shutdown(application: Application):
+    """Остановка фоновой очереди загрузки, запись буфера истории, остановка шардов индекса, закрытие базы и соединений с API"""
+    await ingestion_queue.stop()
+    history_manager.close()
+    ask_docs_bot.close()
+    database.close()
+    llm = registry.get_loaded('llm')
+    if llm is not None:
+        await llm.aclose()
+
 def main():
     """Основная функция запуска бота"""
     # Получаем токен бота из переменных окружения
     token = os.getenv("TELEGRAM_BOT_TOKEN")
     
-    # Создаем приложение
-    application = Application.builder().token(token).build()
+    # Создаем приложение; обновления обрабатываются параллельно,
+    # чтобы долгий запрос одного пользователя не задерживал остальные чаты
+    application = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(True)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     
     # Добавляем обработчики
     application.add_handler(CommandHandler("start", start))
@@ -277,7 +547,13 @@ def main():
     application.add_handler(CommandHandler("upload", upload_command))
     application.add_handler(CommandHandler("delete", delete_command))
     application.add_handler(CommandHandler("books", books_command))
+    application.add_handler(CallbackQueryHandler(books_page_callback, pattern=r"^books:"))
     application.add_handler(CommandHandler("model", model_command))
+    application.add_handler(CommandHandler("jobs", jobs_command))
+    application.add_handler(CommandHandler("status", status_command))
+    application.add_handler(CommandHandler("cancel", cancel_command))
+    application.add_handler(CommandHandler("ask", ask_command))
+    application.add_handler(CommandHandler("shelf", shelf_command))
     application.add_handler(MessageHandler(filters.Document.ALL, handle_file))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
@@ -0,0 +1,134 @@
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+import numpy as np
+from bot.database import SQL_BATCH_SIZE, ConnectionPool, content_hash
+
+
+class EmbeddingCache:
+    """Контентно-адресуемое хранилище эмбеддингов в SQLite
+
+    Ключ - sha256 текста и имя модели, поэтому одинаковые фрагменты
+    разных книг кодируются и хранятся один раз. Если задан max_entries,
+    при переполнении удаляются записи, к которым дольше всего не обращались.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "embeddings.db",
+        pool: Optional[ConnectionPool] = None,
+        max_entries: int = 0
+    ):
+        self.db_path = db_path
+        # Общий пул соединений базы, иначе кеш открывает собственный
+        self._owns_pool = pool is None
+        self.pool = pool or ConnectionPool(db_path)
+        self.max_entries = max_entries
+        self.init_db()
+
+    def close(self):
+        """Закрывает соединения, если пул принадлежит кешу"""
+        if self._owns_pool:
+            self.pool.close_all()
+
+    def init_db(self):
+        """Инициализация таблицы кеша"""
+        with self.pool.cursor() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    hash TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    used_at INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (hash, model)
+                ) WITHOUT ROWID
+            """)
+
+            # Время последнего обращения добавлено позже, поэтому колонка создается миграцией
+            cursor.execute("PRAGMA table_info(embedding_cache)")
+            if 'used_at' not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute("ALTER TABLE embedding_cache ADD COLUMN used_at INTEGER NOT NULL DEFAULT 0")
+
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embedding_cache_used_at ON embedding_cache(used_at)"
+            )
+
+    def get_many(self, model_name: str, hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Получение сохраненных эмбеддингов по хешам текстов"""
+        hashes = list(hashes)
+        if not hashes:
+            return {}
+
+        vectors = {}
+        now = int(time.time())
+        with self.pool.cursor() as cursor:
+            for i in range(0, len(hashes), SQL_BATCH_SIZE):
+                batch = hashes[i:i + SQL_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+                cursor.execute(
+                    f"SELECT hash, vector FROM embedding_cache WHERE model = ? AND hash IN ({placeholders})",
+                    [model_name] + batch
+                )
+                found = cursor.fetchall()
+                for h, blob in found:
+                    vectors[h] = np.frombuffer(blob, dtype='float32')
+
+                # Найденные записи отмечаются как использованные, чтобы не вытесняться первыми
+                if self.max_entries and found:
+                    placeholders = ", ".join("?" * len(found))
+                    cursor.execute(
+                        f"UPDATE embedding_cache SET used_at = ? WHERE model = ? AND hash IN ({placeholders})",
+                        [now, model_name] + [h for h, _ in found]
+                    )
+
+        return vectors
+
+    def put_many(self, model_name: str, vectors: Dict[str, np.ndarray]):
+        """Сохранение эмбеддингов по хешам текстов с вытеснением старых записей"""
+        if not vectors:
+            return
+
+        now = int(time.time())
+        with self.pool.cursor() as cursor:
+            cursor.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (hash, model, vector, used_at) VALUES (?, ?, ?, ?)",
+                [
+                    (h, model_name, np.asarray(vector, dtype='float32').tobytes(), now)
+                    for h, vector in vectors.items()
+                ]
+            )
+
+            if self.max_entries:
+                cursor.execute("SELECT COUNT(*) FROM embedding_cache")
+                excess = cursor.fetchone()[0] - self.max_entries
+                if excess > 0:
+                    cursor.execute("""
+                        DELETE FROM embedding_cache WHERE (hash, model) IN (
+                            SELECT hash, model FROM embedding_cache ORDER BY used_at LIMIT ?
+                        )
+                    """, (excess,))
+
+    def encode(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        model_name: str,
+        texts: List[str]
+    ) -> np.ndarray:
+        """Эмбеддинги текстов, модель вызывается только для еще не виденных"""
+        hashes = [content_hash(text) for text in texts]
+        vectors = self.get_many(model_name, set(hashes))
+
+        # Каждый новый уникальный текст кодируется ровно один раз
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in vectors and h not in missing:
+                missing[h] = text
+
+        if missing:
+            new_vectors = np.asarray(encode_fn(list(missing.values())), dtype='float32')
+            encoded = dict(zip(missing.keys(), new_vectors))
+            self.put_many(model_name, encoded)
+            vectors.update(encoded)
+
+        if not texts:
+            return np.empty((0, 0), dtype='float32')
+        return np.stack([vectors[h] for h in hashes])
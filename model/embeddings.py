@@ -1,10 +1,17 @@
 from sentence_transformers import SentenceTransformer
 import numpy as np
-from typing import List, Union
+from typing import List, Optional, Union
+from .embedding_cache import EmbeddingCache
 
 class Embeddings:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        cache: Optional[EmbeddingCache] = None
+    ):
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
+        self.cache = cache
         
     def get_embedding(self, text: Union[str, List[str]]) -> np.ndarray:
         """Получение эмбеддинга для текста"""
@@ -14,6 +21,17 @@ class Embeddings:
     
     def get_embeddings_batch(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
         """Получение эмбеддингов для батча текстов"""
+        if self.cache is not None:
+            # Модель вызывается только для текстов, которых еще нет в кеше
+            return self.cache.encode(
+                lambda missing: self._encode_batches(missing, batch_size),
+                self.model_name,
+                texts
+            )
+        return self._encode_batches(texts, batch_size)
+    
+    def _encode_batches(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Кодирование текстов батчами фиксированного размера"""
         embeddings = []
         for i in range(0, len(texts), batch_size):
             batch = texts[i:i + batch_size]
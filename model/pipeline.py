@@ -1,6 +1,7 @@
 from typing import List, Dict, Any
 from .embeddings import Embeddings
 from .retriever import Retriever
+from .text_splitter import split_text
 from .llm import LLM
 
 class Pipeline:
@@ -35,26 +36,9 @@ class Pipeline:
         # Добавляем документы и их эмбеддинги в retriever
         self.retriever.add_documents(documents, chunk_embeddings)
         
-    def _split_text(self, text: str, chunk_size: int = 1000) -> List[str]:
+    def _split_text(self, text: str, chunk_size: int = 1000, chunk_overlap: int = 0) -> List[str]:
         """Разбиение текста на чанки"""
-        words = text.split()
-        chunks = []
-        current_chunk = []
-        current_size = 0
-        
-        for word in words:
-            current_chunk.append(word)
-            current_size += len(word) + 1  # +1 for space
-            
-            if current_size >= chunk_size:
-                chunks.append(" ".join(current_chunk))
-                current_chunk = []
-                current_size = 0
-                
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
-            
-        return chunks
+        return split_text(text, chunk_size, chunk_overlap)
         
     def _get_docs(self, query: str) -> List[Dict[str, Any]]:
         """Получение релевантных документов"""
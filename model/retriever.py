@@ -1,31 +1,87 @@
 import numpy as np
-from typing import List, Dict, Any
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import List, Dict, Any, Optional
 
 class Retriever:
-    def __init__(self, top_k: int = 3):
+    """Точный поиск по косинусной близости в памяти
+
+    Эмбеддинги хранятся нормированными в float32-матрице, емкость которой
+    удваивается при заполнении, поэтому добавление документов амортизированно
+    линейно, а поиск сводится к одному матричному произведению.
+    """
+
+    def __init__(self, top_k: int = 3, initial_capacity: int = 1024):
         self.top_k = top_k
+        self.initial_capacity = initial_capacity
         self.documents = []
-        self.embeddings = None
-        
+        self._matrix: Optional[np.ndarray] = None  # capacity x dimension
+        self._size = 0
+
+    @property
+    def embeddings(self) -> Optional[np.ndarray]:
+        """Нормированные эмбеддинги добавленных документов"""
+        if self._matrix is None:
+            return None
+        return self._matrix[:self._size]
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        """Нормирует строки матрицы, нулевые векторы оставляет как есть"""
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def _reserve(self, count: int, dimension: int):
+        """Гарантирует место еще под count векторов"""
+        if self._matrix is None:
+            capacity = max(self.initial_capacity, count)
+            self._matrix = np.empty((capacity, dimension), dtype=np.float32)
+            return
+
+        required = self._size + count
+        if required <= len(self._matrix):
+            return
+
+        capacity = max(len(self._matrix) * 2, required)
+        matrix = np.empty((capacity, dimension), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+
     def add_documents(self, documents: List[Dict[str, Any]], embeddings: np.ndarray):
         """Добавление документов и их эмбеддингов"""
+        if not len(documents):
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(documents), -1)
+        if self._matrix is not None and embeddings.shape[1] != self._matrix.shape[1]:
+            raise ValueError("Размерность эмбеддингов не совпадает с уже добавленными")
+
+        self._reserve(len(documents), embeddings.shape[1])
+        self._matrix[self._size:self._size + len(documents)] = self._normalize(embeddings)
+        self._size += len(documents)
         self.documents.extend(documents)
-        if self.embeddings is None:
-            self.embeddings = embeddings
+
+    def retrieve(self, query_embedding: np.ndarray, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Поиск наиболее релевантных документов для одного запроса"""
+        return self.retrieve_batch(np.asarray(query_embedding).reshape(1, -1), top_k)[0]
+
+    def retrieve_batch(self, query_embeddings: np.ndarray, top_k: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """Поиск наиболее релевантных документов для батча запросов"""
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        query_embeddings = query_embeddings.reshape(-1, query_embeddings.shape[-1])
+        if not self._size:
+            return [[] for _ in range(len(query_embeddings))]
+
+        k = min(top_k or self.top_k, self._size)
+
+        # Косинусное сходство: строки матрицы уже нормированы
+        similarities = self._normalize(query_embeddings) @ self.embeddings.T
+
+        # Частичная сортировка: отбираем k лучших, затем упорядочиваем только их
+        if k < self._size:
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
         else:
-            self.embeddings = np.vstack([self.embeddings, embeddings])
-            
-    def retrieve(self, query_embedding: np.ndarray) -> List[Dict[str, Any]]:
-        """Поиск наиболее релевантных документов"""
-        if not self.documents or self.embeddings is None:
-            return []
-            
-        # Вычисляем косинусное сходство
-        similarities = cosine_similarity(query_embedding, self.embeddings)[0]
-        
-        # Получаем индексы top_k наиболее релевантных документов
-        top_indices = np.argsort(similarities)[-self.top_k:][::-1]
-        
-        # Возвращаем документы
-        return [self.documents[i] for i in top_indices] 
\ No newline at end of file
+            top = np.broadcast_to(np.arange(self._size), (len(similarities), self._size))
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top_indices = np.take_along_axis(top, order, axis=1)
+
+        return [[self.documents[i] for i in row] for row in top_indices]
@@ -0,0 +1,47 @@
+from typing import Iterable, Iterator, List
+
+
+def iter_chunks(texts: Iterable[str], chunk_size: int = 1000, chunk_overlap: int = 0) -> Iterator[str]:
+    """Потоковое разбиение последовательности текстов на чанки по словам
+
+    Части текста (например, страницы) склеиваются по границам слов, поэтому
+    чанки могут переходить через границу части. chunk_size и chunk_overlap
+    задаются в символах. Каждый следующий чанк начинается с последних слов
+    предыдущего общей длиной не больше chunk_overlap.
+    """
+    if chunk_overlap >= chunk_size:
+        raise ValueError("chunk_overlap должен быть меньше chunk_size")
+
+    current_chunk = []
+    current_size = 0
+    new_words = 0  # слова, добавленные после последнего чанка
+
+    for text in texts:
+        for word in text.split():
+            current_chunk.append(word)
+            current_size += len(word) + 1  # +1 for space
+            new_words += 1
+
+            if current_size >= chunk_size:
+                yield " ".join(current_chunk)
+
+                # Переносим хвост чанка в начало следующего
+                overlap = []
+                overlap_size = 0
+                for tail_word in reversed(current_chunk):
+                    if overlap_size + len(tail_word) + 1 > chunk_overlap:
+                        break
+                    overlap.append(tail_word)
+                    overlap_size += len(tail_word) + 1
+
+                current_chunk = overlap[::-1]
+                current_size = overlap_size
+                new_words = 0
+
+    if new_words:
+        yield " ".join(current_chunk)
+
+
+def split_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 0) -> List[str]:
+    """Разбиение текста на чанки по словам с перекрытием между соседними чанками"""
+    return list(iter_chunks([text], chunk_size, chunk_overlap))
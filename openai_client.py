@@ -0,0 +1,119 @@
+import asyncio
+import random
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+import openai
+
+
+# Errors worth retrying: the request may succeed if sent again later
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # includes APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class AsyncOpenAIClient:
+    """Async OpenAI chat client with a shared connection pool
+
+    All requests go through one httpx.AsyncClient, so TCP/TLS connections are
+    reused between answers. At most max_concurrency requests are in flight;
+    the rest wait on a semaphore. Failed requests are retried with exponential
+    backoff, but only until the first token arrives: a stream that already
+    produced output is not restarted. base_url allows pointing the client at
+    a local mock server (see benchmarks/bench_openai_stream.py).
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "gpt-3.5-turbo",
+        base_url: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 500,
+        max_concurrency: int = 8,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        max_retries: int = 3,
+        backoff: float = 0.5
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.max_concurrency = max_concurrency
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # Created on first use so that they bind to the running event loop
+        self._client: Optional[openai.AsyncOpenAI] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_client(self) -> openai.AsyncOpenAI:
+        if self._client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ),
+                timeout=self.timeout
+            )
+            self._client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=self.timeout,
+                max_retries=0,  # retries are handled in stream() to keep streams consistent
+                http_client=http_client
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    @staticmethod
+    def build_messages(prompt: str, context: Optional[str] = None) -> List[Dict[str, str]]:
+        messages = []
+        if context:
+            messages.append({"role": "system", "content": context})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    async def stream(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        """Yield answer text deltas as they arrive"""
+        client = self._get_client()
+        messages = self.build_messages(prompt, context)
+
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                started = False
+                try:
+                    response = await client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=self.temperature,
+                        max_tokens=self.max_tokens,
+                        stream=True
+                    )
+                    async for chunk in response:
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            started = True
+                            yield delta
+                    return
+                except RETRYABLE_ERRORS:
+                    if started or attempt == self.max_retries:
+                        raise
+                    # Exponential backoff with jitter so that retries do not arrive in bursts
+                    delay = self.backoff * (2 ** attempt)
+                    await asyncio.sleep(delay + random.uniform(0, delay))
+
+    async def complete(self, prompt: str, context: Optional[str] = None) -> str:
+        """Full answer text, collected from the stream"""
+        return "".join([delta async for delta in self.stream(prompt, context)])
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None